@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Local teamily_id index for NextMarket agents
+Maps teamily_id to agent ID, with a Bloom filter in front for fast negative checks
+"""
+
+import os
+import sys
+import json
+import math
+import uuid
+import hashlib
+import argparse
+from typing import Optional, Dict
+
+# Import API configuration
+from config import API_URL, API_VERSION, IDEMPOTENCY_KEYS, PENDING_LOOKUP_SECONDS, get_cache_dir
+import http_client
+from deadline import Deadline
+from payload_schema import fetch_spec
+
+
+INDEX_FILE = "agent_index.json"
+BLOOM_FILE = "agent_index.bloom"
+
+# Bloom filter sizing
+DEFAULT_CAPACITY = 10000
+FALSE_POSITIVE_RATE = 0.01
+
+
+def normalize_teamily_id(teamily_id: str) -> str:
+    """Normalize a teamily_id (email) for index lookups"""
+    return teamily_id.strip().lower()
+
+
+def idempotency_key(teamily_id: str) -> str:
+    """Stable idempotency key for registering a teamily_id"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"nextmarket:agent:{normalize_teamily_id(teamily_id)}"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over blake2b"""
+
+    HEADER = b"NMBF"
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = FALSE_POSITIVE_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def to_bytes(self) -> bytes:
+        header = (self.HEADER + self.size.to_bytes(8, "little") + self.hashes.to_bytes(2, "little")
+                  + self.capacity.to_bytes(8, "little"))
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        if data[:4] != cls.HEADER:
+            raise ValueError("Not a Bloom filter file")
+        bloom = cls.__new__(cls)
+        bloom.size = int.from_bytes(data[4:12], "little")
+        bloom.hashes = int.from_bytes(data[12:14], "little")
+        bloom.capacity = int.from_bytes(data[14:22], "little")
+        bloom.bits = bytearray(data[22:])
+        return bloom
+
+
+class AgentIndex:
+    """
+    Local teamily_id -> agent ID index
+
+    The Bloom filter and the mapping are stored in separate files, so a
+    negative check only reads the (small) filter. The mapping is loaded
+    lazily the first time a probable hit needs resolving.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or get_cache_dir()
+        self.index_path = os.path.join(self.directory, INDEX_FILE)
+        self.bloom_path = os.path.join(self.directory, BLOOM_FILE)
+        self._bloom = None
+        self._data = None
+
+    # -- storage -------------------------------------------------------
+
+    @property
+    def bloom(self) -> BloomFilter:
+        if self._bloom is None:
+            try:
+                with open(self.bloom_path, "rb") as f:
+                    self._bloom = BloomFilter.from_bytes(f.read())
+            except (OSError, ValueError):
+                self._bloom = self._rebuild_bloom()
+        return self._bloom
+
+    @property
+    def data(self) -> Dict:
+        if self._data is None:
+            try:
+                with open(self.index_path) as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {"version": 1, "agents": {}, "server": {}}
+        return self._data
+
+    @property
+    def agents(self) -> Dict[str, Optional[int]]:
+        return self.data["agents"]
+
+    def _rebuild_bloom(self) -> BloomFilter:
+        agents = self.data["agents"]
+        bloom = BloomFilter(capacity=max(DEFAULT_CAPACITY, 2 * len(agents)))
+        for key in agents:
+            bloom.add(key)
+        return bloom
+
+    def save(self):
+        """Atomically write the mapping and the Bloom filter to disk"""
+        os.makedirs(self.directory, exist_ok=True)
+        if self._data is not None:
+            _atomic_write(self.index_path, json.dumps(self._data).encode("utf-8"))
+        if self._bloom is not None:
+            _atomic_write(self.bloom_path, self._bloom.to_bytes())
+
+    # -- lookups -------------------------------------------------------
+
+    def might_contain(self, teamily_id: str) -> bool:
+        """Fast negative check: False means the teamily_id is definitely not indexed"""
+        return normalize_teamily_id(teamily_id) in self.bloom
+
+    def get(self, teamily_id: str) -> Optional[int]:
+        """Get the indexed agent ID (None if unknown or pending)"""
+        key = normalize_teamily_id(teamily_id)
+        if key not in self.bloom:
+            return None
+        return self.agents.get(key)
+
+    def add(self, teamily_id: str, agent_id: Optional[int]):
+        """
+        Index a teamily_id
+
+        Args:
+            teamily_id: Email address
+            agent_id: Agent ID, or None to mark a registration whose outcome is unknown
+        """
+        key = normalize_teamily_id(teamily_id)
+        agents = self.agents
+        if agent_id is None and agents.get(key) is not None:
+            return
+        agents[key] = agent_id
+        bloom = self.bloom
+        if len(agents) > bloom.capacity:
+            self._bloom = self._rebuild_bloom()
+        else:
+            bloom.add(key)
+
+    def discard(self, teamily_id: str):
+        """Forget a teamily_id (its Bloom filter bits stay: a later hit is a false positive)"""
+        self.agents.pop(normalize_teamily_id(teamily_id), None)
+
+    def add_agent(self, agent: Dict):
+        """Index an agent record returned by the API"""
+        if agent.get("teamily_id") and agent.get("id") is not None:
+            self.add(agent["teamily_id"], agent["id"])
+
+    # -- server capabilities --------------------------------------------
+
+    def supports_idempotency_keys(self) -> bool:
+        """Whether POST /agents accepts an Idempotency-Key header"""
+        if IDEMPOTENCY_KEYS == "always":
+            return True
+        if IDEMPOTENCY_KEYS == "never":
+            return False
+
+        server = self.data.setdefault("server", {})
+        cache_key = f"{API_URL}|{API_VERSION}"
+        if server.get("idempotency_checked") != cache_key:
+            server["idempotency_keys"] = _detect_idempotency_support()
+            server["idempotency_checked"] = cache_key
+            self.save()
+        return bool(server.get("idempotency_keys"))
+
+
+def _atomic_write(path: str, content: bytes):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _detect_idempotency_support() -> bool:
+    """Check the OpenAPI spec for an Idempotency-Key header on agent creation"""
+    spec = fetch_spec()
+    if not spec:
+        return False
+
+    operation = spec.get("paths", {}).get(f"/api/{API_VERSION}/agents", {}).get("post", {})
+    for param in operation.get("parameters", []):
+        if param.get("in") == "header" and param.get("name", "").lower() == "idempotency-key":
+            return True
+    return False
+
+
+def lookup_agent(teamily_id: str, agent_id: Optional[int] = None, deadline: Optional[Deadline] = None,
+                 page_size: int = 1000) -> Optional[Dict]:
+    """
+    Resolve an indexed teamily_id against the API
+
+    With the agent ID this is one GET. A pending registration (no ID) can
+    only be found by paging through the agent directory, since the API has
+    no lookup by teamily_id. Callers that can resend with an Idempotency-Key
+    should do that instead; the scan stops when the deadline (by default
+    NEXTMARKET_PENDING_LOOKUP_SECONDS) runs out.
+
+    Args:
+        teamily_id: Email address to look for
+        agent_id: Indexed agent ID, or None for a pending registration
+        deadline: Overall time budget
+        page_size: Agents per list request (1-1000)
+
+    Returns:
+        dict: Existing agent data, or None if no agent has this teamily_id
+
+    Raises:
+        DeadlineExceeded: The scan did not finish in time
+    """
+    from get_agent import list_agents
+
+    key = normalize_teamily_id(teamily_id)
+
+    if agent_id is not None:
+        response = http_client.api_request(
+            "GET",
+            f"/agents/{agent_id}",
+            endpoint="GET /agents/{agent_id}",
+            deadline=deadline,
+            headers={"Content-Type": "application/json"}
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        agent = response.json()
+        return agent if normalize_teamily_id(agent.get("teamily_id", "")) == key else None
+
+    # Outcome of an earlier registration is unknown: scan the directory, within a budget
+    if deadline is None or deadline.remaining() is None:
+        deadline = Deadline(PENDING_LOOKUP_SECONDS)
+    skip = 0
+    while True:
+        page = list_agents(skip=skip, limit=page_size, deadline=deadline)
+        items = page.get("items", [])
+        for agent in items:
+            if normalize_teamily_id(agent.get("teamily_id", "")) == key:
+                return agent
+        skip += len(items)
+        if not items or skip >= page.get("total", 0):
+            return None
+
+
+def sync_index(index: Optional[AgentIndex] = None, page_size: int = 1000) -> AgentIndex:
+    """
+    Fill the index from the agent directory
+
+    Args:
+        index: Index to fill (default: the local cache index)
+        page_size: Agents per list request (1-1000)
+
+    Returns:
+        AgentIndex: The synced index
+    """
+    from get_agent import list_all_agents
+
+    index = index or AgentIndex()
+    for agent in list_all_agents(page_size=page_size)["items"]:
+        index.add_agent(agent)
+    # Pending registrations not in the directory never happened
+    for key in [key for key, agent_id in index.agents.items() if agent_id is None]:
+        index.discard(key)
+
+    index.save()
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Manage the local teamily_id -> agent ID index",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Sync the index from the agent directory
+  %(prog)s --sync
+
+  # Look up an agent ID by email
+  %(prog)s --lookup "john@example.com"
+        """
+    )
+
+    parser.add_argument("--sync", action="store_true",
+                       help="Sync the index from the agent directory")
+    parser.add_argument("--lookup", metavar="EMAIL",
+                       help="Look up the agent ID for an email")
+
+    args = parser.parse_args()
+
+    try:
+        if args.sync:
+            index = sync_index()
+            print(f"✅ Indexed {len(index.agents)} agents in {index.directory}")
+        elif args.lookup:
+            index = AgentIndex()
+            if not index.might_contain(args.lookup) or normalize_teamily_id(args.lookup) not in index.agents:
+                print(f"❌ {args.lookup} is not indexed")
+                sys.exit(1)
+            agent_id = index.get(args.lookup)
+            if agent_id is None:
+                print(f"⚠️  {args.lookup} has a pending registration (agent ID unknown)")
+            else:
+                print(f"✅ {args.lookup} -> agent {agent_id}")
+        else:
+            parser.error("--sync or --lookup is required")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
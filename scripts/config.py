@@ -12,18 +12,81 @@ DEFAULT_API_URL = "https://agentapi.agentapp.space"
 DEFAULT_API_VERSION = "v1"
 
 # Load from environment or use defaults
-API_URL = os.getenv("NEXTMARKET_API_URL", DEFAULT_API_URL)
 API_VERSION = os.getenv("NEXTMARKET_API_VERSION", DEFAULT_API_VERSION)
 
+# API replicas to load-balance across (comma-separated); defaults to NEXTMARKET_API_URL alone
+API_URLS = [
+    url.strip().rstrip("/")
+    for url in (os.getenv("NEXTMARKET_API_URLS") or os.getenv("NEXTMARKET_API_URL") or DEFAULT_API_URL).split(",")
+    if url.strip()
+] or [DEFAULT_API_URL]
+API_URL = os.getenv("NEXTMARKET_API_URL") or API_URLS[0]
+
+# Seconds before an endpoint taken out of rotation is health-checked again
+HEALTH_CHECK_INTERVAL = float(os.getenv("NEXTMARKET_HEALTH_CHECK_INTERVAL", "30"))
+
 # Construct base URL for API endpoints
 BASE_URL = f"{API_URL}/api/{API_VERSION}"
 
+# Local cache directory for indexes and snapshots
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "agent-social")
+CACHE_DIR = os.getenv("NEXTMARKET_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+# Request timeouts (seconds)
+CONNECT_TIMEOUT = float(os.getenv("NEXTMARKET_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("NEXTMARKET_READ_TIMEOUT", "30"))
+
+# Hedged reads: send a second request when the first is slower than this latency percentile
+HEDGE_READS = os.getenv("NEXTMARKET_HEDGE_READS", "false").lower() in ("true", "1", "yes", "on")
+HEDGE_PERCENTILE = float(os.getenv("NEXTMARKET_HEDGE_PERCENTILE", "95"))
+
+# HTTP/2 transport (needs httpx[http2]): many concurrent requests share a few connections;
+# servers that do not offer HTTP/2 get HTTP/1.1, and without httpx the default transport is used
+HTTP2 = os.getenv("NEXTMARKET_HTTP2", "false").lower() in ("true", "1", "yes", "on")
+# Most connections the HTTP/2 transport opens (more streams wait for one; also caps an HTTP/1.1 fallback)
+HTTP2_MAX_CONNECTIONS = int(os.getenv("NEXTMARKET_HTTP2_MAX_CONNECTIONS", "100"))
+
+# Circuit breaker: open after N consecutive failures, probe again after the reset timeout
+BREAKER_FAILURES = int(os.getenv("NEXTMARKET_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("NEXTMARKET_BREAKER_RESET_SECONDS", "30"))
+
+# Idempotency keys on registration: auto (detect from OpenAPI spec), always, never
+IDEMPOTENCY_KEYS = os.getenv("NEXTMARKET_IDEMPOTENCY_KEYS", "auto").lower()
+# Seconds a directory scan for a pending registration may take without an explicit deadline
+PENDING_LOOKUP_SECONDS = float(os.getenv("NEXTMARKET_PENDING_LOOKUP_SECONDS", "30"))
+
+# Write-behind profile updates: journal them locally and apply them in the background
+UPDATE_QUEUE = os.getenv("NEXTMARKET_UPDATE_QUEUE", "false").lower() in ("true", "1", "yes", "on")
+# Seconds to wait for more edits to the same agent before sending one merged update
+COALESCE_SECONDS = float(os.getenv("NEXTMARKET_COALESCE_SECONDS", "5"))
+
+# Check request bodies against the server's OpenAPI schemas before sending them
+VALIDATE_PAYLOADS = os.getenv("NEXTMARKET_VALIDATE_PAYLOADS", "true").lower() in ("true", "1", "yes", "on")
+# Seconds before the cached OpenAPI spec is revalidated with the server
+SPEC_MAX_AGE = float(os.getenv("NEXTMARKET_SPEC_MAX_AGE", "3600"))
+
+# Serve default-criteria searches from the precomputed match table while its snapshot is this recent (seconds)
+MATCH_TABLE_MAX_AGE = float(os.getenv("NEXTMARKET_MATCH_TABLE_MAX_AGE", "86400"))
+
+# Full profiles of the top N search matches fetched into the local cache (0 = off)
+PREFETCH = int(os.getenv("NEXTMARKET_PREFETCH", "0"))
+# Serve get_agent() from the local profile cache (default: on when prefetching)
+PROFILE_CACHE = os.getenv("NEXTMARKET_PROFILE_CACHE", "true" if PREFETCH > 0 else "false").lower() in (
+    "true", "1", "yes", "on")
+# Seconds a cached profile is served without asking the API
+PROFILE_CACHE_TTL = float(os.getenv("NEXTMARKET_PROFILE_CACHE_TTL", "300"))
+
 
 def get_api_url() -> str:
     """Get the configured API URL"""
     return API_URL
 
 
+def get_api_urls() -> list:
+    """Get the configured API endpoints"""
+    return API_URLS
+
+
 def get_base_url() -> str:
     """Get the full base URL for API endpoints"""
     return BASE_URL
@@ -32,3 +95,9 @@ def get_base_url() -> str:
 def get_api_version() -> str:
     """Get the API version"""
     return API_VERSION
+
+
+def get_cache_dir() -> str:
+    """Get the local cache directory, creating it if needed"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return CACHE_DIR
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Deadline budgets for NextMarket API calls
+One overall deadline, split into connect/read timeouts for each request
+"""
+
+import time
+import requests
+from typing import Optional, Tuple
+
+# Import API configuration
+from config import CONNECT_TIMEOUT, READ_TIMEOUT
+
+
+# Share of the remaining budget a single connect may use
+CONNECT_SHARE = 0.3
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """The overall deadline ran out before the operation finished"""
+
+
+class Deadline:
+    """
+    Wall-clock budget for an operation
+
+    Every request made under the deadline gets connect/read timeouts cut
+    from what is left, so retries, failovers and hedges all spend from the
+    same budget.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (None if unbounded)"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self):
+        """Raise DeadlineExceeded if the budget is spent"""
+        if self.expired():
+            raise self.exceeded()
+
+    def exceeded(self) -> DeadlineExceeded:
+        return DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded")
+
+    def cut(self, timeouts: Tuple[float, float]) -> bool:
+        """Whether these timeouts were shortened to fit the budget"""
+        return self.expires_at is not None and tuple(timeouts) != (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    def timeouts(self) -> Tuple[float, float]:
+        """
+        Connect and read timeouts for the next request
+
+        Returns:
+            tuple: (connect_timeout, read_timeout), capped by the configured timeouts
+
+        Raises:
+            DeadlineExceeded: The budget is spent
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return CONNECT_TIMEOUT, READ_TIMEOUT
+        self.check()
+        connect = min(CONNECT_TIMEOUT, remaining * CONNECT_SHARE)
+        return connect, min(READ_TIMEOUT, remaining - connect)
+
+    def wait_timeout(self, timeout: Optional[float] = None) -> Optional[float]:
+        """Cap a wait by the remaining budget"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return remaining if timeout is None else min(timeout, remaining)
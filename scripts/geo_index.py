@@ -0,0 +1,656 @@
+#!/usr/bin/env python3
+"""
+Location gazetteer and spatial index of the NextMarket agent directory
+Normalizes free-text locations to places and answers radius queries offline
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import time
+import bisect
+import struct
+import argparse
+import functools
+from array import array
+from typing import Optional, List, Dict, Tuple, FrozenSet
+
+# Import API configuration
+from config import get_cache_dir
+from snapshot import load_snapshot
+
+
+INDEX_FILE = "geo_index.bin"
+
+# Extra places: {"alias": [lat, lon]} or {"alias": "Known Place"}
+CUSTOM_GAZETTEER_FILE = "gazetteer.json"
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.2
+
+# Grid cell size of the spatial index, in degrees
+CELL_DEGREES = 1.0
+
+# Longest run of words tried as a place name within a location string
+MAX_NAME_WORDS = 4
+
+# File layout (little-endian):
+#   header             ... created_at, section offsets
+#   agent IDs          n_agents x u32, ascending (located agents only)
+#   agent places       n_agents x u32, parallel to the agent IDs
+#   place counts       n_places x u32 agents
+#   place coordinates  n_places x (f64 latitude, f64 longitude)
+#   grid cells         n_cells x (i32 cell latitude, i32 cell longitude), sorted
+#   cell offsets       (n_cells + 1) x u32 into the cell places
+#   cell places        u32
+#   name offsets       (n_places + 1) x u32 into the place names
+#   place names        UTF-8
+MAGIC = b"NMGI"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxIIIId9Q")
+
+# (name, latitude, longitude, region, aliases); region is an ISO 3166 country or subdivision code
+PLACES = [
+    # North America
+    ("San Francisco", 37.7749, -122.4194, "US-CA", ("sf", "san fran", "bay area", "sf bay area", "san francisco bay area")),
+    ("San Jose", 37.3382, -121.8863, "US-CA", ("silicon valley",)),
+    ("Palo Alto", 37.4419, -122.1430, "US-CA", ()),
+    ("Mountain View", 37.3861, -122.0839, "US-CA", ()),
+    ("Oakland", 37.8044, -122.2712, "US-CA", ()),
+    ("Berkeley", 37.8716, -122.2727, "US-CA", ()),
+    ("Los Angeles", 34.0522, -118.2437, "US-CA", ("la", "l a")),
+    ("San Diego", 32.7157, -117.1611, "US-CA", ()),
+    ("Seattle", 47.6062, -122.3321, "US-WA", ()),
+    ("Portland", 45.5152, -122.6784, "US-OR", ()),
+    ("Vancouver", 49.2827, -123.1207, "CA-BC", ()),
+    ("New York", 40.7128, -74.0060, "US-NY", ("nyc", "new york city", "ny", "manhattan", "brooklyn")),
+    ("Boston", 42.3601, -71.0589, "US-MA", ()),
+    ("Cambridge, MA", 42.3736, -71.1097, "US-MA", ("cambridge",)),
+    ("Washington", 38.9072, -77.0369, "US-DC", ("washington dc", "dc", "d c")),
+    ("Philadelphia", 39.9526, -75.1652, "US-PA", ("philly",)),
+    ("Pittsburgh", 40.4406, -79.9959, "US-PA", ()),
+    ("Chicago", 41.8781, -87.6298, "US-IL", ()),
+    ("Detroit", 42.3314, -83.0458, "US-MI", ()),
+    ("Minneapolis", 44.9778, -93.2650, "US-MN", ()),
+    ("Denver", 39.7392, -104.9903, "US-CO", ()),
+    ("Boulder", 40.0150, -105.2705, "US-CO", ()),
+    ("Salt Lake City", 40.7608, -111.8910, "US-UT", ("slc",)),
+    ("Phoenix", 33.4484, -112.0740, "US-AZ", ()),
+    ("Las Vegas", 36.1699, -115.1398, "US-NV", ()),
+    ("Austin", 30.2672, -97.7431, "US-TX", ()),
+    ("Dallas", 32.7767, -96.7970, "US-TX", ()),
+    ("Houston", 29.7604, -95.3698, "US-TX", ()),
+    ("Atlanta", 33.7490, -84.3880, "US-GA", ()),
+    ("Miami", 25.7617, -80.1918, "US-FL", ()),
+    ("Raleigh", 35.7796, -78.6382, "US-NC", ("research triangle",)),
+    ("Nashville", 36.1627, -86.7816, "US-TN", ()),
+    ("Toronto", 43.6532, -79.3832, "CA-ON", ()),
+    ("Montreal", 45.5017, -73.5673, "CA-QC", ("montréal",)),
+    ("Ottawa", 45.4215, -75.6972, "CA-ON", ()),
+    ("Waterloo", 43.4643, -80.5204, "CA-ON", ()),
+    ("Calgary", 51.0447, -114.0719, "CA-AB", ()),
+    ("Mexico City", 19.4326, -99.1332, "MX", ("cdmx", "ciudad de mexico", "ciudad de méxico")),
+    ("Guadalajara", 20.6597, -103.3496, "MX", ()),
+    # South America
+    ("São Paulo", -23.5505, -46.6333, "BR", ("sao paulo",)),
+    ("Rio de Janeiro", -22.9068, -43.1729, "BR", ("rio",)),
+    ("Buenos Aires", -34.6037, -58.3816, "AR", ()),
+    ("Santiago", -33.4489, -70.6693, "CL", ()),
+    ("Bogotá", 4.7110, -74.0721, "CO", ("bogota",)),
+    ("Lima", -12.0464, -77.0428, "PE", ()),
+    # Europe
+    ("London", 51.5074, -0.1278, "GB", ()),
+    ("Cambridge", 52.2053, 0.1218, "GB", ("cambridge uk",)),
+    ("Oxford", 51.7520, -1.2577, "GB", ()),
+    ("Manchester", 53.4808, -2.2426, "GB", ()),
+    ("Edinburgh", 55.9533, -3.1883, "GB", ()),
+    ("Dublin", 53.3498, -6.2603, "IE", ()),
+    ("Paris", 48.8566, 2.3522, "FR", ()),
+    ("Lyon", 45.7640, 4.8357, "FR", ()),
+    ("Amsterdam", 52.3676, 4.9041, "NL", ()),
+    ("Rotterdam", 51.9244, 4.4777, "NL", ()),
+    ("Brussels", 50.8503, 4.3517, "BE", ("bruxelles",)),
+    ("Berlin", 52.5200, 13.4050, "DE", ()),
+    ("Munich", 48.1351, 11.5820, "DE", ("münchen", "muenchen")),
+    ("Hamburg", 53.5511, 9.9937, "DE", ()),
+    ("Frankfurt", 50.1109, 8.6821, "DE", ()),
+    ("Zurich", 47.3769, 8.5417, "CH", ("zürich",)),
+    ("Geneva", 46.2044, 6.1432, "CH", ("genève", "geneve")),
+    ("Vienna", 48.2082, 16.3738, "AT", ("wien",)),
+    ("Prague", 50.0755, 14.4378, "CZ", ("praha",)),
+    ("Warsaw", 52.2297, 21.0122, "PL", ("warszawa",)),
+    ("Kraków", 50.0647, 19.9450, "PL", ("krakow", "cracow")),
+    ("Budapest", 47.4979, 19.0402, "HU", ()),
+    ("Copenhagen", 55.6761, 12.5683, "DK", ("københavn", "kobenhavn")),
+    ("Stockholm", 59.3293, 18.0686, "SE", ()),
+    ("Oslo", 59.9139, 10.7522, "NO", ()),
+    ("Helsinki", 60.1699, 24.9384, "FI", ()),
+    ("Tallinn", 59.4370, 24.7536, "EE", ()),
+    ("Madrid", 40.4168, -3.7038, "ES", ()),
+    ("Barcelona", 41.3851, 2.1734, "ES", ()),
+    ("Lisbon", 38.7223, -9.1393, "PT", ("lisboa",)),
+    ("Porto", 41.1579, -8.6291, "PT", ()),
+    ("Milan", 45.4642, 9.1900, "IT", ("milano",)),
+    ("Rome", 41.9028, 12.4964, "IT", ("roma",)),
+    ("Athens", 37.9838, 23.7275, "GR", ()),
+    ("Istanbul", 41.0082, 28.9784, "TR", ()),
+    ("Kyiv", 50.4501, 30.5234, "UA", ("kiev",)),
+    ("Moscow", 55.7558, 37.6173, "RU", ()),
+    # Middle East and Africa
+    ("Tel Aviv", 32.0853, 34.7818, "IL", ("tel aviv yafo",)),
+    ("Dubai", 25.2048, 55.2708, "AE", ()),
+    ("Abu Dhabi", 24.4539, 54.3773, "AE", ()),
+    ("Riyadh", 24.7136, 46.6753, "SA", ()),
+    ("Cairo", 30.0444, 31.2357, "EG", ()),
+    ("Lagos", 6.5244, 3.3792, "NG", ()),
+    ("Nairobi", -1.2921, 36.8219, "KE", ()),
+    ("Cape Town", -33.9249, 18.4241, "ZA", ()),
+    ("Johannesburg", -26.2041, 28.0473, "ZA", ("joburg",)),
+    # Asia and Oceania
+    ("Tokyo", 35.6762, 139.6503, "JP", ()),
+    ("Osaka", 34.6937, 135.5023, "JP", ()),
+    ("Kyoto", 35.0116, 135.7681, "JP", ()),
+    ("Seoul", 37.5665, 126.9780, "KR", ()),
+    ("Beijing", 39.9042, 116.4074, "CN", ("peking",)),
+    ("Shanghai", 31.2304, 121.4737, "CN", ()),
+    ("Shenzhen", 22.5431, 114.0579, "CN", ()),
+    ("Hangzhou", 30.2741, 120.1551, "CN", ()),
+    ("Guangzhou", 23.1291, 113.2644, "CN", ()),
+    ("Chengdu", 30.5728, 104.0668, "CN", ()),
+    ("Hong Kong", 22.3193, 114.1694, "HK", ("hk",)),
+    ("Taipei", 25.0330, 121.5654, "TW", ()),
+    ("Singapore", 1.3521, 103.8198, "SG", ("sg",)),
+    ("Kuala Lumpur", 3.1390, 101.6869, "MY", ("kl",)),
+    ("Bangkok", 13.7563, 100.5018, "TH", ()),
+    ("Jakarta", -6.2088, 106.8456, "ID", ()),
+    ("Manila", 14.5995, 120.9842, "PH", ()),
+    ("Ho Chi Minh City", 10.8231, 106.6297, "VN", ("saigon", "hcmc")),
+    ("Hanoi", 21.0278, 105.8342, "VN", ()),
+    ("Bangalore", 12.9716, 77.5946, "IN", ("bengaluru",)),
+    ("Mumbai", 19.0760, 72.8777, "IN", ("bombay",)),
+    ("Delhi", 28.7041, 77.1025, "IN", ("new delhi",)),
+    ("Hyderabad", 17.3850, 78.4867, "IN", ()),
+    ("Chennai", 13.0827, 80.2707, "IN", ("madras",)),
+    ("Pune", 18.5204, 73.8567, "IN", ()),
+    ("Sydney", -33.8688, 151.2093, "AU", ()),
+    ("Melbourne", -37.8136, 144.9631, "AU", ()),
+    ("Brisbane", -27.4698, 153.0251, "AU", ()),
+    ("Auckland", -36.8485, 174.7633, "NZ", ()),
+]
+
+# Names of the regions of places, besides their codes ("US", "US-CA" -> "CA")
+REGION_NAMES = {
+    "US": ("usa", "united states", "united states of america", "america"),
+    "CA": ("canada",), "MX": ("mexico", "méxico"), "BR": ("brazil", "brasil"), "AR": ("argentina",),
+    "CL": ("chile",), "CO": ("colombia",), "PE": ("peru", "perú"),
+    "GB": ("uk", "united kingdom", "great britain", "britain", "england", "scotland"),
+    "IE": ("ireland",), "FR": ("france",), "NL": ("netherlands", "the netherlands", "holland"),
+    "BE": ("belgium",), "DE": ("germany", "deutschland"), "CH": ("switzerland",), "AT": ("austria",),
+    "CZ": ("czechia", "czech republic"), "PL": ("poland",), "HU": ("hungary",), "DK": ("denmark",),
+    "SE": ("sweden",), "NO": ("norway",), "FI": ("finland",), "EE": ("estonia",),
+    "ES": ("spain", "españa"), "PT": ("portugal",), "IT": ("italy", "italia"), "GR": ("greece",),
+    "TR": ("turkey", "türkiye"), "UA": ("ukraine",), "RU": ("russia",), "IL": ("israel",),
+    "AE": ("uae", "united arab emirates"), "SA": ("saudi arabia", "ksa"), "EG": ("egypt",),
+    "NG": ("nigeria",), "KE": ("kenya",), "ZA": ("south africa",), "JP": ("japan",),
+    "KR": ("korea", "south korea"), "CN": ("china", "prc"), "HK": ("hong kong",), "TW": ("taiwan",),
+    "SG": ("singapore",), "MY": ("malaysia",), "TH": ("thailand",), "ID": ("indonesia",),
+    "PH": ("philippines",), "VN": ("vietnam", "viet nam"), "IN": ("india",), "AU": ("australia",),
+    "NZ": ("new zealand",),
+    # US states, so "Portland, ME" is not taken for Portland, Oregon
+    "US-AL": ("alabama",), "US-AK": ("alaska",), "US-AZ": ("arizona",), "US-AR": ("arkansas",),
+    "US-CA": ("california",), "US-CO": ("colorado",), "US-CT": ("connecticut",), "US-DE": ("delaware",),
+    "US-DC": ("district of columbia", "washington dc"), "US-FL": ("florida",), "US-GA": ("georgia",),
+    "US-HI": ("hawaii",), "US-ID": ("idaho",), "US-IL": ("illinois",), "US-IN": ("indiana",),
+    "US-IA": ("iowa",), "US-KS": ("kansas",), "US-KY": ("kentucky",), "US-LA": ("louisiana",),
+    "US-ME": ("maine",), "US-MD": ("maryland",), "US-MA": ("massachusetts",), "US-MI": ("michigan",),
+    "US-MN": ("minnesota",), "US-MS": ("mississippi",), "US-MO": ("missouri",), "US-MT": ("montana",),
+    "US-NE": ("nebraska",), "US-NV": ("nevada",), "US-NH": ("new hampshire",), "US-NJ": ("new jersey",),
+    "US-NM": ("new mexico",), "US-NY": ("new york", "new york state"), "US-NC": ("north carolina",),
+    "US-ND": ("north dakota",), "US-OH": ("ohio",), "US-OK": ("oklahoma",), "US-OR": ("oregon",),
+    "US-PA": ("pennsylvania",), "US-RI": ("rhode island",), "US-SC": ("south carolina",),
+    "US-SD": ("south dakota",), "US-TN": ("tennessee",), "US-TX": ("texas",), "US-UT": ("utah",),
+    "US-VT": ("vermont",), "US-VA": ("virginia",), "US-WA": ("washington", "washington state"),
+    "US-WV": ("west virginia",), "US-WI": ("wisconsin",), "US-WY": ("wyoming",),
+    # Canadian provinces
+    "CA-AB": ("alberta",), "CA-BC": ("british columbia",), "CA-MB": ("manitoba",),
+    "CA-NB": ("new brunswick",), "CA-NL": ("newfoundland",), "CA-NS": ("nova scotia",),
+    "CA-ON": ("ontario",), "CA-PE": ("prince edward island",), "CA-QC": ("quebec", "québec"),
+    "CA-SK": ("saskatchewan",),
+}
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+_COORDINATES = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+
+def default_index_path() -> str:
+    return os.path.join(get_cache_dir(), INDEX_FILE)
+
+
+def _key(text: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+def _region_keys(code: str) -> FrozenSet[str]:
+    """Normalized codes and names a place's region goes by ("US-CA" -> "ca", "california", "us", ...)"""
+    keys = set()
+    country = code.split("-")[0]
+    for region in {country, code}:
+        keys.add(_key(region.split("-")[-1]))
+        keys.update(_key(name) for name in REGION_NAMES.get(region, ()))
+    return frozenset(keys)
+
+
+@functools.lru_cache(maxsize=1)
+def region_keys() -> FrozenSet[str]:
+    """Every normalized region code and name, to tell qualifiers ("CA", "Texas") from other words"""
+    return frozenset().union(*(_region_keys(code) for code in REGION_NAMES))
+
+
+@functools.lru_cache(maxsize=1)
+def gazetteer() -> Dict[str, List[Tuple[Tuple[str, float, float], FrozenSet[str]]]]:
+    """
+    Normalized name or alias -> [((place name, latitude, longitude), region keys)]
+
+    Places a name can mean are listed most likely first: custom entries, then
+    places of that name, then places with that alias. Custom places given by
+    coordinates have no region keys.
+    """
+    names: Dict[str, List[Tuple[Tuple[str, float, float], FrozenSet[str]]]] = {}
+    for aliases_only in (False, True):
+        for name, lat, lon, region, aliases in PLACES:
+            for alias in (aliases if aliases_only else (name,)):
+                names.setdefault(_key(alias), []).append(((name, lat, lon), _region_keys(region)))
+
+    custom_path = os.path.join(get_cache_dir(), CUSTOM_GAZETTEER_FILE)
+    if os.path.exists(custom_path):
+        with open(custom_path) as f:
+            for alias, value in json.load(f).items():
+                if isinstance(value, str):
+                    known = names.get(_key(value))
+                    if known:
+                        names[_key(alias)] = [known[0]] + names.get(_key(alias), [])
+                else:
+                    place = ((alias, float(value[0]), float(value[1])), frozenset())
+                    names[_key(alias)] = [place] + names.get(_key(alias), [])
+    return names
+
+
+def _pick(candidates: List[Tuple[Tuple[str, float, float], FrozenSet[str]]],
+          qualifiers: List[str]) -> Optional[Tuple[str, float, float]]:
+    """The first candidate place in every region the qualifiers name (other qualifiers are ignored)"""
+    regions = [q for q in qualifiers if q in region_keys()]
+    for place, keys in candidates:
+        if not keys or all(q in keys for q in regions):
+            return place
+    return None
+
+
+@functools.lru_cache(maxsize=65536)
+def locate(location: Optional[str]) -> Optional[Tuple[str, float, float]]:
+    """
+    Resolve a free-text location to a known place
+
+    Tries the whole string, then its first comma-separated part ("San
+    Francisco, CA"), then the longest run of words in that part that names
+    a place ("Greater Boston Area"). Later parts only qualify the first:
+    a state or country there must be the place's own, which tells cities
+    of the same name apart ("Cambridge, UK" vs "Cambridge, MA") and keeps
+    unknown cities from matching ("Portland, ME", "Paris, TX"). "lat,lon"
+    is returned as-is.
+
+    Args:
+        location: Free-text location
+
+    Returns:
+        tuple: (place name, latitude, longitude), or None if unknown
+    """
+    if not location:
+        return None
+    coordinates = _COORDINATES.match(location)
+    if coordinates:
+        lat, lon = float(coordinates.group(1)), float(coordinates.group(2))
+        if -90 <= lat <= 90 and -180 <= lon <= 180:
+            return (f"{lat:g},{lon:g}", lat, lon)
+
+    names = gazetteer()
+    candidates = names.get(_key(location))
+    if candidates:
+        return candidates[0][0]
+
+    parts = [key for key in map(_key, re.split(r"[,;/()|]", location)) if key]
+    if not parts:
+        return None
+    qualifiers = parts[1:]
+    if parts[0] in names:
+        return _pick(names[parts[0]], qualifiers)
+
+    words = parts[0].split()
+    for size in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            name = " ".join(words[start:start + size])
+            # Two-letter aliases ("la", "sf") only count as a whole part
+            if name in names and len(name) > 2:
+                # Words after the name can be a state or country too ("Portland Maine")
+                rest = " ".join(words[start + size:])
+                return _pick(names[name], qualifiers + [rest] if rest else qualifiers)
+    return None
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    return int(math.floor(lat / CELL_DEGREES)), int(math.floor(lon / CELL_DEGREES))
+
+
+def _align(out: bytearray, size: int = 8):
+    out.extend(b"\0" * (-len(out) % size))
+
+
+def _wrap(cell_lon: int) -> int:
+    """Grid column wrapped around the antimeridian"""
+    lon_cells = 360 // int(CELL_DEGREES)
+    return (cell_lon + lon_cells // 2) % lon_cells - lon_cells // 2
+
+
+def build_index(agents: List[Dict], path: Optional[str] = None, created_at: Optional[float] = None) -> str:
+    """
+    Resolve every agent's location and write a location index file
+
+    Args:
+        agents: Agent records (e.g. from a snapshot)
+        path: Index file (default: cache directory)
+        created_at: Snapshot time recorded in the index (default: now)
+
+    Returns:
+        str: Index path
+    """
+    path = path or default_index_path()
+    places: List[Tuple[str, float, float]] = []
+    positions: Dict[Tuple[str, float, float], int] = {}
+    place_of: Dict[int, int] = {}
+    unresolved = 0
+    for agent in agents:
+        if agent.get("id") is None:
+            continue
+        place = locate(agent.get("location"))
+        if place is None:
+            unresolved += 1
+            continue
+        i = positions.get(place)
+        if i is None:
+            i = positions[place] = len(places)
+            places.append(place)
+        place_of[agent["id"]] = i
+
+    ids = array("I", sorted(place_of))
+    agent_places = array("I", (place_of[agent_id] for agent_id in ids))
+    counts = array("I", [0] * len(places))
+    for i in agent_places:
+        counts[i] += 1
+    coordinates = array("d")
+    names = bytearray()
+    name_offsets = array("I", [0])
+    grid: Dict[Tuple[int, int], List[int]] = {}
+    for i, (name, lat, lon) in enumerate(places):
+        coordinates.extend((lat, lon))
+        names.extend(name.encode("utf-8"))
+        name_offsets.append(len(names))
+        cell_lat, cell_lon = _cell(lat, lon)
+        grid.setdefault((cell_lat, _wrap(cell_lon)), []).append(i)
+    cells = array("i")
+    cell_offsets = array("I", [0])
+    cell_places = array("I")
+    for cell in sorted(grid):
+        cells.extend(cell)
+        cell_places.extend(grid[cell])
+        cell_offsets.append(len(cell_places))
+
+    out = bytearray(HEADER.size)
+    offsets = []
+    for section in (ids, agent_places, counts, coordinates, cells, cell_offsets, cell_places,
+                    name_offsets, names):
+        _align(out)
+        offsets.append(len(out))
+        out.extend(section if isinstance(section, bytearray) else section.tobytes())
+    HEADER.pack_into(out, 0, MAGIC, VERSION, len(ids), len(places), len(grid), unresolved,
+                     created_at or time.time(), *offsets)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(out)
+    os.replace(tmp_path, path)
+    return path
+
+
+class GeoIndex:
+    """
+    Agents grouped by resolved place, with places bucketed in a lat/lon grid
+    (read-only view of an index file)
+
+    Agents share a handful of places, so a radius query checks the places in
+    the grid cells the circle overlaps and counts their agents whole,
+    without looking at individual agents. Opening maps the file without
+    reading it; an agent's place is looked up in place.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_index_path()
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER.size or struct.unpack_from("<4sH", self._mmap, 0) != (MAGIC, VERSION):
+            self._mmap.close()
+            raise ValueError(f"Not a compatible location index: {self.path}")
+        (_, _, self.n_agents, self.n_places, self.n_cells, self.unresolved, self.created_at,
+         ids_off, places_off, counts_off, coordinates_off, cells_off, cell_ptr_off, cell_places_off,
+         names_ptr_off, names_off) = HEADER.unpack_from(self._mmap, 0)
+
+        view = memoryview(self._mmap)
+        n, p, c = self.n_agents, self.n_places, self.n_cells
+        self._ids = view[ids_off:ids_off + 4 * n].cast("I")
+        self._agent_places = view[places_off:places_off + 4 * n].cast("I")
+        self.counts = view[counts_off:counts_off + 4 * p].cast("I")     # place -> number of agents
+        self._coordinates = view[coordinates_off:coordinates_off + 16 * p].cast("d")
+        self._cells = view[cells_off:cells_off + 8 * c].cast("i")
+        self._cell_ptr = view[cell_ptr_off:cell_ptr_off + 4 * (c + 1)].cast("I")
+        self._cell_places = view[cell_places_off:cell_places_off + 4 * self._cell_ptr[c]].cast("I")
+        self._name_offsets = view[names_ptr_off:names_ptr_off + 4 * (p + 1)].cast("I")
+        self._names_off = names_off
+
+    def close(self):
+        for view in (self._ids, self._agent_places, self.counts, self._coordinates, self._cells,
+                     self._cell_ptr, self._cell_places, self._name_offsets):
+            view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def place(self, i: int) -> Tuple[str, float, float]:
+        """(place name, latitude, longitude) of a place"""
+        name = self._mmap[self._names_off + self._name_offsets[i]:self._names_off + self._name_offsets[i + 1]]
+        return name.decode("utf-8"), self._coordinates[2 * i], self._coordinates[2 * i + 1]
+
+    def place_of(self, agent_id: int) -> Optional[int]:
+        """Place of an agent (None if its location is unknown)"""
+        pos = bisect.bisect_left(self._ids, agent_id)
+        if pos < self.n_agents and self._ids[pos] == agent_id:
+            return self._agent_places[pos]
+        return None
+
+    def _cell_places_of(self, cell_lat: int, cell_lon: int) -> memoryview:
+        """Places in one grid cell (binary search over the sorted cells)"""
+        lo, hi = 0, self.n_cells
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (self._cells[2 * mid], self._cells[2 * mid + 1]) < (cell_lat, cell_lon):
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_cells and (self._cells[2 * lo], self._cells[2 * lo + 1]) == (cell_lat, cell_lon):
+            return self._cell_places[self._cell_ptr[lo]:self._cell_ptr[lo + 1]]
+        return self._cell_places[0:0]
+
+    def places_within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, int]]:
+        """
+        Places within a radius
+
+        Returns:
+            list: [(distance in km, place)], nearest first
+        """
+        lat_span = radius_km / KM_PER_DEGREE
+        lon_span = radius_km / (KM_PER_DEGREE * max(0.01, math.cos(math.radians(min(89.0, abs(lat) + lat_span)))))
+        if lat_span >= 90 or lon_span >= 180:
+            candidates = range(self.n_places)
+        else:
+            lat_lo, lon_lo = _cell(lat - lat_span, lon - lon_span)
+            lat_hi, lon_hi = _cell(lat + lat_span, lon + lon_span)
+            candidates = []
+            for cell_lat in range(lat_lo, lat_hi + 1):
+                for cell_lon in range(lon_lo, lon_hi + 1):
+                    candidates.extend(self._cell_places_of(cell_lat, _wrap(cell_lon)))
+
+        found = []
+        for i in candidates:
+            distance = distance_km(lat, lon, self._coordinates[2 * i], self._coordinates[2 * i + 1])
+            if distance <= radius_km:
+                found.append((distance, i))
+        found.sort()
+        return found
+
+    def near(self, lat: float, lon: float, radius_km: float) -> "Nearby":
+        """Agents within a radius (found in time proportional to places, not agents)"""
+        return Nearby(self, self.places_within(lat, lon, radius_km))
+
+
+class Nearby:
+    """
+    Agents within a radius: membership and distance by agent ID, without listing them
+
+    Reads the index it came from, so use it while that is open.
+    """
+
+    def __init__(self, index: GeoIndex, places: List[Tuple[float, int]]):
+        self._index = index
+        self._distances = {i: round(distance, 1) for distance, i in places}
+
+    def __contains__(self, agent_id: int) -> bool:
+        return self._index.place_of(agent_id) in self._distances
+
+    def __getitem__(self, agent_id: int) -> float:
+        """Distance in km"""
+        return self._distances[self._index.place_of(agent_id)]
+
+    def __len__(self) -> int:
+        return sum(self._index.counts[i] for i in self._distances)
+
+
+def resolve_place(place: str) -> Tuple[str, float, float]:
+    """Like locate(), but an unknown place is an error"""
+    found = locate(place)
+    if found is None:
+        raise ValueError(f"Unknown place: {place!r} (use a city name or \"lat,lon\", "
+                         f"or add it to {os.path.join(get_cache_dir(), CUSTOM_GAZETTEER_FILE)})")
+    return found
+
+
+def filter_near(results: Dict, place: str, radius_km: float, limit: int) -> Dict:
+    """
+    Keep search results located within a radius of a place
+
+    Args:
+        results: Search results (over-fetched)
+        place: Place name or "lat,lon"
+        radius_km: Radius in km
+        limit: Maximum number of results
+
+    Returns:
+        dict: Results within the radius, each with "distance_km"
+    """
+    _, lat, lon = resolve_place(place)
+    matches = []
+    for match in results.get("matches", []):
+        found = locate(match.get("location"))
+        if found is None:
+            continue
+        distance = distance_km(lat, lon, found[1], found[2])
+        if distance <= radius_km:
+            matches.append(dict(match, distance_km=round(distance, 1)))
+    return dict(results, matches=matches[:limit], total=len(matches))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build and query the location index",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Build from the local snapshot (see snapshot.py --sync)
+  %(prog)s --build
+
+  # How a location string resolves
+  %(prog)s --locate "SF Bay Area, USA"
+
+  # Agents within 50 km of Berlin
+  %(prog)s --near Berlin --radius-km 50
+
+  # Combined with facet search
+  ./scripts/search_agents.py --requester-id 123 --skills Python --near SF --radius-km 80
+        """
+    )
+
+    parser.add_argument("--build", action="store_true", help="Build the index")
+    parser.add_argument("--snapshot", help="Snapshot file (default: cache directory)")
+    parser.add_argument("--index", help="Index file (default: cache directory)")
+    parser.add_argument("--locate", help="Resolve a location string")
+    parser.add_argument("--near", help="Count agents near a place (name or \"lat,lon\")")
+    parser.add_argument("--radius-km", type=float, default=50.0,
+                       help="Radius for --near (default: 50)")
+
+    args = parser.parse_args()
+
+    if not (args.build or args.locate or args.near):
+        parser.error("--build, --locate or --near is required")
+
+    try:
+        if args.build:
+            start = time.perf_counter()
+            snapshot = load_snapshot(args.snapshot)
+            path = build_index(snapshot["agents"], args.index, created_at=snapshot.get("synced_at"))
+            with GeoIndex(path) as index:
+                print(f"✅ Location index: {index.n_agents} agents in {index.n_places} places "
+                      f"({index.unresolved} unresolved) in {time.perf_counter() - start:.2f}s: {path}")
+
+        if args.locate:
+            found = locate(args.locate)
+            print(f"📍 {args.locate!r} → {found[0]} ({found[1]:.4f}, {found[2]:.4f})" if found
+                  else f"❓ {args.locate!r} is not a known place")
+
+        if args.near:
+            name, lat, lon = resolve_place(args.near)
+            with GeoIndex(args.index) as index:
+                start = time.perf_counter()
+                agents = index.near(lat, lon, args.radius_km)
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"📍 {len(agents)} agents within {args.radius_km:g} km of {name} in {elapsed:.2f} ms")
+                for distance, i in index.places_within(lat, lon, args.radius_km):
+                    print(f"   {index.place(i)[0]}: {index.counts[i]} agents ({distance:.0f} km)")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,29 +8,53 @@ import sys
 import json
 import argparse
 import requests
+from typing import Optional, Iterator
 
-# Import API configuration
-from config import BASE_URL
+# Import API client
+import http_client
+from deadline import Deadline, DeadlineExceeded
+from json_stream import stream_array, write_ndjson
+import profile_cache
+from config import PROFILE_CACHE
 
 
-def get_agent(agent_id: int) -> dict:
+def get_agent(agent_id: int, hedge: Optional[bool] = None, deadline: Optional[Deadline] = None,
+              use_cache: Optional[bool] = None) -> dict:
     """
     Get agent details
 
     Args:
         agent_id: Agent ID
+        hedge: Hedge slow requests (default: NEXTMARKET_HEDGE_READS)
+        deadline: Overall time budget
+        use_cache: Serve a recently fetched or prefetched profile from the
+            local cache (default: NEXTMARKET_PROFILE_CACHE; see
+            NEXTMARKET_PROFILE_CACHE_TTL)
 
     Returns:
         dict: Agent data
     """
 
+    if use_cache if use_cache is not None else PROFILE_CACHE:
+        cached = profile_cache.get(agent_id)
+        if cached is not None:
+            return cached
+
     try:
-        response = requests.get(
-            f"{BASE_URL}/agents/{agent_id}",
+        response = http_client.api_request(
+            "GET",
+            f"/agents/{agent_id}",
+            endpoint="GET /agents/{agent_id}",
+            hedge=hedge,
+            deadline=deadline,
             headers={"Content-Type": "application/json"}
         )
         response.raise_for_status()
-        return response.json()
+        agent = response.json()
+        # Kept current whenever the cache is in use, even by a --no-cache fetch
+        if use_cache or PROFILE_CACHE:
+            profile_cache.put(agent)
+        return agent
 
     except requests.exceptions.RequestException as e:
         print(f"❌ API Error: {e}", file=sys.stderr)
@@ -43,7 +67,9 @@ def get_agent(agent_id: int) -> dict:
         raise
 
 
-def list_agents(skip: int = 0, limit: int = 100, is_active: bool = None, is_public: bool = None) -> dict:
+def list_agents(skip: int = 0, limit: int = 100, is_active: bool = None, is_public: bool = None,
+                hedge: Optional[bool] = None, deadline: Optional[Deadline] = None,
+                stream: bool = False):
     """
     List agents with pagination
 
@@ -52,9 +78,13 @@ def list_agents(skip: int = 0, limit: int = 100, is_active: bool = None, is_publ
         limit: Maximum number of records to return
         is_active: Filter by active status
         is_public: Filter by public visibility
+        hedge: Hedge slow requests (default: NEXTMARKET_HEDGE_READS)
+        deadline: Overall time budget
+        stream: Decode agents one at a time as they arrive
 
     Returns:
-        dict: Paginated agent list
+        dict: Paginated agent list, or with stream, an ArrayStream of the
+            agents (the other fields are in its `fields` once iterated)
     """
 
     params = {
@@ -68,12 +98,19 @@ def list_agents(skip: int = 0, limit: int = 100, is_active: bool = None, is_publ
         params['is_public'] = is_public
 
     try:
-        response = requests.get(
-            f"{BASE_URL}/agents",
+        response = http_client.api_request(
+            "GET",
+            "/agents",
+            endpoint="GET /agents",
+            hedge=hedge,
+            deadline=deadline,
             params=params,
-            headers={"Content-Type": "application/json"}
+            headers={"Content-Type": "application/json"},
+            stream=stream
         )
         response.raise_for_status()
+        if stream:
+            return stream_array(response, "items")
         return response.json()
 
     except requests.exceptions.RequestException as e:
@@ -87,6 +124,78 @@ def list_agents(skip: int = 0, limit: int = 100, is_active: bool = None, is_publ
         raise
 
 
+def list_all_agents(
+    page_size: int = 1000,
+    is_active: bool = None,
+    is_public: bool = None,
+    deadline: Optional[Deadline] = None
+) -> dict:
+    """
+    Dump the whole agent directory, page by page
+
+    Args:
+        page_size: Agents per request (1-1000)
+        is_active: Filter by active status
+        is_public: Filter by public visibility
+        deadline: Overall time budget for the whole dump
+
+    Returns:
+        dict: {"items", "total", "partial"}; partial is True when the
+            deadline ran out before every page was fetched
+    """
+
+    deadline = deadline or Deadline()
+    items = []
+    total = 0
+
+    while True:
+        try:
+            page = list_agents(skip=len(items), limit=page_size, is_active=is_active,
+                               is_public=is_public, deadline=deadline)
+        except DeadlineExceeded:
+            return {"items": items, "total": total, "partial": True}
+
+        page_items = page.get("items", [])
+        items.extend(page_items)
+        total = page.get("total", 0)
+        if not page_items or len(items) >= total:
+            return {"items": items, "total": total, "partial": False}
+
+
+def iter_all_agents(
+    page_size: int = 1000,
+    is_active: bool = None,
+    is_public: bool = None,
+    deadline: Optional[Deadline] = None
+) -> Iterator[dict]:
+    """
+    Stream the whole agent directory, yielding each agent as it arrives
+
+    Args:
+        page_size: Agents per request (1-1000)
+        is_active: Filter by active status
+        is_public: Filter by public visibility
+        deadline: Overall time budget for the whole dump
+
+    Raises:
+        DeadlineExceeded: The deadline ran out before every page was fetched
+    """
+
+    deadline = deadline or Deadline()
+    skip = 0
+
+    while True:
+        page = list_agents(skip=skip, limit=page_size, is_active=is_active,
+                           is_public=is_public, deadline=deadline, stream=True)
+        count = 0
+        for agent in page:
+            count += 1
+            yield agent
+        skip += count
+        if not count or skip >= page.fields.get("total", 0):
+            return
+
+
 def display_agent(agent: dict):
     """Display agent details in a user-friendly format"""
 
@@ -170,8 +279,17 @@ Examples:
   # List active agents (paginated)
   %(prog)s --list --is-active true --skip 0 --limit 50
 
+  # Dump the whole directory, giving up after 60 seconds
+  %(prog)s --list --all --deadline 60 --json
+
+  # Stream the directory as NDJSON, one agent per line as it arrives
+  %(prog)s --list --all --ndjson | jq -c 'select(.is_public)'
+
   # JSON output for scripting
   %(prog)s --agent-id 123 --json
+
+  # Serve a profile prefetched by search_agents.py --prefetch, if still fresh
+  %(prog)s --agent-id 123 --cache
         """
     )
 
@@ -183,25 +301,65 @@ Examples:
                        help="Number of records to skip (for pagination)")
     parser.add_argument("--limit", type=int, default=100,
                        help="Maximum number of records (1-1000)")
+    parser.add_argument("--all", action="store_true",
+                       help="With --list: fetch every page (--limit is the page size)")
     parser.add_argument("--is-active", type=lambda x: x.lower() == 'true',
                        help="Filter by active status (true/false)")
     parser.add_argument("--is-public", type=lambda x: x.lower() == 'true',
                        help="Filter by public visibility (true/false)")
     parser.add_argument("--json", action="store_true",
                        help="Output raw JSON instead of formatted display")
+    parser.add_argument("--ndjson", action="store_true",
+                       help="With --list: stream compact JSON, one agent per line, as agents arrive")
+    parser.add_argument("--hedge", action="store_true", default=None,
+                       help="Send a second request if the first is slow (first response wins)")
+    parser.add_argument("--deadline", type=float,
+                       help="Overall time budget in seconds (partial results are marked)")
+    parser.add_argument("--cache", action="store_true", default=None,
+                       help="Serve the profile from the local profile cache if fresh "
+                            "(default: NEXTMARKET_PROFILE_CACHE)")
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                       help="Fetch the profile from the API even if it is in the local cache")
 
     args = parser.parse_args()
+    deadline = Deadline(args.deadline)
 
     try:
-        if args.list:
+        if args.list and args.ndjson:
+            if args.all:
+                agents = iter_all_agents(page_size=args.limit, is_active=args.is_active,
+                                         is_public=args.is_public, deadline=deadline)
+            else:
+                agents = list_agents(skip=args.skip, limit=args.limit, is_active=args.is_active,
+                                     is_public=args.is_public, hedge=args.hedge,
+                                     deadline=deadline, stream=True)
+            try:
+                write_ndjson(agents)
+            except DeadlineExceeded:
+                print("⚠️  Partial results: deadline exceeded before all pages were fetched",
+                      file=sys.stderr)
+            return
+
+        if args.list and args.all:
+            # Dump all agents
+            result = list_all_agents(
+                page_size=args.limit,
+                is_active=args.is_active,
+                is_public=args.is_public,
+                deadline=deadline
+            )
+        elif args.list:
             # List agents
             result = list_agents(
                 skip=args.skip,
                 limit=args.limit,
                 is_active=args.is_active,
-                is_public=args.is_public
+                is_public=args.is_public,
+                hedge=args.hedge,
+                deadline=deadline
             )
 
+        if args.list:
             if args.json:
                 print(json.dumps(result, indent=2))
             else:
@@ -212,6 +370,8 @@ Examples:
                 print("=" * 70)
                 print(f"📋 Agent List: {len(agents)} of {total} total")
                 print("=" * 70)
+                if result.get('partial'):
+                    print("⚠️  Partial results: deadline exceeded before all pages were fetched")
 
                 for agent in agents:
                     status = '🟢' if agent.get('is_active') else '🔴'
@@ -229,7 +389,8 @@ Examples:
             if not args.agent_id:
                 parser.error("--agent-id is required (or use --list)")
 
-            result = get_agent(args.agent_id)
+            result = get_agent(args.agent_id, hedge=args.hedge, deadline=deadline,
+                               use_cache=args.cache)
 
             if args.json:
                 print(json.dumps(result, indent=2))
@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+"""
+HTTP client layer for NextMarket API calls
+Timeouts, hedged idempotent reads, per-endpoint circuit breakers,
+load balancing across API replicas and an optional HTTP/2 transport
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import asyncio
+import threading
+import urllib3
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from collections import deque
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Dict
+
+# Import API configuration
+from config import (
+    API_VERSION, HEDGE_READS, HEDGE_PERCENTILE, HTTP2, HTTP2_MAX_CONNECTIONS,
+    BREAKER_FAILURES, BREAKER_RESET_SECONDS, CACHE_DIR
+)
+from load_balancer import EndpointPool, create_pool
+from deadline import Deadline, DeadlineExceeded
+
+
+STATE_FILE = "http_state.json"
+
+# Hedge delay bounds (seconds) and samples needed before it adapts
+MIN_HEDGE_DELAY = 0.05
+DEFAULT_HEDGE_DELAY = 1.0
+MIN_SAMPLES = 20
+MAX_SAMPLES = 200
+
+# Connection-level headers, which HTTP/2 does not allow
+HOP_BY_HOP_HEADERS = ("connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade")
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request while an endpoint's circuit is open"""
+
+
+class LatencyTracker:
+    """Sliding window of response latencies for one endpoint"""
+
+    def __init__(self, samples=None):
+        self.samples = deque(samples or [], maxlen=MAX_SAMPLES)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def hedge_delay(self) -> float:
+        """Delay before sending a hedge: the configured latency percentile"""
+        delay = self.percentile(HEDGE_PERCENTILE)
+        return DEFAULT_HEDGE_DELAY if delay is None else max(MIN_HEDGE_DELAY, delay)
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after consecutive failures; open -> half-open after the
+    reset timeout, letting a single probe through; the probe closes or
+    re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, state: str = CLOSED, failures: int = 0, opened_at: float = 0.0):
+        self.state = state
+        self.failures = failures
+        self.opened_at = opened_at
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= BREAKER_RESET_SECONDS:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= BREAKER_FAILURES:
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+
+_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+_pool: Optional[EndpointPool] = None
+_loaded = False
+_local = threading.local()
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+def _state_path() -> str:
+    return os.path.join(CACHE_DIR, STATE_FILE)
+
+
+def _load_state():
+    """Load breaker and latency state shared by earlier invocations"""
+    global _loaded, _pool
+    if _loaded:
+        return
+    _loaded = True
+    try:
+        with open(_state_path()) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    _pool = create_pool(state.get("endpoints"))
+    for endpoint, b in state.get("breakers", {}).items():
+        _breakers[endpoint] = CircuitBreaker(b["state"], b["failures"], b["opened_at"])
+    for endpoint, samples in state.get("latencies", {}).items():
+        _latencies[endpoint] = LatencyTracker(samples)
+
+
+@atexit.register
+def _save_state():
+    if not _loaded:
+        return
+    state = {
+        "breakers": {
+            endpoint: {"state": b.state, "failures": b.failures, "opened_at": b.opened_at}
+            for endpoint, b in _breakers.items()
+        },
+        "latencies": {endpoint: list(t.samples) for endpoint, t in _latencies.items()},
+        "endpoints": _pool.to_state(),
+    }
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{_state_path()}.tmp.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, _state_path())
+    except OSError:
+        pass
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    with _lock:
+        _load_state()
+        return _breakers.setdefault(endpoint, CircuitBreaker())
+
+
+def get_latency(endpoint: str) -> LatencyTracker:
+    with _lock:
+        _load_state()
+        return _latencies.setdefault(endpoint, LatencyTracker())
+
+
+def get_pool() -> EndpointPool:
+    with _lock:
+        _load_state()
+        return _pool
+
+
+_http2_loop: Optional[asyncio.AbstractEventLoop] = None
+_http2_clients: Dict[tuple, "httpx.AsyncClient"] = {}
+_http1_origins = set()  # Servers that did not negotiate HTTP/2
+_http2_origins = set()
+_origin_locks: Dict[tuple, threading.Lock] = {}
+_http2_warned = False
+
+
+def _http2_run(coroutine):
+    """
+    Run a coroutine on the HTTP/2 event loop thread and wait for its result
+
+    Every HTTP/2 connection is driven from that one thread: httpx's
+    synchronous HTTP/2 connections are not safe to share between threads.
+    """
+    global _http2_loop
+    with _lock:
+        if _http2_loop is None:
+            _http2_loop = asyncio.new_event_loop()
+            threading.Thread(target=_http2_loop.run_forever, name="http2", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coroutine, _http2_loop).result()
+
+
+def _http2_client(verify, cert):
+    """The process-wide HTTP/2 client for a TLS configuration"""
+    import httpx
+    key = (verify, cert if cert is None or isinstance(cert, str) else tuple(cert))
+    with _lock:
+        client = _http2_clients.get(key)
+        if client is None:
+            client = _http2_clients[key] = httpx.AsyncClient(
+                http2=True, verify=verify, cert=cert,
+                limits=httpx.Limits(max_connections=HTTP2_MAX_CONNECTIONS))
+        return client
+
+
+@atexit.register
+def _close_http2_clients():
+    for client in _http2_clients.values():
+        _http2_run(client.aclose())
+
+
+def _translate_error(e: Exception, request: requests.PreparedRequest) -> requests.exceptions.RequestException:
+    """The requests exception a caller expects for an httpx one"""
+    import httpx
+    if isinstance(e, httpx.ConnectTimeout):
+        return requests.exceptions.ConnectTimeout(e, request=request)
+    if isinstance(e, httpx.TimeoutException):
+        return requests.exceptions.ReadTimeout(e, request=request)
+    if isinstance(e, httpx.TransportError):
+        return requests.exceptions.ConnectionError(e, request=request)
+    return requests.exceptions.RequestException(e, request=request)
+
+
+async def _next_chunk(chunks) -> Optional[bytes]:
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _send_http2(client, request, stream: bool):
+    response = await client.send(request, stream=True)
+    if not stream:
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+    return response
+
+
+class _HTTP2Body:
+    """File-like response body for requests, read off an httpx stream (already decoded)"""
+
+    def __init__(self, response, request: requests.PreparedRequest):
+        self._response = response
+        self._request = request
+        self._chunks = None if response.is_closed else response.aiter_bytes()
+        self._buffer = b"" if self._chunks else response.content
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        import httpx
+        try:
+            while self._chunks and (amt is None or len(self._buffer) < amt):
+                chunk = _http2_run(_next_chunk(self._chunks))
+                if chunk is None:
+                    break
+                self._buffer += chunk
+        except httpx.HTTPError as e:
+            raise _translate_error(e, self._request) from e
+        data, self._buffer = (self._buffer, b"") if amt is None else (self._buffer[:amt], self._buffer[amt:])
+        return data
+
+    def close(self):
+        if not self._response.is_closed:
+            _http2_run(self._response.aclose())
+
+
+class HTTP2Adapter(HTTPAdapter):
+    """
+    requests transport over HTTP/2 (httpx), multiplexing concurrent
+    requests from every thread on a few shared connections
+
+    The first request to a server goes alone, so that concurrent ones
+    share its connection. Fallback: once a server does not negotiate h2
+    (TLS ALPN), its requests go through the default HTTP/1.1 transport
+    (with a connection per request in flight, as without HTTP/2). Responses and
+    errors are translated to their requests equivalents, so callers,
+    streaming included, see no difference; response.http_version tells
+    which protocol was used.
+    """
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        origin = urlsplit(request.url)[:2]
+        if origin not in _http2_origins and origin not in _http1_origins:
+            with _lock:
+                origin_lock = _origin_locks.setdefault(origin, threading.Lock())
+            with origin_lock:
+                if origin not in _http2_origins and origin not in _http1_origins:
+                    return self._send(origin, request, stream, timeout, verify, cert)
+        if origin in _http1_origins:
+            return super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert,
+                                proxies=proxies)
+        return self._send(origin, request, stream, timeout, verify, cert)
+
+    def _send(self, origin: tuple, request, stream, timeout, verify, cert) -> requests.Response:
+        import httpx
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        client = _http2_client(verify, cert)
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+        try:
+            sent = _http2_run(_send_http2(client, client.build_request(
+                request.method, request.url, headers=headers, content=request.body, timeout=timeout), stream))
+        except httpx.HTTPError as e:
+            raise _translate_error(e, request) from e
+        (_http2_origins if sent.http_version == "HTTP/2" else _http1_origins).add(origin)
+
+        response = requests.Response()
+        response.status_code = sent.status_code
+        response.headers = CaseInsensitiveDict(sent.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.reason = sent.reason_phrase
+        response.raw = _HTTP2Body(sent, request)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.http_version = sent.http_version
+        if not stream:
+            response.content  # Read it all now, as requests does
+        return response
+
+
+def _use_http2() -> bool:
+    global _http2_warned
+    if not HTTP2:
+        return False
+    try:
+        import httpx  # noqa: F401
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        if not _http2_warned:
+            _http2_warned = True
+            print("⚠️  NEXTMARKET_HTTP2 needs httpx[http2] (pip install 'httpx[http2]'): using HTTP/1.1",
+                  file=sys.stderr)
+        return False
+
+
+def _session() -> requests.Session:
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+        if _use_http2():
+            # HTTP/2 is negotiated during the TLS handshake: plain http:// stays on HTTP/1.1
+            session.mount("https://", HTTP2Adapter())
+    return session
+
+
+def _send(method: str, url: str, endpoint: str, **kwargs) -> requests.Response:
+    """Send one attempt, feeding the endpoint's breaker and latency tracker"""
+    breaker = get_breaker(endpoint)
+    start = time.monotonic()
+    try:
+        response = _session().request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        _record_endpoint(url, None, ok=False)
+        raise
+    elapsed = time.monotonic() - start
+    if response.status_code >= 500:
+        breaker.record_failure()
+        _record_endpoint(url, elapsed, ok=False)
+    else:
+        breaker.record_success()
+        get_latency(endpoint).record(elapsed)
+        _record_endpoint(url, elapsed, ok=True)
+    return response
+
+
+def _record_endpoint(url: str, latency: Optional[float], ok: bool):
+    pool = get_pool()
+    for base in pool.endpoints:
+        if url.startswith(base + "/"):
+            pool.record(base, latency, ok)
+            return
+
+
+def request(
+    method: str,
+    url: str,
+    endpoint: Optional[str] = None,
+    hedge: Optional[bool] = None,
+    hedge_url: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    **kwargs
+) -> requests.Response:
+    """
+    Send a request to one URL
+
+    Args:
+        method: HTTP method
+        url: Full request URL
+        endpoint: Route for breaker/latency tracking, e.g. "GET /agents/{agent_id}"
+            (default: method and URL); tracked separately per API host
+        hedge: Hedge the request, i.e. maybe send it twice (default: NEXTMARKET_HEDGE_READS
+            for GET, never for other methods)
+        hedge_url: Send the hedge to this URL instead (e.g. another replica)
+        deadline: Overall budget; the request's timeouts are cut from what is left
+        **kwargs: Passed to requests (timeout defaults to the configured connect/read timeouts)
+
+    Returns:
+        requests.Response: The first response to arrive
+
+    Raises:
+        CircuitOpenError: The endpoint's circuit is open
+        DeadlineExceeded: The deadline ran out
+    """
+    route = endpoint or f"{method} {url}"
+    endpoint = f"{urlsplit(url).netloc} {route}"
+    deadline = deadline or Deadline()
+    timeout = kwargs.pop("timeout", None)
+    kwargs["timeout"] = timeout or deadline.timeouts()
+    hedge = HEDGE_READS and method.upper() == "GET" if hedge is None else hedge
+
+    breaker = get_breaker(endpoint)
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit open for {endpoint}: failing fast")
+
+    # A half-open probe is never hedged
+    if not hedge or breaker.state != CircuitBreaker.CLOSED:
+        return _send(method, url, endpoint, **kwargs)
+
+    first = _executor.submit(_send, method, url, endpoint, **kwargs)
+    done, _ = wait([first], timeout=deadline.wait_timeout(get_latency(endpoint).hedge_delay()))
+    if done:
+        return first.result()
+    deadline.check()
+
+    # First attempt is slow: send a hedge, first successful response wins
+    if hedge_url:
+        hedge_endpoint = f"{urlsplit(hedge_url).netloc} {route}"
+        if get_breaker(hedge_endpoint).state == CircuitBreaker.CLOSED:
+            url, endpoint = hedge_url, hedge_endpoint
+    kwargs["timeout"] = timeout or deadline.timeouts()
+    pending = {first, _executor.submit(_send, method, url, endpoint, **kwargs)}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=deadline.wait_timeout(), return_when=FIRST_COMPLETED)
+        if not done:
+            for loser in pending:
+                loser.add_done_callback(_close_response)
+            deadline.check()
+        for future in done:
+            try:
+                response = future.result()
+            except requests.exceptions.RequestException as e:
+                error = e
+                continue
+            for loser in pending:
+                loser.add_done_callback(_close_response)
+            return response
+    raise error
+
+
+def _close_response(future):
+    if not future.exception():
+        future.result().close()
+
+
+def _nothing_sent(e: requests.exceptions.RequestException) -> bool:
+    """Whether a failed request never reached the server, so resending it cannot apply it twice"""
+    if isinstance(e, (CircuitOpenError, requests.exceptions.ConnectTimeout)):
+        return True
+    reason = e.args[0] if e.args else None
+    reason = getattr(reason, "reason", reason)  # urllib3 wraps the cause in MaxRetryError
+    if isinstance(reason, urllib3.exceptions.NewConnectionError):
+        return True
+    httpx = sys.modules.get("httpx")
+    return httpx is not None and isinstance(reason, httpx.ConnectError)
+
+
+def api_request(
+    method: str,
+    path: str,
+    endpoint: Optional[str] = None,
+    hedge: Optional[bool] = None,
+    idempotent: Optional[bool] = None,
+    deadline: Optional[Deadline] = None,
+    versioned: bool = True,
+    **kwargs
+) -> requests.Response:
+    """
+    Send an API request to the best available replica
+
+    Args:
+        method: HTTP method
+        path: Path below /api/{version}, e.g. "/agents/123"
+        endpoint: Route for breaker/latency tracking, e.g. "GET /agents/{agent_id}"
+        hedge: Hedge the request on another replica (default: NEXTMARKET_HEDGE_READS);
+            only idempotent requests are ever hedged
+        idempotent: Safe to resend after a timeout or 5xx (default: GET only); otherwise
+            only failures to connect are tried on another replica
+        deadline: Overall budget shared by failovers and hedges
+        versioned: Path is below /api/{version} (False for e.g. "/openapi.json")
+        **kwargs: Passed to requests
+
+    Returns:
+        requests.Response: The response
+
+    Raises:
+        DeadlineExceeded: The deadline ran out
+        requests.exceptions.RequestException: Every replica failed
+    """
+    idempotent = method.upper() == "GET" if idempotent is None else idempotent
+    prefix = f"/api/{API_VERSION}" if versioned else ""
+    deadline = deadline or Deadline()
+    # A hedge sends the request twice: never for requests that must not be applied twice
+    hedging = (HEDGE_READS if hedge is None else hedge) and idempotent
+    pool = get_pool()
+    tried = []
+    error = None
+    response = None
+
+    while True:
+        base = pool.choose(exclude=tried)
+        if base is None:
+            if response is not None:
+                return response
+            raise error
+        tried.append(base)
+        hedge_base = pool.choose(exclude=tried) if hedging else None
+
+        timeout = kwargs.get("timeout") or deadline.timeouts()
+        try:
+            response = request(
+                method,
+                f"{base}{prefix}{path}",
+                endpoint=endpoint or f"{method} {path}",
+                hedge=hedging,
+                hedge_url=f"{hedge_base}{prefix}{path}" if hedge_base else None,
+                deadline=deadline,
+                **dict(kwargs, timeout=timeout)
+            )
+        except DeadlineExceeded:
+            raise
+        except requests.exceptions.Timeout as e:
+            # Timed out on a budget-shortened timeout: the deadline, not the replica, ran out
+            if deadline.cut(timeout):
+                raise deadline.exceeded() from e
+            if not idempotent and not _nothing_sent(e):
+                raise
+            error = e
+            continue
+        except requests.exceptions.ConnectionError as e:
+            # The body may have reached this replica: only resend what it never saw
+            if not idempotent and not _nothing_sent(e):
+                raise
+            error = e
+            continue
+        except requests.exceptions.RequestException as e:
+            if not idempotent:
+                raise
+            error = e
+            continue
+
+        if response.status_code < 500 or not idempotent:
+            return response
+        # Read the error body so a streamed response's connection goes back to the pool
+        try:
+            response.content
+        except requests.exceptions.RequestException:
+            pass
+        response.close()
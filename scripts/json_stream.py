@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Incremental JSON decoding of NextMarket list and search responses
+Yields the records of a response array as they arrive off the socket
+"""
+
+import re
+import sys
+import json
+import codecs
+from typing import Optional, Callable, Iterable, Iterator, Any
+
+import requests
+
+
+# Bytes read from the socket at a time
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+class ArrayStream:
+    """
+    Records of one top-level array of a JSON object, decoded one at a time
+
+    Only the record being decoded and the unread part of the current chunk
+    are held in memory, so peak memory does not depend on page size. The
+    object's other fields (e.g. "total") are collected in `fields`; those
+    that come after the array are there once iteration ends.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], key: str, on_close: Optional[Callable] = None):
+        self.key = key
+        self.fields = {}
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._on_close = on_close
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _more(self) -> bool:
+        """Append the next chunk, dropping what has been decoded (False at end of input)"""
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                self._buffer = self._buffer[self._pos:] + text
+                self._pos = 0
+                return True
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(b"", final=True)
+        self._pos = 0
+        self._eof = True
+        return False
+
+    def _peek(self) -> str:
+        """Next non-whitespace character ("" at end of input)"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof or not self._more():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(f"Malformed JSON response: expected one of {chars!r}, got {char or 'end of input'!r}")
+        self._pos += 1
+        return char
+
+    def _value(self) -> Any:
+        """Decode the next complete JSON value, reading more input as needed"""
+        self._peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._more()
+
+    def __iter__(self) -> Iterator[Any]:
+        try:
+            self._expect("{")
+            if self._peek() == "}":
+                return
+            while True:
+                key = self._value()
+                self._expect(":")
+                if key == self.key:
+                    self._expect("[")
+                    if self._peek() == "]":
+                        self._pos += 1
+                    else:
+                        while True:
+                            yield self._value()
+                            if self._expect(",]") == "]":
+                                break
+                else:
+                    self.fields[key] = self._value()
+                if self._expect(",}") == "}":
+                    return
+        finally:
+            if self._on_close:
+                self._on_close()
+
+
+def stream_array(response: requests.Response, key: str) -> ArrayStream:
+    """
+    Stream the records of a response's top-level array
+
+    Args:
+        response: Response of a request made with stream=True
+        key: Array field ("items", "matches")
+
+    Returns:
+        ArrayStream: Iterate for the records; the response is closed when done
+    """
+    return ArrayStream(response.iter_content(CHUNK_SIZE), key, on_close=response.close)
+
+
+def write_ndjson(records: Iterable[Any], out=None) -> int:
+    """
+    Write records as compact NDJSON, flushing each line as it is written
+
+    Returns:
+        int: Number of records written
+    """
+    out = out or sys.stdout
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, separators=(",", ":")) + "\n")
+        out.flush()
+        count += 1
+    return count
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Client-side load balancing across NextMarket API replicas
+Power-of-two-choices over latency EWMA and error rate, with /health checks
+"""
+
+import time
+import random
+import threading
+import requests
+from typing import Optional, Dict, List, Set, Iterable
+
+# Import API configuration
+from config import API_URLS, HEALTH_CHECK_INTERVAL
+
+
+# EWMA smoothing factor
+EWMA_ALPHA = 0.3
+
+# Take an endpoint out of rotation (pending /health) above this error rate
+MAX_ERROR_RATE = 0.5
+HEALTH_TIMEOUT = 3
+
+
+class EndpointStats:
+    """Latency EWMA, error rate and health of one API endpoint"""
+
+    def __init__(self, url: str, latency: Optional[float] = None, error_rate: float = 0.0,
+                 healthy: bool = True, checked_at: float = 0.0):
+        self.url = url
+        self.latency = latency
+        self.error_rate = error_rate
+        self.healthy = healthy
+        self.checked_at = checked_at
+
+    def cost(self) -> float:
+        """Lower is better: latency inflated by the error rate (fresh endpoints go first)"""
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + 10 * self.error_rate)
+
+    def to_dict(self) -> Dict:
+        return {"latency": self.latency, "error_rate": self.error_rate,
+                "healthy": self.healthy, "checked_at": self.checked_at}
+
+
+def check_health(url: str) -> bool:
+    """Check an endpoint's /health, as test_connection.py does"""
+    try:
+        return requests.get(f"{url}/health", timeout=HEALTH_TIMEOUT).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+
+class EndpointPool:
+    """Routes each request to the best healthy endpoint"""
+
+    def __init__(self, urls: List[str], state: Optional[Dict] = None):
+        state = state or {}
+        self.endpoints = {
+            url: EndpointStats(url, **state[url]) if url in state else EndpointStats(url)
+            for url in urls
+        }
+        self._lock = threading.Lock()
+        self._checking: Set[str] = set()  # Endpoints with a /health check in flight
+
+    def choose(self, exclude: Iterable[str] = ()) -> Optional[str]:
+        """
+        Pick an endpoint: power of two random choices among healthy endpoints
+
+        Args:
+            exclude: Endpoints already tried for this request
+
+        Returns:
+            str: Endpoint URL, or None if every endpoint was excluded
+        """
+        self._recheck_unhealthy()
+        candidates = [e for e in self.endpoints.values() if e.url not in exclude]
+        if not candidates:
+            return None
+
+        healthy = [e for e in candidates if e.healthy]
+        if not healthy:
+            # Nothing is known-good: try whichever went unhealthy longest ago
+            return min(candidates, key=lambda e: e.checked_at).url
+        if len(healthy) == 1:
+            return healthy[0].url
+        a, b = random.sample(healthy, 2)
+        return (a if a.cost() <= b.cost() else b).url
+
+    def record(self, url: str, latency: Optional[float], ok: bool):
+        """Feed one request outcome into the endpoint's EWMAs"""
+        endpoint = self.endpoints.get(url)
+        if endpoint is None:
+            return
+        with self._lock:
+            endpoint.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - endpoint.error_rate)
+            if ok and latency is not None:
+                if endpoint.latency is None:
+                    endpoint.latency = latency
+                else:
+                    endpoint.latency += EWMA_ALPHA * (latency - endpoint.latency)
+            # No response at all, or mostly errors: out of rotation until /health says it is up
+            if not ok and endpoint.healthy and (latency is None or endpoint.error_rate > MAX_ERROR_RATE):
+                endpoint.healthy = False
+                endpoint.checked_at = time.time()
+                self._check(endpoint)
+
+    def _check(self, endpoint: EndpointStats):
+        """
+        Ask an endpoint's /health in the background (caller holds the lock)
+
+        A check can take HEALTH_TIMEOUT, longer than a request's deadline
+        may allow, so requests never wait for it: the endpoint keeps its
+        current health until the answer comes in.
+        """
+        if endpoint.url in self._checking:
+            return
+        self._checking.add(endpoint.url)
+        threading.Thread(target=self._run_check, args=(endpoint,), daemon=True,
+                         name=f"health-check {endpoint.url}").start()
+
+    def _run_check(self, endpoint: EndpointStats):
+        healthy = check_health(endpoint.url)
+        with self._lock:
+            self._checking.discard(endpoint.url)
+            endpoint.healthy = healthy
+            endpoint.checked_at = time.time()
+            if healthy:
+                endpoint.error_rate = 0.0
+
+    def _recheck_unhealthy(self):
+        now = time.time()
+        with self._lock:
+            for endpoint in self.endpoints.values():
+                if not endpoint.healthy and now - endpoint.checked_at >= HEALTH_CHECK_INTERVAL:
+                    self._check(endpoint)
+
+    def to_state(self) -> Dict:
+        return {url: e.to_dict() for url, e in self.endpoints.items()}
+
+
+def create_pool(state: Optional[Dict] = None) -> EndpointPool:
+    """Create the pool for the configured endpoints (NEXTMARKET_API_URLS)"""
+    return EndpointPool(API_URLS, state)
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Materialized top-k matches per NextMarket agent
+Precomputes default-criteria searches and refreshes only the rows a profile change can affect
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import contextlib
+import argparse
+from typing import Optional, Iterable, List, Dict, Set, Tuple
+
+# Import API configuration
+from config import get_cache_dir, MATCH_TABLE_MAX_AGE
+from snapshot import load_snapshot
+from posting_index import (PostingIndex, build_index, default_index_path, default_query,
+                           match_record, agent_terms, is_listed, LIST_FIELDS)
+from parallel_scoring import ShardedIndex, Scored
+
+
+TABLE_FILE = "match_table.sqlite"
+
+# Matches kept per agent, and the lowest min_score they cover
+TOP_K = 50
+MIN_SCORE_FLOOR = 0.1
+
+# Rows to recompute before a refresh starts a process pool (start-up costs about as much as ten rows)
+PARALLEL_MIN_ROWS = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS matches (
+    requester_id INTEGER PRIMARY KEY,
+    computed_at REAL,
+    total INTEGER,
+    rows TEXT,
+    cutoff REAL,       -- Score an agent needs to enter the row
+    query_sizes TEXT   -- Criteria terms per facet, for scoring a changed agent against the row
+);
+-- Which rows list an agent as a candidate
+CREATE TABLE IF NOT EXISTS holders (
+    agent_id INTEGER,
+    requester_id INTEGER,
+    PRIMARY KEY (agent_id, requester_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS holders_by_requester ON holders (requester_id);
+-- Inverted index of each row's search criteria
+CREATE TABLE IF NOT EXISTS query_terms (
+    field TEXT,
+    term TEXT,
+    requester_id INTEGER,
+    PRIMARY KEY (field, term, requester_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS query_terms_by_requester ON query_terms (requester_id);
+-- What each row was computed from
+CREATE TABLE IF NOT EXISTS fingerprints (
+    agent_id INTEGER PRIMARY KEY,
+    facets TEXT,
+    query TEXT,
+    requester INTEGER
+);
+"""
+
+
+def default_table_path() -> str:
+    return os.path.join(get_cache_dir(), TABLE_FILE)
+
+
+def _fingerprint(value) -> str:
+    return hashlib.blake2b(json.dumps(value, sort_keys=True).encode("utf-8"), digest_size=8).hexdigest()
+
+
+# Bits of an agent's status fingerprint
+REQUESTER = 1  # Gets a row
+LISTED = 2  # Can be matched in other agents' rows (see posting_index.is_listed)
+
+
+def _is_requester(agent: Dict) -> bool:
+    """Active agents with matching enabled get a row (public or not)"""
+    return agent.get("is_active") is not False and agent.get("matching_enabled") is not False
+
+
+def _query_terms(query: Dict) -> List[Tuple[str, str]]:
+    return [(field, term) for field in LIST_FIELDS for term in agent_terms(query, field)]
+
+
+def agent_fingerprints(agent: Dict) -> Tuple[str, str, int]:
+    """
+    (facets, criteria, status) fingerprints of an agent (status: REQUESTER | LISTED bits)
+
+    A facet or status change can move the agent in other agents' rows; a
+    criteria change only affects its own row.
+    """
+    facets = [agent_terms(agent, field) for field in LIST_FIELDS]
+    query = _query_terms(default_query(agent))
+    status = REQUESTER * _is_requester(agent) | LISTED * is_listed(agent)
+    return _fingerprint(facets), _fingerprint(query), status
+
+
+class MatchTable:
+    """
+    SQLite store of each active agent's top-k default-criteria matches
+
+    Rows hold (agent ID, score, facet scores) only; profiles are filled in
+    from the posting index when a row is served. Alongside the rows, the
+    table keeps who lists whom and an inverted index of every row's
+    criteria, so a refresh finds the rows a changed profile can enter or
+    leave without rescoring the rest.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_table_path()
+        self.db = sqlite3.connect(self.path)
+        # Readers keep serving while a refresh writes
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def meta(self) -> Dict:
+        return dict(self.db.execute("SELECT key, value FROM meta"))
+
+    def lookup(self, requester_id: int, min_score: float = 0.3, limit: int = 10) -> Optional[Dict]:
+        """
+        A requester's precomputed matches
+
+        Args:
+            requester_id: ID of the requesting agent
+            min_score: Minimum match score (no lower than the table's floor)
+            limit: Maximum number of results (no more than the table's k)
+
+        Returns:
+            dict: {"computed_at", "total", "rows"} with rows of
+                (agent ID, score, facet scores), or None if the table cannot
+                answer this search
+        """
+        meta = self.meta()
+        if not meta or min_score < meta["min_score"] or limit > meta["k"]:
+            return None
+        row = self.db.execute("SELECT computed_at, total, rows FROM matches WHERE requester_id = ?",
+                              (requester_id,)).fetchone()
+        if row is None:
+            return None
+        computed_at, total, rows = row
+        rows = json.loads(rows)
+        kept = [r for r in rows if r[1] >= min_score]
+        # Every agent above min_score is in the row unless the row is full
+        if len(kept) < len(rows) or min_score > meta["min_score"]:
+            total = len(kept)
+        return {"computed_at": computed_at, "total": total, "rows": kept[:limit]}
+
+    def _compute(self, index: PostingIndex, requester_id: int, k: int, min_score: float, now: float,
+                 hidden: Set[int], scored: Scored = None):
+        pos = index.position(requester_id)
+        if pos is None:
+            self._drop(requester_id)
+            return
+        query = default_query(index.record(pos))
+        top, total = scored or index.search(query, min_score=min_score, limit=k, exclude=pos, skip=hidden)
+        rows = [[index.agent_id(p), round(score, 4), {name: round(v, 4) for name, v in details.items()}]
+                for score, p, details in top]
+        cutoff = top[-1][0] if len(top) == k else min_score
+        query_sizes = {field: len(agent_terms(query, field)) for field in LIST_FIELDS if query.get(field)}
+
+        self._drop(requester_id)
+        self.db.execute("INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?)",
+                        (requester_id, now, total, json.dumps(rows, separators=(",", ":")),
+                         cutoff, json.dumps(query_sizes)))
+        self.db.executemany("INSERT INTO holders VALUES (?, ?)", [(r[0], requester_id) for r in rows])
+        self.db.executemany("INSERT OR IGNORE INTO query_terms VALUES (?, ?, ?)",
+                            [(field, term, requester_id) for field, term in _query_terms(query)])
+
+    def _drop(self, requester_id: int):
+        for table in ("matches", "holders", "query_terms"):
+            self.db.execute(f"DELETE FROM {table} WHERE requester_id = ?", (requester_id,))
+
+    def _affected(self, changed: Iterable[Dict], removed: Iterable[int]) -> Set[int]:
+        """
+        Rows a facet change can touch
+
+        Rows listing the agent always are. Of the rows whose criteria share
+        a term with its new facets (found through the criteria index), only
+        those where its new score reaches the row's cutoff are.
+        """
+        affected: Set[int] = set()
+        for agent_id in removed:
+            affected.update(r for (r,) in self.db.execute(
+                "SELECT requester_id FROM holders WHERE agent_id = ?", (agent_id,)))
+
+        for agent in changed:
+            affected.update(r for (r,) in self.db.execute(
+                "SELECT requester_id FROM holders WHERE agent_id = ?", (agent["id"],)))
+
+            lengths = {field: len(agent_terms(agent, field)) for field in LIST_FIELDS}
+            overlaps: Dict[int, Dict[str, int]] = {}
+            for field, term in _query_terms({field: agent.get(field) for field in LIST_FIELDS}):
+                for (r,) in self.db.execute(
+                        "SELECT requester_id FROM query_terms WHERE field = ? AND term = ?", (field, term)):
+                    counts = overlaps.setdefault(r, {})
+                    counts[field] = counts.get(field, 0) + 1
+
+            candidates = [r for r in overlaps if r not in affected]
+            for start in range(0, len(candidates), 500):
+                chunk = candidates[start:start + 500]
+                for r, cutoff, query_sizes in self.db.execute(
+                        f"SELECT requester_id, cutoff, query_sizes FROM matches "
+                        f"WHERE requester_id IN ({','.join('?' * len(chunk))})", chunk):
+                    # Same overlap / union per facet, averaged, as PostingIndex.search
+                    query_sizes = json.loads(query_sizes)
+                    score = sum(
+                        overlap / (query_sizes[field] + lengths[field] - overlap)
+                        for field, overlap in overlaps[r].items()
+                    ) / len(query_sizes)
+                    if score >= cutoff:
+                        affected.add(r)
+        return affected
+
+    def refresh(self, agents: List[Dict], index: PostingIndex, snapshot_at: Optional[float] = None,
+                k: int = TOP_K, min_score: float = MIN_SCORE_FLOOR, full: bool = False,
+                workers: int = 1) -> Dict:
+        """
+        Bring the table up to date with a snapshot
+
+        Only rows that can have changed are recomputed: those of agents whose
+        own criteria or status changed, plus those that list, or whose
+        criteria match, an agent whose facets changed. The first run (or a
+        change of k or floor) computes every row.
+
+        Args:
+            agents: Agent records the index was built from
+            index: Posting index of the same snapshot
+            snapshot_at: Snapshot time recorded as the rows' data time
+            k: Matches kept per agent
+            min_score: Lowest min_score the rows cover
+            full: Recompute every row
+            workers: Processes scoring the rows, if there are at least
+                PARALLEL_MIN_ROWS of them
+
+        Returns:
+            dict: {"rows", "recomputed", "removed", "changed"}
+        """
+        now = time.time()
+        current = {a["id"]: (a, agent_fingerprints(a)) for a in agents if a.get("id") is not None}
+        stored = {agent_id: (facets, query, requester) for agent_id, facets, query, requester
+                  in self.db.execute("SELECT agent_id, facets, query, requester FROM fingerprints")}
+        meta = self.meta()
+        full = full or not stored or meta.get("k") != k or meta.get("min_score") != min_score
+
+        with self.db:
+            if full:
+                for table in ("matches", "holders", "query_terms", "fingerprints"):
+                    self.db.execute(f"DELETE FROM {table}")
+                changed = list(current)
+                removed: List[int] = []
+                affected = set(current)
+            else:
+                changed = [agent_id for agent_id, (_, fp) in current.items() if stored.get(agent_id) != fp]
+                removed = [agent_id for agent_id in stored if agent_id not in current]
+                # An agent that can no longer be matched leaves every row, like a removed one;
+                # one that can again may enter rows, like a changed one
+                unmatchable = [agent_id for agent_id in changed if not current[agent_id][1][2] & LISTED]
+                facets_changed = [current[agent_id][0] for agent_id in changed
+                                  if current[agent_id][1][2] & LISTED and (agent_id not in stored
+                                                                  or stored[agent_id][0] != current[agent_id][1][0]
+                                                                  or not stored[agent_id][2] & LISTED)]
+                affected = set(changed) | self._affected(facets_changed, removed + unmatchable)
+
+            for agent_id in removed:
+                self._drop(agent_id)
+                self.db.execute("DELETE FROM fingerprints WHERE agent_id = ?", (agent_id,))
+
+            todo = [agent_id for agent_id in sorted(affected)
+                    if agent_id in current and _is_requester(current[agent_id][0])]
+            for agent_id in affected.difference(todo):
+                self._drop(agent_id)
+            pool = (ShardedIndex(index.path, workers, log_until=index.log_seq)
+                    if workers > 1 and len(todo) >= PARALLEL_MIN_ROWS else contextlib.nullcontext())
+            with pool as sharded:
+                scoring = sharded.index if sharded else index
+                # Inactive and private agents, and those with matching disabled, are never candidates
+                hidden = {pos for pos in (scoring.position(agent_id) for agent_id, (_, fp) in current.items()
+                                          if not fp[2] & LISTED) if pos is not None}
+                scored = (sharded.search_many([(agent_id, None, min_score, k) for agent_id in todo], hidden)
+                          if sharded else [None] * len(todo))
+                for agent_id, result in zip(todo, scored):
+                    self._compute(scoring, agent_id, k, min_score, now, hidden, result)
+            recomputed = len(todo)
+
+            self.db.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+                                [(agent_id, *current[agent_id][1]) for agent_id in changed])
+            self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+                ("k", k), ("min_score", min_score), ("snapshot_at", snapshot_at or now),
+                ("refreshed_at", now), ("index_created_at", index.created_at),
+            ])
+
+        rows = self.db.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+        return {"rows": rows, "recomputed": recomputed, "removed": len(removed), "changed": len(changed)}
+
+
+def refresh_table(snapshot_path: Optional[str] = None, index_path: Optional[str] = None,
+                  path: Optional[str] = None, k: int = TOP_K, min_score: float = MIN_SCORE_FLOOR,
+                  full: bool = False, workers: int = 1) -> Dict:
+    """
+    Refresh the match table from the local snapshot
+
+    The posting index is rebuilt first if it was built from another snapshot.
+    With workers > 1, a refresh with at least PARALLEL_MIN_ROWS rows to
+    recompute scores them on a pool of processes (see parallel_scoring.py).
+
+    Returns:
+        dict: {"rows", "recomputed", "removed", "changed", "index_rebuilt"}
+    """
+    snapshot = load_snapshot(snapshot_path)
+    index_path = index_path or default_index_path()
+    snapshot_at = snapshot.get("synced_at")
+    rebuilt = False
+    try:
+        with PostingIndex(index_path) as index:
+            rebuilt = bool(snapshot_at and index.created_at != snapshot_at)
+    except (OSError, ValueError):
+        rebuilt = True
+    if rebuilt:
+        build_index(snapshot["agents"], index_path, created_at=snapshot_at, log_seq=snapshot["log_seq"])
+
+    with MatchTable(path) as table:
+        with PostingIndex(index_path) as index:
+            stats = table.refresh(snapshot["agents"], index, snapshot_at, k, min_score, full, workers)
+    stats["index_rebuilt"] = rebuilt
+    return stats
+
+
+def lookup_matches(requester_id: int, min_score: float = 0.3, limit: int = 10,
+                   max_age: float = MATCH_TABLE_MAX_AGE, path: Optional[str] = None,
+                   index_path: Optional[str] = None) -> Optional[Dict]:
+    """
+    Serve a default-criteria search from the match table
+
+    Args:
+        requester_id: ID of the requesting agent
+        min_score: Minimum match score (0-1)
+        limit: Maximum number of results
+        max_age: Oldest snapshot to serve from, in seconds
+        path: Table file (default: cache directory)
+        index_path: Posting index for the profiles (default: cache directory)
+
+    Returns:
+        dict: Results shaped like /matching/search plus "precomputed",
+            "computed_at" and "snapshot_at", or None if the table has no
+            fresh answer (then search as usual)
+    """
+    path = path or default_table_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with MatchTable(path) as table:
+            meta = table.meta()
+            if not meta or time.time() - meta["snapshot_at"] > max_age:
+                return None
+            found = table.lookup(requester_id, min_score, limit)
+        if found is None:
+            return None
+        with PostingIndex(index_path) as index:
+            matches = []
+            for agent_id, score, details in found["rows"]:
+                pos = index.position(agent_id)
+                record = index.record(pos) if pos is not None else None
+                # Gone, deactivated or made private since the refresh (a logged update)
+                if record is None or not is_listed(record):
+                    found["total"] -= 1
+                    continue
+                matches.append(match_record(record, score, details))
+    except (OSError, ValueError, sqlite3.Error):
+        return None
+
+    return {"matches": matches, "total": found["total"], "precomputed": True,
+            "computed_at": found["computed_at"], "snapshot_at": meta["snapshot_at"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Precompute every active agent's top matches for instant default searches",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # After snapshot.py --sync: recompute only the rows the changes affect
+  %(prog)s --refresh
+
+  # Recompute everything
+  %(prog)s --refresh --full
+
+  # Default-criteria searches are then served from the table
+  ./scripts/search_agents.py --requester-id 123
+        """
+    )
+
+    parser.add_argument("--refresh", action="store_true", help="Update the table from the snapshot")
+    parser.add_argument("--full", action="store_true", help="Recompute every row")
+    parser.add_argument("--status", action="store_true", help="Show table size and age")
+    parser.add_argument("--snapshot", help="Snapshot file (default: cache directory)")
+    parser.add_argument("--index", help="Posting index file (default: cache directory)")
+    parser.add_argument("--table", help="Table file (default: cache directory)")
+    parser.add_argument("-k", type=int, default=TOP_K, help=f"Matches kept per agent (default: {TOP_K})")
+    parser.add_argument("-m", "--min-score", type=float, default=MIN_SCORE_FLOOR,
+                       help=f"Lowest min_score the table can serve (default: {MIN_SCORE_FLOOR})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                       help=f"Processes scoring rows, if {PARALLEL_MIN_ROWS} or more changed "
+                            "(default: one per core)")
+
+    args = parser.parse_args()
+
+    if not (args.refresh or args.status):
+        parser.error("--refresh or --status is required")
+    if not 1 <= args.k <= 100:
+        parser.error("-k must be between 1 and 100")
+
+    try:
+        if args.refresh:
+            start = time.perf_counter()
+            stats = refresh_table(args.snapshot, args.index, args.table, args.k, args.min_score, args.full,
+                                  args.workers)
+            if stats["index_rebuilt"]:
+                print("ℹ️  Posting index was built from another snapshot: rebuilt")
+            print(f"✅ Match table: {stats['recomputed']} rows recomputed "
+                  f"({stats['changed']} changed, {stats['removed']} removed agents), "
+                  f"{stats['rows']} rows in {time.perf_counter() - start:.2f}s")
+
+        if args.status:
+            with MatchTable(args.table) as table:
+                meta = table.meta()
+                rows = table.db.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+            if not meta:
+                print("📭 Match table is empty (run with --refresh)")
+            else:
+                snapshot = time.strftime("%Y-%m-%d %H:%M", time.localtime(meta["snapshot_at"]))
+                age = (time.time() - meta["refreshed_at"]) / 3600
+                print(f"🗂️  {rows} rows, top {meta['k']} at min_score ≥ {meta['min_score']}, "
+                      f"snapshot of {snapshot}, refreshed {age:.1f}h ago")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Pair everyone in a cohort of NextMarket agents (matchmaking events)
+Weighted matching with per-agent capacities over a sparse compatibility graph
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import functools
+from typing import Optional, List, Dict, Tuple
+
+# Import API configuration
+from snapshot import load_snapshot
+from posting_index import normalize_term, LIST_FIELDS
+
+
+# MinHash signature: BANDS bands of ROWS hashes; agents sharing a band are candidates
+BANDS = 6
+ROWS = 2
+
+# Neighbours per agent within a band bucket (sorted by signature) to score
+WINDOW = 3
+
+# Cohorts up to this size score every pair instead
+EXHAUSTIVE_MAX = 1000
+
+# Compatibility edges kept per agent
+DEFAULT_NEIGHBORS = 10
+
+
+def pair_score(a: Dict[str, frozenset], b: Dict[str, frozenset]) -> Tuple[float, Dict[str, float]]:
+    """
+    Symmetric compatibility: mean Jaccard overlap of the facets either agent has
+
+    Returns:
+        tuple: (score, {facet}_score details)
+    """
+    details = {}
+    for field in LIST_FIELDS:
+        x, y = a[field], b[field]
+        if x or y:
+            common = len(x & y)
+            details[f"{field}_score"] = common / (len(x) + len(y) - common)
+    return (sum(details.values()) / len(details) if details else 0.0), details
+
+
+def _minhash_candidates(profiles: List[Dict[str, frozenset]], seed: int) -> set:
+    """
+    Candidate pairs (as i * n + j, i < j) that likely share terms
+
+    Each agent's terms get a MinHash signature; agents that agree on every
+    hash of a band land in the same bucket, and within a bucket (sorted by
+    signature) each agent is paired only with its next WINDOW neighbours.
+    """
+    rng = random.Random(seed)
+    hashes: Dict[str, Tuple[int, ...]] = {}
+    n_hashes = BANDS * ROWS
+
+    signatures = []
+    for profile in profiles:
+        columns = []
+        for field in LIST_FIELDS:
+            for term in profile[field]:
+                key = f"{field}:{term}"
+                h = hashes.get(key)
+                if h is None:
+                    h = hashes[key] = tuple(rng.getrandbits(32) for _ in range(n_hashes))
+                columns.append(h)
+        signatures.append(tuple(map(min, zip(*columns))) if columns else None)
+
+    candidates = set()
+    n = len(profiles)
+    signed = [i for i, signature in enumerate(signatures) if signature is not None]
+    for band in range(BANDS):
+        lo, hi = band * ROWS, (band + 1) * ROWS
+        buckets: Dict[Tuple[int, ...], List[int]] = {}
+        for i in signed:
+            buckets.setdefault(signatures[i][lo:hi], []).append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            members.sort(key=signatures.__getitem__)
+            # Pair keys i * n + j are cheaper to dedupe than tuples
+            for step in range(1, WINDOW + 1):
+                candidates.update(i * n + j if i < j else j * n + i
+                                  for i, j in zip(members, members[step:]))
+    return candidates
+
+
+def build_graph(
+    profiles: List[Dict[str, frozenset]],
+    min_score: float = 0.2,
+    neighbors: int = DEFAULT_NEIGHBORS,
+    seed: int = 0
+) -> Dict[Tuple[int, int], float]:
+    """
+    Sparse compatibility graph of a cohort
+
+    Small cohorts score every pair. Beyond EXHAUSTIVE_MAX members that is
+    too slow, so only MinHash candidate pairs are scored. Each agent then
+    keeps its best `neighbors` edges.
+
+    Args:
+        profiles: Facet term sets per cohort member (index = member)
+        min_score: Drop edges below this score
+        neighbors: Edges kept per agent
+        seed: Hash seed (results are deterministic for a seed)
+
+    Returns:
+        dict: {(i, j): score} with i < j
+    """
+    n = len(profiles)
+    if n <= EXHAUSTIVE_MAX:
+        candidates = [i * n + j for i in range(n) for j in range(i + 1, n)]
+    else:
+        candidates = _minhash_candidates(profiles, seed)
+
+    # pair_score() inlined: this loop runs once per candidate pair
+    facets = [tuple(profile[field] for field in LIST_FIELDS) for profile in profiles]
+    best: List[List[Tuple[float, int]]] = [[] for _ in profiles]
+    for key in candidates:
+        i, j = divmod(key, n)
+        total = 0.0
+        count = 0
+        for x, y in zip(facets[i], facets[j]):
+            if x or y:
+                common = len(x & y)
+                total += common / (len(x) + len(y) - common)
+                count += 1
+        score = total / count if count else 0.0
+        if score >= min_score:
+            best[i].append((score, j))
+            best[j].append((score, i))
+
+    edges = {}
+    for i, scored in enumerate(best):
+        scored.sort(reverse=True)
+        for score, j in scored[:neighbors]:
+            edges[(i, j) if i < j else (j, i)] = score
+    return edges
+
+
+def match_cohort(
+    edges: Dict[Tuple[int, int], float],
+    capacities: List[int]
+) -> List[Tuple[int, int, float]]:
+    """
+    High-total-score matching where member i gets at most capacities[i] partners
+
+    Greedy by score (at least half the optimum), then augmenting swaps:
+    a member with spare capacity takes a full neighbour v from v's weakest
+    partner w when w can be re-paired with another member with spare
+    capacity, so one more person gets a partner.
+
+    Returns:
+        list: [(i, j, score)] pairs
+    """
+    remaining = list(capacities)
+    partners: List[Dict[int, float]] = [{} for _ in capacities]
+    adjacency: List[List[Tuple[float, int]]] = [[] for _ in capacities]
+    for (i, j), score in edges.items():
+        adjacency[i].append((score, j))
+        adjacency[j].append((score, i))
+
+    def link(i, j, score):
+        partners[i][j] = partners[j][i] = score
+        remaining[i] -= 1
+        remaining[j] -= 1
+
+    def unlink(i, j):
+        del partners[i][j], partners[j][i]
+        remaining[i] += 1
+        remaining[j] += 1
+
+    for (i, j), score in sorted(edges.items(), key=lambda e: e[1], reverse=True):
+        if remaining[i] > 0 and remaining[j] > 0:
+            link(i, j, score)
+
+    for u in range(len(capacities)):
+        if partners[u] or remaining[u] <= 0:
+            continue
+        for score_uv, v in sorted(adjacency[u], reverse=True):
+            if v in partners[u] or not partners[v]:
+                continue
+            w = min(partners[v], key=partners[v].get)
+            # Re-pair w with a member that has spare capacity
+            alternatives = [(s, x) for s, x in adjacency[w]
+                            if x != u and x != v and remaining[x] > 0 and x not in partners[w]]
+            if remaining[v] > 0:
+                link(u, v, score_uv)
+                break
+            if alternatives:
+                score_wx, x = max(alternatives)
+                unlink(v, w)
+                link(u, v, score_uv)
+                link(w, x, score_wx)
+                break
+
+    return [(i, j, score) for i, linked in enumerate(partners) for j, score in linked.items() if i < j]
+
+
+def load_cohort(path: str) -> Dict[int, int]:
+    """
+    Read a cohort file: one "agent_id" or "agent_id,capacity" per line
+
+    Returns:
+        dict: Agent ID -> capacity (0 means the default)
+    """
+    cohort = {}
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                agent_id, _, capacity = line.partition(",")
+                cohort[int(agent_id)] = int(capacity) if capacity.strip() else 0
+    return cohort
+
+
+def pair_agents(
+    cohort: Optional[Dict[int, int]] = None,
+    capacity: int = 1,
+    min_score: float = 0.2,
+    neighbors: int = DEFAULT_NEIGHBORS,
+    snapshot_path: Optional[str] = None
+) -> Dict:
+    """
+    Pair the members of a cohort
+
+    Args:
+        cohort: Agent ID -> capacity (0 = default); None pairs every active
+            agent in the snapshot
+        capacity: Default partners per agent
+        min_score: Minimum compatibility for a pair (0-1)
+        neighbors: Compatibility edges kept per agent
+        snapshot_path: Snapshot file (default: cache directory)
+
+    Returns:
+        dict: {"pairs", "unmatched", "total_score", "edges", "missing"}
+    """
+    agents = load_snapshot(snapshot_path)["agents"]
+    if cohort is None:
+        members = [a for a in agents if a.get("id") is not None and a.get("is_active", True)]
+    else:
+        by_id = {a.get("id"): a for a in agents}
+        members = [by_id[agent_id] for agent_id in cohort if agent_id in by_id]
+    missing = [] if cohort is None else sorted(set(cohort) - {a["id"] for a in members})
+
+    # Cohorts repeat the same few thousand terms: normalize each once
+    normalize = functools.lru_cache(maxsize=None)(normalize_term)
+    profiles = [{field: frozenset(filter(None, map(normalize, filter(None, a.get(field) or []))))
+                 for field in LIST_FIELDS} for a in members]
+    capacities = [(cohort or {}).get(a["id"]) or capacity for a in members]
+
+    edges = build_graph(profiles, min_score=min_score, neighbors=neighbors)
+    matched = match_cohort(edges, capacities)
+
+    pairs = []
+    for i, j, score in sorted(matched, key=lambda p: p[2], reverse=True):
+        pairs.append({
+            "agent_ids": [members[i]["id"], members[j]["id"]],
+            "agent_names": [members[i].get("agent_name"), members[j].get("agent_name")],
+            "match_score": round(score, 4),
+            "score_details": {k: round(v, 4) for k, v in pair_score(profiles[i], profiles[j])[1].items()},
+        })
+    paired = {agent_id for pair in pairs for agent_id in pair["agent_ids"]}
+
+    return {
+        "pairs": pairs,
+        "unmatched": [a["id"] for a in members if a["id"] not in paired],
+        "total_score": round(sum(p["match_score"] for p in pairs), 4),
+        "edges": len(edges),
+        "missing": missing,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pair everyone in a cohort for a matchmaking event",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Pair event participants (one agent ID, or "agent_id,capacity", per line)
+  %(prog)s --cohort participants.txt
+
+  # Up to 3 partners each, pairs of at least 0.3
+  %(prog)s --cohort participants.txt --capacity 3 --min-score 0.3
+
+  # Every active agent in the local snapshot (see snapshot.py --sync)
+  %(prog)s --all --json > pairs.json
+        """
+    )
+
+    cohort_group = parser.add_mutually_exclusive_group(required=True)
+    cohort_group.add_argument("--cohort", help="Cohort file")
+    cohort_group.add_argument("--all", action="store_true",
+                              help="Every active agent in the snapshot")
+    parser.add_argument("--capacity", type=int, default=1,
+                       help="Partners per agent, unless set in the cohort file (default: 1)")
+    parser.add_argument("-m", "--min-score", type=float, default=0.2,
+                       help="Minimum compatibility for a pair (0-1, default: 0.2)")
+    parser.add_argument("--neighbors", type=int, default=DEFAULT_NEIGHBORS,
+                       help=f"Compatibility edges kept per agent (default: {DEFAULT_NEIGHBORS})")
+    parser.add_argument("--snapshot", help="Snapshot file (default: cache directory)")
+    parser.add_argument("--json", action="store_true",
+                       help="Output raw JSON instead of formatted display")
+
+    args = parser.parse_args()
+
+    if args.min_score < 0 or args.min_score > 1:
+        parser.error("--min-score must be between 0 and 1")
+
+    if args.capacity < 1:
+        parser.error("--capacity must be at least 1")
+
+    try:
+        start = time.perf_counter()
+        result = pair_agents(
+            cohort=load_cohort(args.cohort) if args.cohort else None,
+            capacity=args.capacity,
+            min_score=args.min_score,
+            neighbors=args.neighbors,
+            snapshot_path=args.snapshot
+        )
+        elapsed = time.perf_counter() - start
+
+        if args.json:
+            print(json.dumps(result, indent=2))
+            return
+
+        cohort_size = len(result["unmatched"]) + len({a for p in result["pairs"] for a in p["agent_ids"]})
+        print()
+        print("=" * 70)
+        print(f"🤝 Pairing: {len(result['pairs'])} pairs for {cohort_size} agents in {elapsed:.1f}s")
+        print("=" * 70)
+        for pair in result["pairs"][:20]:
+            a, b = pair["agent_ids"]
+            names = pair["agent_names"]
+            print(f"  {pair['match_score']:.2f}  [{a}] {names[0]}  ↔  [{b}] {names[1]}")
+        if len(result["pairs"]) > 20:
+            print(f"  ... {len(result['pairs']) - 20} more (use --json for all)")
+        print()
+        print(f"  Total score: {result['total_score']:.2f} ({result['edges']} candidate edges)")
+        print(f"  Unmatched: {len(result['unmatched'])} agents")
+        if result["missing"]:
+            print(f"  ⚠️  Not in the local snapshot: {len(result['missing'])} agents (run snapshot.py --sync)")
+        print()
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Multi-core scoring over the NextMarket posting index
+The index is placed once in shared memory; worker processes each score one shard and the top-k lists are merged
+"""
+
+import os
+import sys
+import time
+import heapq
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Optional, List, Dict, Tuple, Set
+
+# Import API configuration
+from posting_index import PostingIndex, default_index_path, default_query, match_record
+
+
+# Searches sent to the workers per task
+CHUNK_SIZE = 64
+
+# A search: (requester ID, criteria or None for the requester's defaults, min_score, limit)
+Search = Tuple[int, Optional[Dict], float, int]
+# Its result: ([(score, position, facet scores)], number of agents >= min_score), or None
+Scored = Optional[Tuple[List[Tuple[float, int, Dict[str, float]]], int]]
+
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_index: Optional[PostingIndex] = None
+
+
+def _attach(name: str, path: str, delta: Dict):
+    """Worker initializer: open the shared index once, for every task the worker runs"""
+    global _worker_shm, _worker_index
+    _worker_shm = shared_memory.SharedMemory(name=name)
+    # With the parent's replayed changes, even if more arrive meanwhile
+    _worker_index = PostingIndex(path, buffer=_worker_shm.buf, delta=delta)
+
+
+def _score(index: PostingIndex, searches: List[Search], shard: Optional[Tuple[int, int]],
+           skip: Optional[Set[int]] = None) -> List[Scored]:
+    results = []
+    for requester_id, query, min_score, limit in searches:
+        pos = index.position(requester_id)
+        if not query or not any(query.values()):
+            if pos is None:
+                results.append(None)
+                continue
+            query = default_query(index.record(pos))
+        results.append(index.search(query, min_score=min_score, limit=limit, exclude=pos, positions=shard,
+                                    skip=skip))
+    return results
+
+
+def _score_task(task) -> List[Scored]:
+    shard, searches, skip = task
+    return _score(_worker_index, searches, shard, skip)
+
+
+def _merge(parts: List[Scored], limit: int) -> Scored:
+    if parts[0] is None:
+        return None
+    top = heapq.nlargest(limit, (s for part in parts for s in part[0]), key=lambda s: (s[0], -s[1]))
+    return top, sum(part[1] for part in parts)
+
+
+class ShardedIndex:
+    """
+    Posting index scored by a pool of processes, one shard of agents each
+
+    The index file is copied once into a shared memory block that every
+    worker maps at start-up; tasks carry only the searches. Each worker
+    scores its contiguous range of agent positions (a slice of every
+    posting list) and returns a shard-local top-k. Merging those with the
+    same tie-break gives exactly the single-process results.
+    """
+
+    def __init__(self, path: Optional[str] = None, workers: Optional[int] = None,
+                 log_until: Optional[int] = None):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        path = path or default_index_path()
+        with open(path, "rb") as f:
+            data = f.read()
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        self._shm.buf[:len(data)] = data
+        del data
+        # The parent reads the same copy, to fill in profiles of the results
+        self.index = PostingIndex(path, buffer=self._shm.buf, log_until=log_until)
+        n = self.index.n_agents
+        self.shards = [(n * i // self.workers, n * (i + 1) // self.workers) for i in range(self.workers)]
+        self._pool = multiprocessing.Pool(self.workers, initializer=_attach,
+                                          initargs=(self._shm.name, path, self.index.delta()))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        self.index.close()
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def search_many(self, searches: List[Search], skip: Optional[Set[int]] = None) -> List[Scored]:
+        """
+        Score many searches, each across every shard
+
+        Args:
+            searches: (requester ID, criteria or None, min_score, limit) each
+            skip: Agent positions never to return
+
+        Returns:
+            list: ([(score, position, facet scores)], total) per search, as
+                PostingIndex.search; None where the requester is not indexed
+                and there are no criteria
+        """
+        chunks = [searches[i:i + CHUNK_SIZE] for i in range(0, len(searches), CHUNK_SIZE)]
+        tasks = [(shard, chunk, skip) for chunk in chunks for shard in self.shards]
+        parts = self._pool.imap(_score_task, tasks)
+
+        results: List[Scored] = []
+        for chunk in chunks:
+            shard_results = [next(parts) for _ in self.shards]
+            for i, (_, _, _, limit) in enumerate(chunk):
+                results.append(_merge([r[i] for r in shard_results], limit))
+        return results
+
+
+def search_index_batch(queries: List[Dict], workers: Optional[int] = None,
+                       path: Optional[str] = None) -> List[Dict]:
+    """
+    Run many offline searches on all cores
+
+    Args:
+        queries: One dict of search_index() arguments per search
+            (requester_id, tags, skills, interests, location, language,
+            min_score, limit)
+        workers: Processes (default: one per core); 1 scores in this process
+        path: Index file (default: cache directory)
+
+    Returns:
+        list: Per search, results shaped like search_index(), or
+            {"error": ...} for a requester not in the index
+    """
+    searches = []
+    for q in queries:
+        criteria = {f: q.get(f) for f in ("tags", "skills", "interests", "location", "language")}
+        searches.append((q["requester_id"], criteria, q.get("min_score", 0.3), q.get("limit", 10)))
+
+    if (workers or os.cpu_count() or 1) == 1:
+        with PostingIndex(path) as index:
+            return [_results(index, q, scored) for q, scored in zip(queries, _score(index, searches, None))]
+
+    with ShardedIndex(path, workers) as sharded:
+        return [_results(sharded.index, q, scored) for q, scored in zip(queries, sharded.search_many(searches))]
+
+
+def _results(index: PostingIndex, query: Dict, scored: Scored) -> Dict:
+    if scored is None:
+        return {"error": f"Requester {query['requester_id']} is not in the local index"}
+    top, total = scored
+    return {
+        "matches": [match_record(index.record(pos), score, details) for score, pos, details in top],
+        "total": total,
+        "offline": True,
+        "index_created_at": index.created_at,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark multi-core offline scoring of the posting index",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Default-criteria searches for the first 2000 agents, 1 vs. all cores
+  %(prog)s --requesters 2000 --workers 1
+  %(prog)s --requesters 2000
+
+  # Offline batch search on all cores
+  ./scripts/search_agents.py --batch-file searches.jsonl --offline --workers 8
+        """
+    )
+
+    parser.add_argument("--requesters", type=int, default=1000,
+                       help="Number of agents to search for, with their default criteria (default: 1000)")
+    parser.add_argument("--workers", type=int, help="Processes (default: one per core)")
+    parser.add_argument("--limit", type=int, default=10, help="Matches per search (default: 10)")
+    parser.add_argument("--index", help="Index file (default: cache directory)")
+
+    args = parser.parse_args()
+
+    try:
+        with PostingIndex(args.index) as index:
+            ids = [index.agent_id(pos) for pos in range(min(args.requesters, index.n_agents))]
+        queries = [{"requester_id": agent_id, "min_score": 0.0, "limit": args.limit} for agent_id in ids]
+
+        start = time.perf_counter()
+        results = search_index_batch(queries, args.workers, args.index)
+        elapsed = time.perf_counter() - start
+        workers = args.workers or os.cpu_count()
+        print(f"✅ {len(results)} searches on {workers} workers in {elapsed:.2f}s "
+              f"({len(results) / elapsed:.0f} searches/s)")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
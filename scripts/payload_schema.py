@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Pre-flight validation of NextMarket request bodies
+Compiles the server's OpenAPI request schemas into validators that run before any request is sent
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import requests
+from typing import Optional, Callable, List, Dict, Any
+
+# Import API configuration
+from config import API_URL, API_VERSION, VALIDATE_PAYLOADS, SPEC_MAX_AGE, get_cache_dir
+import http_client
+from deadline import Deadline
+
+
+SPEC_FILE = "openapi_spec.json"
+
+# Request bodies checked locally, by the endpoint labels used with http_client
+OPERATIONS = {
+    "POST /agents": ("/agents", "post"),
+    "PUT /agents/{agent_id}": ("/agents/{agent_id}", "put"),
+    "POST /matching/search": ("/matching/search", "post"),
+}
+
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# (type check, name) per JSON Schema type; bool is not a number here
+_TYPES = {
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "array": lambda v: isinstance(v, list),
+    "object": lambda v: isinstance(v, dict),
+    "null": lambda v: v is None,
+}
+
+Validator = Callable[[Any, tuple, List[Dict]], None]
+
+
+class PayloadValidationError(ValueError):
+    """A request body the API would reject, with one error per field"""
+
+    def __init__(self, operation: str, errors: List[Dict]):
+        self.operation = operation
+        self.errors = errors
+        super().__init__(f"Invalid {operation} request: " + "; ".join(
+            f"{format_loc(e['loc'])}: {e['msg']}" for e in errors))
+
+
+def format_loc(loc) -> str:
+    """Field path as text, e.g. skills[2]"""
+    text = ""
+    for part in loc:
+        text += f"[{part}]" if isinstance(part, int) else (f".{part}" if text else part)
+    return text or "(body)"
+
+
+# -- compiling -----------------------------------------------------------
+
+def _error(errors: List[Dict], loc: tuple, msg: str):
+    errors.append({"loc": list(loc), "msg": msg})
+
+
+def compile_schema(schema: Dict, spec: Dict, _refs: Optional[Dict[str, Validator]] = None) -> Validator:
+    """
+    Compile a JSON Schema (the subset OpenAPI generators emit) into a validator
+
+    Each keyword becomes one small check chained in a list, so validating a
+    payload does no schema lookups. Unknown keywords are ignored.
+
+    Args:
+        schema: Schema object, possibly a $ref
+        spec: Full OpenAPI document, for resolving $refs
+
+    Returns:
+        callable: validator(value, loc, errors), appending {"loc", "msg"} dicts
+    """
+    refs = {} if _refs is None else _refs
+
+    if "$ref" in schema:
+        ref = schema["$ref"]
+        if ref not in refs:
+            target = spec
+            for part in ref.lstrip("#/").split("/"):
+                target = target[part.replace("~1", "/").replace("~0", "~")]
+            # Placeholder first: recursive schemas resolve to the compiled validator
+            cell: List[Validator] = []
+            refs[ref] = lambda value, loc, errors: cell[0](value, loc, errors)
+            cell.append(compile_schema(target, spec, refs))
+            refs[ref] = cell[0]
+        return refs[ref]
+
+    checks: List[Validator] = []
+
+    types = schema.get("type")
+    if isinstance(types, str):
+        types = [types]
+    if types and schema.get("nullable"):
+        types = types + ["null"]
+    if types:
+        type_checks = [_TYPES[t] for t in types if t in _TYPES]
+        expected = " or ".join(types)
+
+        def check_type(value, loc, errors):
+            for is_type in type_checks:
+                if is_type(value):
+                    return
+            _error(errors, loc, f"must be {expected}, got {type(value).__name__}")
+            raise _Stop
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+
+        def check_enum(value, loc, errors):
+            if value not in allowed:
+                _error(errors, loc, f"must be one of {', '.join(map(str, allowed))}")
+        checks.append(check_enum)
+
+    if "const" in schema:
+        const = schema["const"]
+
+        def check_const(value, loc, errors):
+            if value != const:
+                _error(errors, loc, f"must be {const!r}")
+        checks.append(check_const)
+
+    min_length, max_length = schema.get("minLength"), schema.get("maxLength")
+    pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+    is_email = schema.get("format") == "email"
+    if min_length is not None or max_length is not None or pattern or is_email:
+        def check_string(value, loc, errors):
+            if not isinstance(value, str):
+                return
+            if min_length is not None and len(value) < min_length:
+                _error(errors, loc, f"must have at least {min_length} characters")
+            if max_length is not None and len(value) > max_length:
+                _error(errors, loc, f"must have at most {max_length} characters")
+            if pattern and not pattern.search(value):
+                _error(errors, loc, f"must match {pattern.pattern}")
+            if is_email and not _EMAIL.match(value):
+                _error(errors, loc, "must be a valid email address")
+        checks.append(check_string)
+
+    bounds = [(schema.get(key), op, msg) for key, op, msg in (
+        ("minimum", lambda v, b: v >= b, "≥"),
+        ("maximum", lambda v, b: v <= b, "≤"),
+        ("exclusiveMinimum", lambda v, b: v > b, ">"),
+        ("exclusiveMaximum", lambda v, b: v < b, "<"),
+    ) if isinstance(schema.get(key), (int, float)) and not isinstance(schema.get(key), bool)]
+    if bounds:
+        def check_number(value, loc, errors):
+            if not _TYPES["number"](value):
+                return
+            for bound, ok, symbol in bounds:
+                if not ok(value, bound):
+                    _error(errors, loc, f"must be {symbol} {bound}")
+        checks.append(check_number)
+
+    if "items" in schema or "minItems" in schema or "maxItems" in schema:
+        item = compile_schema(schema["items"], spec, refs) if isinstance(schema.get("items"), dict) else None
+        min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+
+        def check_array(value, loc, errors):
+            if not isinstance(value, list):
+                return
+            if min_items is not None and len(value) < min_items:
+                _error(errors, loc, f"must have at least {min_items} items")
+            if max_items is not None and len(value) > max_items:
+                _error(errors, loc, f"must have at most {max_items} items")
+            if item:
+                for i, element in enumerate(value):
+                    item(element, loc + (i,), errors)
+        checks.append(check_array)
+
+    if "properties" in schema or "required" in schema or "additionalProperties" in schema:
+        properties = {name: compile_schema(sub, spec, refs)
+                      for name, sub in schema.get("properties", {}).items()}
+        required = schema.get("required", [])
+        extra = schema.get("additionalProperties", True)
+        extra_check = compile_schema(extra, spec, refs) if isinstance(extra, dict) else None
+
+        def check_object(value, loc, errors):
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if name not in value:
+                    _error(errors, loc + (name,), "field required")
+            for name, field in value.items():
+                check = properties.get(name)
+                if check:
+                    check(field, loc + (name,), errors)
+                elif extra is False:
+                    _error(errors, loc + (name,), "unknown field")
+                elif extra_check:
+                    extra_check(field, loc + (name,), errors)
+        checks.append(check_object)
+
+    for keyword in ("anyOf", "oneOf"):
+        if keyword in schema:
+            branches = [compile_schema(sub, spec, refs) for sub in schema[keyword]]
+
+            def check_any(value, loc, errors, branches=branches):
+                first = None
+                for branch in branches:
+                    branch_errors: List[Dict] = []
+                    _run(branch, value, loc, branch_errors)
+                    if not branch_errors:
+                        return
+                    first = first or branch_errors
+                # Report the first alternative's errors (usually the non-null one)
+                errors.extend(first or [])
+            checks.append(check_any)
+
+    for sub in schema.get("allOf", []):
+        checks.append(compile_schema(sub, spec, refs))
+
+    if len(checks) == 1:
+        only = checks[0]
+        return lambda value, loc, errors: _run(only, value, loc, errors)
+
+    def validate(value, loc, errors):
+        try:
+            for check in checks:
+                check(value, loc, errors)
+        except _Stop:
+            pass  # Wrong type: the other keywords do not apply
+    return validate
+
+
+class _Stop(Exception):
+    pass
+
+
+def _run(check: Validator, value, loc, errors):
+    try:
+        check(value, loc, errors)
+    except _Stop:
+        pass
+
+
+# -- spec cache ----------------------------------------------------------
+
+def default_spec_path() -> str:
+    return os.path.join(get_cache_dir(), SPEC_FILE)
+
+
+def _spec_key() -> str:
+    return f"{API_URL}|{API_VERSION}"
+
+
+def _read_cached(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cached if cached.get("key") == _spec_key() else None
+
+
+def _write_cached(path: str, spec: Optional[Dict], etag: Optional[str]):
+    record = {
+        "key": _spec_key(),
+        "version": spec.get("info", {}).get("version") if spec else None,
+        "etag": etag,
+        "checked_at": time.time(),
+        "spec": spec,
+    }
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(record, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def fetch_spec(path: Optional[str] = None, refresh: bool = False, deadline: Optional[Deadline] = None,
+               offline: bool = False) -> Optional[Dict]:
+    """
+    The server's OpenAPI spec, from the cache directory when fresh
+
+    A cached spec older than NEXTMARKET_SPEC_MAX_AGE is revalidated with a
+    conditional request; one for another API URL or version is never used.
+    If the server cannot be reached, a stale copy is better than none, and
+    it is not asked again for another NEXTMARKET_SPEC_MAX_AGE.
+
+    Args:
+        path: Cache file (default: cache directory)
+        refresh: Revalidate even if the cached copy is fresh
+        deadline: Overall time budget of the caller
+        offline: Only use the cached copy, however old
+
+    Returns:
+        dict: OpenAPI document, or None if there is none
+    """
+    path = path or default_spec_path()
+    cached = _read_cached(path)
+    if cached and (offline or not refresh and time.time() - cached["checked_at"] < SPEC_MAX_AGE):
+        return cached["spec"]
+    if offline:
+        return None
+
+    headers = {}
+    if cached and cached["spec"] and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    try:
+        response = http_client.api_request("GET", "/openapi.json", endpoint="GET /openapi.json",
+                                           versioned=False, deadline=deadline, headers=headers)
+        if response.status_code == 304 and headers:
+            spec, etag = cached["spec"], cached.get("etag")
+        else:
+            response.raise_for_status()
+            spec, etag = response.json(), response.headers.get("ETag")
+    except (requests.exceptions.RequestException, ValueError):
+        # Keep what we have, and don't ask again on every request while the API is down
+        spec = cached["spec"] if cached else None
+        _write_cached(path, spec, cached.get("etag") if cached else None)
+        return spec
+
+    version = spec.get("info", {}).get("version")
+    if cached and cached["spec"] and cached.get("version") != version:
+        print(f"ℹ️  API spec changed: {cached.get('version')} -> {version}", file=sys.stderr)
+    _write_cached(path, spec, etag)
+    return spec
+
+
+class PayloadValidators:
+    """
+    Compiled request-body validators for one OpenAPI document
+
+    Operations the spec does not describe are not checked.
+    """
+
+    def __init__(self, spec: Dict):
+        self.version = spec.get("info", {}).get("version")
+        self.validators: Dict[str, Validator] = {}
+        paths = spec.get("paths", {})
+        refs: Dict[str, Validator] = {}
+        for operation, (route, method) in OPERATIONS.items():
+            body = (paths.get(f"/api/{API_VERSION}{route}", {}).get(method, {})
+                    .get("requestBody", {}).get("content", {}).get("application/json", {}))
+            if "schema" in body:
+                self.validators[operation] = compile_schema(body["schema"], spec, refs)
+
+    def errors(self, operation: str, payload: Any) -> List[Dict]:
+        """Field-level errors for a request body ([] if valid or not described)"""
+        validator = self.validators.get(operation)
+        errors: List[Dict] = []
+        if validator:
+            _run(validator, payload, (), errors)
+        return errors
+
+
+# Compiled validators, and when their spec was last looked up, per API
+_validators: Dict[str, Optional[PayloadValidators]] = {}
+_checked_at: Dict[str, float] = {}
+
+
+def get_validators(refresh: bool = False, deadline: Optional[Deadline] = None,
+                   offline: bool = False) -> Optional[PayloadValidators]:
+    """
+    Validators for the configured API (None if no spec)
+
+    The spec is looked up again every NEXTMARKET_SPEC_MAX_AGE, and the
+    validators recompiled when its version changes.
+    """
+    key = _spec_key()
+    stale = time.time() - _checked_at.get(key, 0.0) >= SPEC_MAX_AGE
+    if refresh or key not in _validators or (stale and not offline):
+        spec = fetch_spec(refresh=refresh, deadline=deadline, offline=offline)
+        current = _validators.get(key)
+        if spec is None:
+            _validators[key] = None
+        elif refresh or current is None or current.version != spec.get("info", {}).get("version"):
+            _validators[key] = PayloadValidators(spec)
+        if not offline:
+            _checked_at[key] = time.time()
+    return _validators[key]
+
+
+def payload_errors(operation: str, payload: Any, deadline: Optional[Deadline] = None,
+                   offline: bool = False) -> List[Dict]:
+    """
+    Field-level errors the API would report for a request body
+
+    Args:
+        operation: Endpoint label, e.g. "POST /agents"
+        payload: Request body
+        deadline: Overall time budget, if the spec has to be fetched
+        offline: Check against the cached spec only, never fetching it
+
+    Returns:
+        list: {"loc", "msg"} per error; empty when valid, when validation is
+            disabled (NEXTMARKET_VALIDATE_PAYLOADS) or without a spec
+    """
+    if not VALIDATE_PAYLOADS:
+        return []
+    validators = get_validators(deadline=deadline, offline=offline)
+    return validators.errors(operation, payload) if validators else []
+
+
+def validate_payload(operation: str, payload: Any, deadline: Optional[Deadline] = None,
+                     offline: bool = False):
+    """
+    Raise PayloadValidationError if the API would reject a request body
+
+    Args:
+        operation: Endpoint label, e.g. "POST /agents"
+        payload: Request body
+        deadline: Overall time budget, if the spec has to be fetched
+        offline: Check against the cached spec only, never fetching it
+    """
+    errors = payload_errors(operation, payload, deadline, offline)
+    if errors:
+        raise PayloadValidationError(operation, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fetch the OpenAPI spec and check request bodies against it",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Refresh the cached spec
+  %(prog)s --refresh
+
+  # Check request bodies, one JSON object per line
+  %(prog)s --operation "POST /agents" --file agents.jsonl
+        """
+    )
+
+    parser.add_argument("--refresh", action="store_true", help="Revalidate the cached spec now")
+    parser.add_argument("--operation", choices=sorted(OPERATIONS), help="Request to check bodies against")
+    parser.add_argument("--file", help="Request bodies, one JSON object per line ('-' for stdin)")
+
+    args = parser.parse_args()
+
+    if not (args.refresh or args.file):
+        parser.error("--refresh or --file is required")
+    if args.file and not args.operation:
+        parser.error("--file requires --operation")
+
+    try:
+        validators = get_validators(refresh=args.refresh)
+        if validators is None:
+            raise RuntimeError(f"No OpenAPI spec available from {API_URL}")
+        print(f"✅ OpenAPI spec {validators.version or '(unversioned)'}: "
+              f"{', '.join(sorted(validators.validators)) or 'no request bodies described'}")
+
+        if args.file:
+            f = sys.stdin if args.file == "-" else open(args.file)
+            invalid = total = 0
+            start = time.perf_counter()
+            with f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    total += 1
+                    errors = validators.errors(args.operation, json.loads(line))
+                    if errors:
+                        invalid += 1
+                        for error in errors:
+                            print(f"  ❌ line {line_number}: {format_loc(error['loc'])}: {error['msg']}")
+            elapsed = (time.perf_counter() - start) * 1e6
+            print(f"{'✅' if not invalid else '⚠️ '} {total - invalid}/{total} valid "
+                  f"({elapsed / max(total, 1):.1f} µs per body)")
+            if invalid:
+                sys.exit(1)
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Local cache of full NextMarket agent profiles
+Filled by get_agent and by prefetching the top matches of a search, with hit-rate counters
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import argparse
+import contextlib
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional, Iterable, List, Dict
+
+# Import API configuration
+from config import get_cache_dir, PROFILE_CACHE_TTL
+import http_client
+from deadline import Deadline
+
+
+CACHE_SUBDIR = "profiles"
+STATS_FILE = "profile_cache_stats.json"
+
+# Longest a finished search waits for its prefetches before exiting (seconds)
+PREFETCH_WAIT = 5.0
+
+
+def _cache_dir() -> str:
+    path = os.path.join(get_cache_dir(), CACHE_SUBDIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _entry_path(agent_id: int) -> str:
+    return os.path.join(_cache_dir(), f"{int(agent_id)}.json")
+
+
+def _write_entry(agent_id: int, entry: Dict):
+    path = _entry_path(agent_id)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{id(entry)}"
+    with open(tmp_path, "w") as f:
+        json.dump(entry, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _read_entry(agent_id: int) -> Optional[Dict]:
+    try:
+        with open(_entry_path(agent_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextlib.contextmanager
+def _stats():
+    """Shared counters, read and written under an exclusive lock"""
+    path = os.path.join(get_cache_dir(), STATS_FILE)
+    with open(path, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            try:
+                stats = json.loads(f.read() or "{}")
+            except ValueError:
+                stats = {}
+            for key in ("hits", "misses", "expired", "prefetched"):
+                stats.setdefault(key, 0)
+            stats.setdefault("prefetched_by_rank", {})
+            stats.setdefault("used_by_rank", {})
+            yield stats
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(stats))
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def put(agent: Dict, rank: Optional[int] = None):
+    """
+    Cache a profile
+
+    Args:
+        agent: Agent data as returned by GET /agents/{id}
+        rank: Position in the search results, if prefetched
+    """
+    if agent.get("id") is None:
+        return
+    _write_entry(agent["id"], {"agent": agent, "fetched_at": time.time(), "rank": rank, "used": False})
+
+
+def invalidate(agent_id: int):
+    """Drop a cached profile (e.g. after an update)"""
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(_entry_path(agent_id))
+
+
+def get(agent_id: int, ttl: float = PROFILE_CACHE_TTL) -> Optional[Dict]:
+    """
+    A cached profile no older than ttl seconds, counting the hit or miss
+
+    Returns:
+        dict: Agent data, or None on a miss
+    """
+    entry = _read_entry(agent_id)
+    fresh = entry is not None and time.time() - entry["fetched_at"] <= ttl
+    first_use = fresh and entry["rank"] is not None and not entry["used"]
+    with _stats() as stats:
+        if not fresh:
+            stats["misses"] += 1
+            if entry is not None:
+                stats["expired"] += 1
+            return None
+        stats["hits"] += 1
+        if first_use:
+            rank = str(entry["rank"])
+            stats["used_by_rank"][rank] = stats["used_by_rank"].get(rank, 0) + 1
+    if first_use:
+        entry["used"] = True
+        _write_entry(agent_id, entry)
+    return entry["agent"]
+
+
+def _fetch(agent_id: int, rank: int, deadline: Deadline) -> bool:
+    try:
+        response = http_client.api_request(
+            "GET",
+            f"/agents/{agent_id}",
+            endpoint="GET /agents/{agent_id}",
+            deadline=deadline,
+            headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+        put(response.json(), rank)
+        return True
+    except (requests.exceptions.RequestException, ValueError):
+        return False  # Only a missed prefetch: the detail view fetches it
+
+
+class Prefetch:
+    """Profiles being fetched in the background; wait() before exiting"""
+
+    def __init__(self, executor: Optional[ThreadPoolExecutor] = None, futures: Optional[List] = None):
+        self._executor = executor
+        self._futures = futures or []
+
+    def wait(self, timeout: float = PREFETCH_WAIT) -> int:
+        """
+        Wait for the prefetches (up to timeout seconds)
+
+        Returns:
+            int: Profiles fetched
+        """
+        if not self._executor:
+            return 0
+        done, _ = wait(self._futures, timeout=timeout)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        return sum(1 for f in done if not f.cancelled() and f.exception() is None and f.result())
+
+
+def prefetch(agent_ids: Iterable[int], ttl: float = PROFILE_CACHE_TTL) -> Prefetch:
+    """
+    Start fetching the full profiles of the top search matches, concurrently
+
+    Profiles already cached and fresh are skipped. Returns at once.
+
+    Args:
+        agent_ids: Match agent IDs, best first
+        ttl: Cached profiles younger than this are not fetched again
+
+    Returns:
+        Prefetch: Call wait() before the process exits
+    """
+    todo = []
+    for rank, agent_id in enumerate(agent_ids, 1):
+        if agent_id is None:
+            continue
+        entry = _read_entry(agent_id)
+        if entry is None or time.time() - entry["fetched_at"] > ttl:
+            todo.append((agent_id, rank))
+    if not todo:
+        return Prefetch()
+
+    with _stats() as stats:
+        stats["prefetched"] += len(todo)
+        for _, rank in todo:
+            stats["prefetched_by_rank"][str(rank)] = stats["prefetched_by_rank"].get(str(rank), 0) + 1
+
+    deadline = Deadline(PREFETCH_WAIT)
+    executor = ThreadPoolExecutor(max_workers=len(todo), thread_name_prefix="prefetch")
+    return Prefetch(executor, [executor.submit(_fetch, agent_id, rank, deadline) for agent_id, rank in todo])
+
+
+def cache_stats() -> Dict:
+    """
+    Hit-rate counters
+
+    Returns:
+        dict: {"hits", "misses", "expired", "hit_rate", "prefetched",
+            "by_rank": [{"rank", "prefetched", "used", "use_rate"}]}
+    """
+    with _stats() as stats:
+        stats = dict(stats)
+    lookups = stats["hits"] + stats["misses"]
+    ranks = sorted(set(stats["prefetched_by_rank"]) | set(stats["used_by_rank"]), key=int)
+    return {
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "expired": stats["expired"],
+        "hit_rate": round(stats["hits"] / lookups, 4) if lookups else None,
+        "prefetched": stats["prefetched"],
+        "by_rank": [{
+            "rank": int(rank),
+            "prefetched": stats["prefetched_by_rank"].get(rank, 0),
+            "used": stats["used_by_rank"].get(rank, 0),
+            "use_rate": round(stats["used_by_rank"].get(rank, 0) / stats["prefetched_by_rank"][rank], 4)
+            if stats["prefetched_by_rank"].get(rank) else None,
+        } for rank in ranks],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect the local profile cache",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Prefetch the top 3 matches while the results are shown
+  ./scripts/search_agents.py --requester-id 123 --prefetch 3
+
+  # Hit rate overall, and how often each prefetched rank was viewed
+  %(prog)s --stats
+
+  # Empty the cache and reset the counters
+  %(prog)s --clear
+        """
+    )
+
+    parser.add_argument("--stats", action="store_true", help="Show hit-rate counters")
+    parser.add_argument("--clear", action="store_true", help="Remove cached profiles and reset counters")
+    parser.add_argument("--json", action="store_true", help="Output raw JSON")
+
+    args = parser.parse_args()
+
+    if not (args.stats or args.clear):
+        parser.error("--stats or --clear is required")
+
+    try:
+        if args.clear:
+            removed = 0
+            for name in os.listdir(_cache_dir()):
+                os.remove(os.path.join(_cache_dir(), name))
+                removed += 1
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(get_cache_dir(), STATS_FILE))
+            print(f"✅ Removed {removed} cached profiles")
+
+        if args.stats:
+            stats = cache_stats()
+            if args.json:
+                print(json.dumps(stats, indent=2))
+                return
+            rate = f"{stats['hit_rate']:.1%}" if stats["hit_rate"] is not None else "n/a"
+            print(f"📈 Profile cache: {stats['hits']} hits, {stats['misses']} misses "
+                  f"({stats['expired']} expired), hit rate {rate}")
+            print(f"   Prefetched: {stats['prefetched']}")
+            for row in stats["by_rank"]:
+                use = f"{row['use_rate']:.0%}" if row["use_rate"] is not None else "n/a"
+                print(f"   #{row['rank']:<3} prefetched {row['prefetched']:>5}, viewed {row['used']:>5} ({use})")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
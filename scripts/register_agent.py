@@ -11,8 +11,13 @@ import argparse
 import requests
 from typing import Optional, List
 
-# Import API configuration
-from config import BASE_URL
+# Import API client
+import http_client
+from deadline import Deadline, DeadlineExceeded
+from agent_index import AgentIndex, idempotency_key, lookup_agent, normalize_teamily_id
+from suggest import suggest_additions
+from payload_schema import validate_payload
+import change_log
 
 
 def validate_email(email: str) -> bool:
@@ -35,7 +40,9 @@ def register_agent(
     expertise_level: Optional[str] = None,
     looking_for: Optional[str] = None,
     preferred_tags: Optional[List[str]] = None,
-    preferred_skills: Optional[List[str]] = None
+    preferred_skills: Optional[List[str]] = None,
+    check_existing: bool = True,
+    deadline: Optional[Deadline] = None
 ) -> dict:
     """
     Register a new agent to NextMarket platform
@@ -54,9 +61,12 @@ def register_agent(
         looking_for: What kind of connections
         preferred_tags: Tags interested in
         preferred_skills: Skills looking for in others
+        check_existing: Return the existing agent instead of creating a
+            duplicate when teamily_id is already registered
+        deadline: Overall time budget
 
     Returns:
-        dict: API response with agent data
+        dict: API response with agent data (or the existing agent)
     """
 
     # Validate required fields
@@ -96,17 +106,62 @@ def register_agent(
     if preferred_skills:
         payload["preferred_skills"] = preferred_skills
 
+    # Fail before any network round trip if the API would reject it
+    validate_payload("POST /agents", payload, deadline)
+
+    index = AgentIndex()
+
+    headers = {"Content-Type": "application/json"}
+    idempotent = index.supports_idempotency_keys()
+    if idempotent:
+        headers["Idempotency-Key"] = idempotency_key(teamily_id)
+
+    # Check-then-create: only an indexed (or pending) teamily_id costs a lookup;
+    # a Bloom hit missing from the mapping is a false positive. A pending
+    # registration is resolved by the Idempotency-Key when the server takes one,
+    # and otherwise needs a directory scan.
+    key = normalize_teamily_id(teamily_id)
+    if (check_existing and index.might_contain(teamily_id) and key in index.agents
+            and (index.agents[key] is not None or not idempotent)):
+        try:
+            existing = lookup_agent(teamily_id, index.agents[key], deadline)
+        except DeadlineExceeded:
+            print(f"❌ Could not rule out an earlier registration of {teamily_id} in time: "
+                  f"raise NEXTMARKET_PENDING_LOOKUP_SECONDS, or run agent_index.py --sync", file=sys.stderr)
+            raise
+        if existing:
+            print(f"ℹ️  {teamily_id} is already registered as agent {existing.get('id')}", file=sys.stderr)
+            index.add_agent(existing)
+            index.save()
+            change_log.record_change(existing)
+            return existing
+        # No agent has it: the earlier attempt never registered it
+        index.discard(teamily_id)
+        index.save()
+
     # Make API request
     try:
-        response = requests.post(
-            f"{BASE_URL}/agents",
+        response = http_client.api_request(
+            "POST",
+            "/agents",
+            endpoint="POST /agents",
+            deadline=deadline,
             json=payload,
-            headers={"Content-Type": "application/json"}
+            headers=headers
         )
         response.raise_for_status()
-        return response.json()
+        result = response.json()
+        index.add_agent(result)
+        index.save()
+        change_log.record_change(result)
+        return result
 
     except requests.exceptions.RequestException as e:
+        if (isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+                and not isinstance(e, http_client.CircuitOpenError)):
+            # The agent may have been created: make a retry check first
+            index.add(teamily_id, None)
+            index.save()
         print(f"❌ API Error: {e}", file=sys.stderr)
         if hasattr(e, 'response') and e.response is not None:
             try:
@@ -117,6 +172,29 @@ def register_agent(
         raise
 
 
+def offer_suggestions(profile: dict) -> dict:
+    """Offer skills, interests and tags that often go with the profile's (see suggest.py)"""
+
+    suggestions = suggest_additions(profile)
+    if not suggestions:
+        return profile
+
+    print()
+    print("💡 Agents with similar profiles also list:")
+    for field, terms in suggestions.items():
+        print(f"  {field.capitalize()}: " + ", ".join(f"{n}) {t}" for n, t in enumerate(terms, 1)))
+        picks = input(f"  Add {field}? (numbers, 'all', or Enter to skip): ").strip().lower()
+        if picks == "all":
+            chosen = terms
+        else:
+            chosen = [terms[int(p) - 1] for p in picks.split(",")
+                      if p.strip().isdigit() and 1 <= int(p) <= len(terms)]
+        if chosen:
+            profile[field] = (profile.get(field) or []) + chosen
+
+    return profile
+
+
 def interactive_register():
     """Interactive mode to collect agent information"""
 
@@ -160,6 +238,10 @@ def interactive_register():
     tags_input = input("  Tags (comma-separated, e.g., developer,researcher): ").strip()
     tags = [t.strip() for t in tags_input.split(",")] if tags_input else None
 
+    # Suggestions from the local co-occurrence model, if built
+    profile = offer_suggestions({"skills": skills, "interests": interests, "tags": tags})
+    skills, interests, tags = profile["skills"], profile["interests"], profile["tags"]
+
     # Expertise level
     print("  Expertise Level:")
     print("    1) beginner")
@@ -186,6 +268,8 @@ def interactive_register():
         print(f"  Skills: {', '.join(skills)}")
     if interests:
         print(f"  Interests: {', '.join(interests)}")
+    if tags:
+        print(f"  Tags: {', '.join(tags)}")
 
     confirm = input("\n✅ Proceed with registration? (yes/no): ").strip().lower()
     if confirm not in ['yes', 'y']:
@@ -276,6 +360,8 @@ Examples:
     parser.add_argument("--looking-for", help="What you're looking for")
     parser.add_argument("--preferred-tags", help="Preferred tags (comma-separated)")
     parser.add_argument("--preferred-skills", help="Preferred skills (comma-separated)")
+    parser.add_argument("--force", action="store_true",
+                       help="Skip the duplicate check for an already registered email")
 
     args = parser.parse_args()
 
@@ -310,7 +396,8 @@ Examples:
             expertise_level=args.expertise,
             looking_for=args.looking_for,
             preferred_tags=preferred_tags,
-            preferred_skills=preferred_skills
+            preferred_skills=preferred_skills,
+            check_existing=not args.force
         )
 
         print(json.dumps(result, indent=2))
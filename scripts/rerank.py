@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Preference-aware re-ranking of NextMarket search results
+Re-scores over-fetched server matches with the requester's declared preferences
+"""
+
+import re
+from typing import Optional, List, Dict
+
+
+# Default weights for each score component
+DEFAULT_WEIGHTS = {
+    "server": 0.4,       # Server match_score
+    "preferences": 0.35, # Candidate has the requester's preferred skills/tags, expertise, goals
+    "reciprocal": 0.25,  # Candidate prefers the requester back
+    "diversity": 0.15,   # Penalty for looking like higher-ranked picks
+}
+
+EXPERTISE_LEVELS = ["beginner", "intermediate", "advanced", "expert"]
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def parse_weights(spec: Optional[str]) -> Dict[str, float]:
+    """
+    Parse weights like "server=0.5,preferences=0.3"
+
+    Args:
+        spec: Comma-separated name=value pairs (missing names keep their defaults)
+
+    Returns:
+        dict: Weights for every component
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    if not spec:
+        return weights
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_WEIGHTS:
+            raise ValueError(f"Unknown re-rank weight: {name} (expected one of {', '.join(DEFAULT_WEIGHTS)})")
+        weights[name] = float(value)
+    return weights
+
+
+def _terms(values) -> frozenset:
+    return frozenset(v.strip().lower() for v in values if v) if values else frozenset()
+
+
+def _words(text) -> frozenset:
+    return frozenset(_WORD.findall(text.lower())) if text else frozenset()
+
+
+def _coverage(wanted: frozenset, offered: frozenset) -> Optional[float]:
+    """Fraction of wanted terms offered (None when nothing is wanted)"""
+    if not wanted:
+        return None
+    return len(wanted & offered) / len(wanted)
+
+
+def _mean(values) -> float:
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else 0.0
+
+
+def _expertise_fit(requester_level: Optional[str], candidate_level: Optional[str]) -> Optional[float]:
+    """1.0 for the same level, decreasing by distance; mentors (higher levels) score a little better"""
+    if requester_level not in EXPERTISE_LEVELS or candidate_level not in EXPERTISE_LEVELS:
+        return None
+    gap = EXPERTISE_LEVELS.index(candidate_level) - EXPERTISE_LEVELS.index(requester_level)
+    return max(0.0, 1.0 - abs(gap) / 3 + (0.1 if gap > 0 else 0.0))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    common = len(a & b)
+    union = len(a) + len(b) - common
+    return common / union if union else 0.0
+
+
+def rerank_matches(
+    matches: List[Dict],
+    requester: Dict,
+    limit: int,
+    weights: Optional[Dict[str, float]] = None
+) -> List[Dict]:
+    """
+    Re-score and re-order server matches for a requester
+
+    Args:
+        matches: Server matches (over-fetched, e.g. 5x limit)
+        requester: Requester's full profile (from get_agent)
+        limit: Number of matches to return
+        weights: Component weights (default: DEFAULT_WEIGHTS)
+
+    Returns:
+        list: Top `limit` matches, each with "rerank_score" and "rerank_details" added
+    """
+    weights = weights or DEFAULT_WEIGHTS
+
+    preferred_skills = _terms(requester.get("preferred_skills"))
+    preferred_tags = _terms(requester.get("preferred_tags"))
+    goal_words = _words(requester.get("looking_for"))
+    own_skills = _terms(requester.get("skills"))
+    own_tags = _terms(requester.get("tags"))
+    level = requester.get("expertise_level")
+
+    scored = []
+    for match in matches:
+        skills = _terms(match.get("skills"))
+        tags = _terms(match.get("tags"))
+
+        preferences = _mean([
+            _coverage(preferred_skills, skills),
+            _coverage(preferred_tags, tags),
+            _coverage(goal_words, _words(match.get("looking_for")) | _words(match.get("bio"))),
+            _expertise_fit(level, match.get("expertise_level")),
+        ])
+        reciprocal = _mean([
+            _coverage(_terms(match.get("preferred_skills")), own_skills),
+            _coverage(_terms(match.get("preferred_tags")), own_tags),
+        ])
+        base = (weights["server"] * match.get("match_score", 0)
+                + weights["preferences"] * preferences
+                + weights["reciprocal"] * reciprocal)
+        scored.append((base, preferences, reciprocal, skills | tags, match))
+
+    # Greedy diversity (MMR). Candidates are scanned by base score and the
+    # scan stops once no later candidate can win, so similarities to the
+    # picks are computed lazily, only for candidates that get scanned.
+    remaining = [list(entry) + [0.0, 0] for entry in sorted(scored, key=lambda s: s[0], reverse=True)]
+    diversity = weights["diversity"]
+    picked = []
+    picked_facets = []
+    while remaining and len(picked) < limit:
+        best_i, best_score = 0, None
+        for i, entry in enumerate(remaining):
+            if best_score is not None and entry[0] <= best_score:
+                break  # Sorted by base score: no later candidate can win
+            if diversity:
+                for facets in picked_facets[entry[6]:]:
+                    entry[5] = max(entry[5], _jaccard(entry[3], facets))
+                entry[6] = len(picked_facets)
+            score = entry[0] - diversity * entry[5]
+            if best_score is None or score > best_score:
+                best_i, best_score = i, score
+
+        base, preferences, reciprocal, facets, match, similarity, _ = remaining.pop(best_i)
+        picked_facets.append(facets)
+        picked.append(dict(
+            match,
+            rerank_score=round(best_score, 4),
+            rerank_details={
+                "preferences_score": round(preferences, 4),
+                "reciprocal_score": round(reciprocal, 4),
+                "similarity_to_higher_ranked": round(similarity, 4),
+            }
+        ))
+
+    return picked
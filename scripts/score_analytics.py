@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Match score analytics across many NextMarket requesters
+Streams search results through mergeable quantile sketches and per-component histograms
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Iterable, Iterator, List, Dict, Tuple
+
+# Import API configuration
+from config import get_cache_dir
+from deadline import Deadline, DeadlineExceeded
+
+
+ANALYTICS_FILE = "score_analytics.json"
+
+# Score components reported separately (keys of a match's score_details)
+COMPONENTS = ("tags_score", "skills_score", "interests_score")
+
+# Thresholds reported when none are given
+DEFAULT_THRESHOLDS = (0.3, 0.4, 0.5, 0.6, 0.7, 0.8)
+
+PERCENTILES = (10, 25, 50, 75, 90, 95, 99)
+
+# Sketch accuracy: rank error is roughly 1.7 / SKETCH_K
+SKETCH_K = 200
+
+HISTOGRAM_BINS = 20
+
+# Requesters with no matches listed by ID (the rest are only counted)
+MAX_ZERO_LISTED = 1000
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty)
+
+    Values go into a stack of compactors; a full compactor sorts itself and
+    promotes every other value, at double weight, to the level above. Memory
+    stays O(k log(n/k)) for n values, and two sketches merge level by level,
+    so partial sketches from many workers or runs combine into one.
+    """
+
+    def __init__(self, k: int = SKETCH_K, state: Optional[Dict] = None):
+        self.k = k
+        self.compactors: List[List[float]] = [[]]
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._size = 0
+        self._max_size = 0
+        if state:
+            self.__dict__.update(state)
+        else:
+            self._max_size = self._capacity(0)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def update(self, value: float):
+        self.compactors[0].append(value)
+        self.count += 1
+        self._size += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if self._size >= self._max_size:
+            self._compress()
+
+    def _compress(self):
+        for level, compactor in enumerate(self.compactors):
+            if len(compactor) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                compactor.sort()
+                # An odd leftover stays at this level
+                keep = [compactor.pop()] if len(compactor) % 2 else []
+                self.compactors[level + 1].extend(compactor[random.getrandbits(1)::2])
+                self.compactors[level] = keep
+                self._size = sum(map(len, self.compactors))
+                self._max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+                # Lazy: stop as soon as there is room again
+                if self._size < self._max_size:
+                    break
+
+    def merge(self, other: "KLLSketch"):
+        """Add another sketch's values to this one"""
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, compactor in enumerate(other.compactors):
+            self.compactors[level].extend(compactor)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._size = sum(map(len, self.compactors))
+        self._max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+        while self._size >= self._max_size:
+            before = self._size
+            self._compress()
+            if self._size == before:
+                break
+
+    def _weighted(self) -> List[Tuple[float, int]]:
+        items = [(value, 1 << level) for level, compactor in enumerate(self.compactors) for value in compactor]
+        items.sort()
+        return items
+
+    def quantiles(self, qs: Iterable[float]) -> List[Optional[float]]:
+        """Approximate values at ranks qs (0-1); None for an empty sketch"""
+        if not self.count:
+            return [None for _ in qs]
+        items = self._weighted()
+        total = sum(weight for _, weight in items)
+        results = []
+        for q in qs:
+            if q <= 0:
+                results.append(self.min)
+                continue
+            if q >= 1:
+                results.append(self.max)
+                continue
+            target, seen = q * total, 0
+            for value, weight in items:
+                seen += weight
+                if seen >= target:
+                    results.append(value)
+                    break
+        return results
+
+    def fraction_at_least(self, threshold: float) -> float:
+        """Approximate fraction of values ≥ threshold"""
+        if not self.count:
+            return 0.0
+        items = self._weighted()
+        total = sum(weight for _, weight in items)
+        return sum(weight for value, weight in items if value >= threshold) / total
+
+
+class Histogram:
+    """Fixed-width bins over [0, 1]; merging adds the counts"""
+
+    def __init__(self, bins: int = HISTOGRAM_BINS):
+        self.counts = [0] * bins
+
+    def update(self, value: float):
+        bins = len(self.counts)
+        self.counts[min(bins - 1, max(0, int(value * bins)))] += 1
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    def render(self, width: int = 30) -> List[str]:
+        peak = max(self.counts) or 1
+        bins = len(self.counts)
+        return [f"{i / bins:.2f}-{(i + 1) / bins:.2f} {'█' * round(width * count / peak):<{width}} {count}"
+                for i, count in enumerate(self.counts)]
+
+
+class ScoreAnalytics:
+    """
+    Score distribution of search results across requesters, in constant memory
+
+    Keeps a sketch of every match score, of each requester's best score
+    (for "how many requesters would get anything at threshold t"), and a
+    sketch and histogram per score component.
+    """
+
+    def __init__(self, state: Optional[Dict] = None):
+        self.scores = KLLSketch()
+        self.best_scores = KLLSketch()
+        self.components = {name: KLLSketch() for name in COMPONENTS}
+        self.histograms = {name: Histogram() for name in ("match_score",) + COMPONENTS}
+        self.requesters = 0
+        self.errors = 0
+        self.zero_match_count = 0
+        self.zero_match_ids: List[int] = []
+        self.min_score = 0.0
+        self.limit = 0
+        self.created_at = time.time()
+        if state:
+            self.__dict__.update(state)
+            self.scores = KLLSketch(state=state["scores"])
+            self.best_scores = KLLSketch(state=state["best_scores"])
+            self.components = {name: KLLSketch(state=s) for name, s in state["components"].items()}
+            self.histograms = {}
+            for name, counts in state["histograms"].items():
+                self.histograms[name] = Histogram(len(counts))
+                self.histograms[name].counts = counts
+
+    def state(self) -> Dict:
+        """Plain state, so the file loads no matter which script saved it"""
+        state = dict(self.__dict__)
+        state["scores"] = self.scores.__dict__
+        state["best_scores"] = self.best_scores.__dict__
+        state["components"] = {name: sketch.__dict__ for name, sketch in self.components.items()}
+        state["histograms"] = {name: h.counts for name, h in self.histograms.items()}
+        return state
+
+    def add_requester(self, requester_id: int, matches: Iterable[Dict]):
+        """Fold in one requester's matches (consumed one at a time)"""
+        best = None
+        for match in matches:
+            score = match.get("match_score", 0)
+            self.scores.update(score)
+            self.histograms["match_score"].update(score)
+            details = match.get("score_details") or {}
+            for name in COMPONENTS:
+                if name in details:
+                    self.components[name].update(details[name])
+                    self.histograms[name].update(details[name])
+            best = score if best is None else max(best, score)
+        self.requesters += 1
+        if best is None:
+            self._add_zero(requester_id)
+        else:
+            self.best_scores.update(best)
+
+    def _add_zero(self, requester_id: int):
+        self.zero_match_count += 1
+        if len(self.zero_match_ids) < MAX_ZERO_LISTED:
+            self.zero_match_ids.append(requester_id)
+
+    def merge(self, other: "ScoreAnalytics"):
+        """Combine with analytics from another worker or run"""
+        self.scores.merge(other.scores)
+        self.best_scores.merge(other.best_scores)
+        for name in COMPONENTS:
+            self.components[name].merge(other.components[name])
+        for name, histogram in other.histograms.items():
+            self.histograms[name].merge(histogram)
+        self.requesters += other.requesters
+        self.errors += other.errors
+        self.zero_match_count += other.zero_match_count
+        self.zero_match_ids.extend(other.zero_match_ids[:MAX_ZERO_LISTED - len(self.zero_match_ids)])
+
+    def report(self, thresholds: Iterable[float] = DEFAULT_THRESHOLDS) -> Dict:
+        """
+        Percentiles, acceptance rates and zero-match requesters
+
+        For each threshold: the share of matches at or above it, the share
+        of requesters who would still get at least one match, and the
+        average number of matches a requester would keep.
+        """
+        qs = [p / 100 for p in PERCENTILES]
+
+        def percentiles(sketch: KLLSketch) -> Dict[str, Optional[float]]:
+            return {f"p{p}": (round(v, 4) if v is not None else None)
+                    for p, v in zip(PERCENTILES, sketch.quantiles(qs))}
+
+        acceptance = []
+        for t in thresholds:
+            kept = self.scores.fraction_at_least(t)
+            acceptance.append({
+                "threshold": t,
+                "matches_kept": round(kept, 4),
+                "requesters_with_matches": round(
+                    self.best_scores.fraction_at_least(t) * self.best_scores.count / max(self.requesters, 1), 4),
+                "matches_per_requester": round(kept * self.scores.count / max(self.requesters, 1), 2),
+            })
+
+        return {
+            "requesters": self.requesters,
+            "errors": self.errors,
+            "matches": self.scores.count,
+            "min_score": self.min_score,
+            "limit": self.limit,
+            "match_score": percentiles(self.scores),
+            "components": {name: percentiles(sketch) for name, sketch in self.components.items()},
+            "acceptance": acceptance,
+            "histograms": {name: h.counts for name, h in self.histograms.items()},
+            "zero_matches": {"count": self.zero_match_count, "requester_ids": self.zero_match_ids},
+        }
+
+
+def default_analytics_path() -> str:
+    return os.path.join(get_cache_dir(), ANALYTICS_FILE)
+
+
+def load_analytics(path: Optional[str] = None) -> ScoreAnalytics:
+    path = path or default_analytics_path()
+    with open(path) as f:
+        try:
+            return ScoreAnalytics(json.load(f))
+        except ValueError:
+            raise ValueError(f"Not a score analytics file (save it again with --save): {path}") from None
+
+
+def save_analytics(analytics: ScoreAnalytics, path: Optional[str] = None) -> str:
+    path = path or default_analytics_path()
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(analytics.state(), f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _requester_matches(requester_id: int, min_score: float, limit: int, offline: bool,
+                       deadline: Deadline) -> Iterator[Dict]:
+    if offline:
+        from posting_index import search_index
+        return iter(search_index(requester_id, min_score=min_score, limit=limit)["matches"])
+    from search_agents import search_agents
+    return iter(search_agents(requester_id, min_score=min_score, limit=limit, deadline=deadline, stream=True))
+
+
+def collect(
+    requester_ids: Iterable[int],
+    min_score: float = 0.0,
+    limit: int = 100,
+    concurrency: int = 8,
+    offline: bool = False,
+    deadline: Optional[Deadline] = None
+) -> ScoreAnalytics:
+    """
+    Search for each requester and fold the results into one ScoreAnalytics
+
+    Matches are streamed off the socket into the sketches, and only a few
+    searches are in flight at once, so memory does not grow with the
+    number of requesters or matches.
+
+    Args:
+        requester_ids: Requesters to search for (any iterable, read lazily)
+        min_score: Score floor of the searches (keep low to see the whole distribution)
+        limit: Matches per requester (1-100)
+        concurrency: Searches in flight at once
+        offline: Search the local index instead of the API (see posting_index.py)
+        deadline: Overall time budget; requesters not reached are left out
+
+    Returns:
+        ScoreAnalytics: Distribution over every requester searched
+    """
+    deadline = deadline or Deadline()
+    analytics = ScoreAnalytics()
+    analytics.min_score, analytics.limit = min_score, limit
+
+    def run(requester_id: int) -> ScoreAnalytics:
+        partial = ScoreAnalytics()
+        try:
+            partial.add_requester(requester_id, _requester_matches(requester_id, min_score, limit, offline, deadline))
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            # A failed search (API error, malformed stream, missing local index) is one error,
+            # not the end of the run; matches streamed before the failure are dropped
+            partial = ScoreAnalytics()
+            partial.errors = 1
+        return partial
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending = set()
+    try:
+        for requester_id in requester_ids:
+            while len(pending) >= concurrency * 2 and not deadline.expired():
+                done, pending = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+                _fold(analytics, done)
+            if deadline.expired():
+                break
+            pending.add(executor.submit(run, requester_id))
+        done, pending = wait(pending, timeout=deadline.remaining())
+        _fold(analytics, done)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return analytics
+
+
+def _fold(analytics: ScoreAnalytics, futures):
+    for future in futures:
+        try:
+            analytics.merge(future.result())
+        except DeadlineExceeded:
+            pass
+
+
+def print_report(report: Dict):
+    print()
+    print("=" * 70)
+    print(f"📊 Score Distribution: {report['matches']} matches from {report['requesters']} requesters")
+    print("=" * 70)
+    errors = f", {report['errors']} failed searches" if report["errors"] else ""
+    print(f"   (searched with min_score={report['min_score']}, limit={report['limit']}{errors})")
+
+    header = "".join(f"{name:>7}" for name in report["match_score"])
+    print(f"\n  {'':<16}{header}")
+    rows = [("match_score", report["match_score"])] + list(report["components"].items())
+    for name, values in rows:
+        cells = "".join(f"{v:>7.2f}" if v is not None else f"{'-':>7}" for v in values.values())
+        print(f"  {name:<16}{cells}")
+
+    print(f"\n  {'threshold':>9}  {'matches kept':>12}  {'requesters ≥1':>13}  {'per requester':>13}")
+    for row in report["acceptance"]:
+        print(f"  {row['threshold']:>9.2f}  {row['matches_kept']:>12.1%}  "
+              f"{row['requesters_with_matches']:>13.1%}  {row['matches_per_requester']:>13.2f}")
+
+    for name, counts in report["histograms"].items():
+        if not any(counts):
+            continue
+        histogram = Histogram(len(counts))
+        histogram.counts = counts
+        print(f"\n  {name}:")
+        for line in histogram.render():
+            print(f"    {line}")
+
+    zero = report["zero_matches"]
+    print(f"\n  ❌ Requesters with no matches: {zero['count']}")
+    if zero["requester_ids"]:
+        more = zero["count"] - len(zero["requester_ids"])
+        print(f"     {', '.join(map(str, zero['requester_ids']))}{f' (and {more} more)' if more > 0 else ''}")
+
+
+def read_requester_ids(path: str) -> Iterator[int]:
+    """Requester IDs, one per line ('-' for stdin)"""
+    f = sys.stdin if path == "-" else open(path)
+    with f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                yield int(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score distribution of matches across many requesters",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Every agent in the directory, against the API
+  %(prog)s --all
+
+  # Requesters from a file, against the local index
+  %(prog)s --requesters ids.txt --offline
+
+  # Combine runs from several machines
+  %(prog)s --requesters part1.txt --save part1.json
+  %(prog)s --merge part1.json part2.json --thresholds 0.4,0.5,0.6
+        """
+    )
+
+    parser.add_argument("--requesters", help="Requester IDs, one per line ('-' for stdin)")
+    parser.add_argument("--all", action="store_true", help="Every agent in the directory")
+    parser.add_argument("--merge", nargs="+", metavar="FILE", help="Combine saved analytics")
+    parser.add_argument("--offline", action="store_true",
+                       help="Search the local index (see posting_index.py --build)")
+    parser.add_argument("-m", "--min-score", type=float, default=0.0,
+                       help="Score floor of the searches (default: 0.0)")
+    parser.add_argument("--limit", type=int, default=100, help="Matches per requester (default: 100)")
+    parser.add_argument("--thresholds", help="Candidate min_score values (comma-separated)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Searches in flight at once (default: 8)")
+    parser.add_argument("--deadline", type=float, help="Overall time budget in seconds")
+    parser.add_argument("--save", nargs="?", const="", metavar="FILE",
+                       help="Save the analytics for --merge (default: cache directory)")
+    parser.add_argument("--json", action="store_true", help="Output the report as JSON")
+
+    args = parser.parse_args()
+
+    if sum(map(bool, (args.requesters, args.all, args.merge))) != 1:
+        parser.error("exactly one of --requesters, --all or --merge is required")
+    if not 1 <= args.limit <= 100:
+        parser.error("--limit must be between 1 and 100")
+    try:
+        thresholds = ([float(t) for t in args.thresholds.split(",")] if args.thresholds
+                      else list(DEFAULT_THRESHOLDS))
+    except ValueError:
+        parser.error("--thresholds must be comma-separated numbers")
+
+    try:
+        start = time.perf_counter()
+        if args.merge:
+            analytics = load_analytics(args.merge[0])
+            for path in args.merge[1:]:
+                analytics.merge(load_analytics(path))
+        else:
+            deadline = Deadline(args.deadline)
+            if args.requesters:
+                requester_ids = read_requester_ids(args.requesters)
+            elif args.offline:
+                from snapshot import load_snapshot
+                requester_ids = (agent["id"] for agent in load_snapshot()["agents"])
+            else:
+                from get_agent import iter_all_agents
+                requester_ids = (agent["id"] for agent in iter_all_agents(deadline=deadline))
+            analytics = collect(requester_ids, args.min_score, args.limit, args.concurrency,
+                                args.offline, deadline)
+
+        report = analytics.report(thresholds)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
+            print(f"\n⏱️  {time.perf_counter() - start:.2f}s")
+
+        if args.save is not None:
+            path = save_analytics(analytics, args.save or None)
+            print(f"💾 Saved: {path}", file=sys.stderr)
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
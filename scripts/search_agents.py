@@ -6,15 +6,34 @@ Search for matching agents on NextMarket platform
 import os
 import sys
 import json
+import time
 import argparse
+import functools
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 from typing import Optional, List, Dict
 
-# Import API configuration
-from config import BASE_URL
-
-
-def search_agents(
+# Import API client
+import http_client
+from deadline import Deadline, DeadlineExceeded
+from rerank import rerank_matches, parse_weights
+from posting_index import search_index, default_index_path
+from text_index import text_search, combine_with_text
+from similarity_index import more_like_this
+from geo_index import filter_near
+from match_table import lookup_matches
+from parallel_scoring import search_index_batch
+from profile_cache import prefetch
+from config import PREFETCH
+from json_stream import stream_array, write_ndjson
+from payload_schema import validate_payload, payload_errors, format_loc
+
+# Server-side search limit, and how many candidates to fetch per re-ranked result
+MAX_SEARCH_LIMIT = 100
+DEFAULT_OVERFETCH = 5
+
+
+def search_payload(
     requester_id: int,
     tags: Optional[List[str]] = None,
     skills: Optional[List[str]] = None,
@@ -24,22 +43,7 @@ def search_agents(
     min_score: float = 0.3,
     limit: int = 10
 ) -> Dict:
-    """
-    Search for matching agents
-
-    Args:
-        requester_id: ID of the requesting agent
-        tags: Tags to match
-        skills: Skills to match
-        interests: Interests to match
-        location: Location to match
-        language: Language to match
-        min_score: Minimum match score (0-1)
-        limit: Maximum number of results (1-100)
-
-    Returns:
-        dict: Match results with agents and scores
-    """
+    """Request body of POST /matching/search"""
 
     # Build query
     query = {}
@@ -63,15 +67,63 @@ def search_agents(
 
     if query:
         payload["query"] = query
+    return payload
+
+
+def search_agents(
+    requester_id: int,
+    tags: Optional[List[str]] = None,
+    skills: Optional[List[str]] = None,
+    interests: Optional[List[str]] = None,
+    location: Optional[str] = None,
+    language: Optional[str] = None,
+    min_score: float = 0.3,
+    limit: int = 10,
+    hedge: Optional[bool] = None,
+    deadline: Optional[Deadline] = None,
+    stream: bool = False
+):
+    """
+    Search for matching agents
+
+    Args:
+        requester_id: ID of the requesting agent
+        tags: Tags to match
+        skills: Skills to match
+        interests: Interests to match
+        location: Location to match
+        language: Language to match
+        min_score: Minimum match score (0-1)
+        limit: Maximum number of results (1-100)
+        hedge: Hedge slow requests (default: NEXTMARKET_HEDGE_READS)
+        deadline: Overall time budget
+        stream: Decode matches one at a time as they arrive
+
+    Returns:
+        dict: Match results with agents and scores, or with stream, an
+            ArrayStream of the matches
+    """
+
+    payload = search_payload(requester_id, tags, skills, interests, location, language, min_score, limit)
+    validate_payload("POST /matching/search", payload, deadline)
 
     # Make API request
     try:
-        response = requests.post(
-            f"{BASE_URL}/matching/search",
+        # Search is a read: safe to hedge
+        response = http_client.api_request(
+            "POST",
+            f"/matching/search",
+            endpoint="POST /matching/search",
+            hedge=hedge,
+            idempotent=True,
+            deadline=deadline,
             json=payload,
-            headers={"Content-Type": "application/json"}
+            headers={"Content-Type": "application/json"},
+            stream=stream
         )
         response.raise_for_status()
+        if stream:
+            return stream_array(response, "matches")
         return response.json()
 
     except requests.exceptions.RequestException as e:
@@ -85,6 +137,116 @@ def search_agents(
         raise
 
 
+def rerank_search(
+    requester_id: int,
+    limit: int = 10,
+    weights: Optional[Dict[str, float]] = None,
+    overfetch: int = DEFAULT_OVERFETCH,
+    hedge: Optional[bool] = None,
+    deadline: Optional[Deadline] = None,
+    **criteria
+) -> Dict:
+    """
+    Search, then re-rank locally with the requester's declared preferences
+
+    Over-fetches overfetch x limit candidates (up to the server maximum)
+    and re-scores them by preferred skills/tags, expertise, looking_for,
+    reciprocal interest and diversity. The requester's profile is fetched
+    concurrently with the search, so re-ranking adds no round-trip.
+
+    Args:
+        requester_id: ID of the requesting agent
+        limit: Maximum number of results (1-100)
+        weights: Re-rank component weights (see rerank.DEFAULT_WEIGHTS)
+        overfetch: Candidates fetched per returned result
+        hedge: Hedge slow requests (default: NEXTMARKET_HEDGE_READS)
+        deadline: Overall time budget
+        **criteria: Other search_agents() arguments (tags, skills, min_score, ...)
+
+    Returns:
+        dict: Match results, re-ordered, with rerank scores
+    """
+    from get_agent import get_agent
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        requester = executor.submit(get_agent, requester_id, hedge=hedge, deadline=deadline)
+        results = search_agents(
+            requester_id,
+            limit=min(MAX_SEARCH_LIMIT, limit * overfetch),
+            hedge=hedge,
+            deadline=deadline,
+            **criteria
+        )
+        requester = requester.result()
+
+    results["matches"] = rerank_matches(results.get("matches", []), requester, limit, weights)
+    results["reranked"] = True
+    return results
+
+
+def batch_search(
+    queries: List[Dict],
+    concurrency: int = 8,
+    deadline: Optional[Deadline] = None,
+    hedge: Optional[bool] = None
+) -> Dict:
+    """
+    Run many searches concurrently under one overall deadline
+
+    Args:
+        queries: One dict of search_agents() arguments per search
+        concurrency: Searches in flight at once
+        deadline: Overall time budget for the whole batch
+        hedge: Hedge slow requests (default: NEXTMARKET_HEDGE_READS)
+
+    Returns:
+        dict: {"results", "partial"}; each result has a status of "ok",
+            "error", "invalid" (rejected locally, with field "errors") or
+            "deadline_exceeded" (not finished in time), and partial is True
+            if any search did not finish in time
+    """
+
+    deadline = deadline or Deadline()
+    results = [{"query": query, "status": "deadline_exceeded"} for query in queries]
+
+    # Bad rows fail here, without taking a slot in the pool
+    valid = []
+    for i, query in enumerate(queries):
+        try:
+            errors = payload_errors("POST /matching/search", search_payload(**query), deadline)
+        except TypeError as e:
+            errors = [{"loc": [], "msg": str(e)}]
+        if errors:
+            results[i].update(status="invalid", errors=errors)
+        else:
+            valid.append(i)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    futures = {
+        executor.submit(search_agents, hedge=hedge, deadline=deadline, **queries[i]): i
+        for i in valid
+    }
+    try:
+        for future in as_completed(futures, timeout=deadline.remaining()):
+            i = futures[future]
+            try:
+                results[i].update(future.result(), status="ok")
+            except DeadlineExceeded:
+                pass
+            except requests.exceptions.RequestException as e:
+                results[i].update(status="error", error=str(e))
+    except FuturesTimeout:
+        pass
+    finally:
+        # Deadline ran out: drop searches that have not started yet
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return {
+        "results": results,
+        "partial": any(r["status"] == "deadline_exceeded" for r in results)
+    }
+
+
 def format_match_result(match: Dict, rank: int) -> str:
     """Format a single match result for display"""
 
@@ -97,6 +259,8 @@ def format_match_result(match: Dict, rank: int) -> str:
     name = match.get('agent_name', 'Unknown')
     bio = match.get('bio', 'No bio provided')
     location = match.get('location', 'N/A')
+    if 'distance_km' in match:
+        location = f"{location} ({match['distance_km']:g} km)"
 
     # Get skills and tags
     skills = match.get('skills', [])
@@ -119,6 +283,15 @@ def format_match_result(match: Dict, rank: int) -> str:
     if tags:
         output.append(f"   🏷️  Tags: {', '.join(tags[:5])}")
 
+    # Show re-rank score
+    if 'rerank_score' in match:
+        details = match.get('rerank_details', {})
+        output.append(
+            f"   🎯 Re-rank Score: {match['rerank_score']:.2f} "
+            f"(preferences={details.get('preferences_score', 0):.2f}, "
+            f"reciprocal={details.get('reciprocal_score', 0):.2f})"
+        )
+
     # Show score breakdown
     if score_details:
         breakdown = []
@@ -128,6 +301,8 @@ def format_match_result(match: Dict, rank: int) -> str:
             breakdown.append(f"skills={score_details['skills_score']:.2f}")
         if 'interests_score' in score_details:
             breakdown.append(f"interests={score_details['interests_score']:.2f}")
+        if 'text_score' in score_details:
+            breakdown.append(f"text={score_details['text_score']:.2f}")
 
         if breakdown:
             output.append(f"   📊 Score Breakdown: {', '.join(breakdown)}")
@@ -146,6 +321,15 @@ def display_results(results: Dict):
     print(f"🔍 Search Results: Found {total} Matching Agents")
     print("=" * 70)
 
+    if results.get('offline'):
+        built = time.strftime("%Y-%m-%d %H:%M", time.localtime(results.get('index_created_at', 0)))
+        print(f"📴 Offline results from local index (snapshot of {built})")
+
+    if results.get('precomputed'):
+        snapshot = time.strftime("%Y-%m-%d %H:%M", time.localtime(results.get('snapshot_at', 0)))
+        age = (time.time() - results.get('computed_at', 0)) / 3600
+        print(f"🗂️  Precomputed matches (snapshot of {snapshot}, computed {age:.1f}h ago; --live to search now)")
+
     if not matches:
         print("\n❌ No matches found.")
         print("\nTips:")
@@ -182,6 +366,19 @@ def display_results(results: Dict):
     print()
 
 
+def print_results(results: Dict, args: argparse.Namespace):
+    """Print results as NDJSON, JSON or the formatted display, per the CLI flags"""
+    # Top profiles are fetched while the results are printed
+    pending = prefetch([m.get("agent_id") for m in results.get("matches", [])[:args.prefetch]])
+    if args.ndjson:
+        write_ndjson(results.get("matches", []))
+    elif args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        display_results(results)
+    pending.wait()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Search for matching agents on NextMarket platform",
@@ -199,27 +396,100 @@ Examples:
     --min-score 0.5 \\
     --limit 20
 
+  # Re-rank by your preferred skills/tags, expertise and goals
+  %(prog)s --requester-id 123 --rerank --rerank-weights "preferences=0.5,diversity=0.2"
+
   # Find agents by location
   %(prog)s --requester-id 123 --location "San Francisco"
 
+  # Only agents within 80 km of San Francisco ("SF", "Bay Area", "lat,lon" also work)
+  %(prog)s --requester-id 123 --skills Python --near "San Francisco" --radius-km 80
+
+  # Default-criteria searches come from the match table when it is fresh
+  # (see match_table.py --refresh); --live always searches the API
+  %(prog)s --requester-id 123
+  %(prog)s --requester-id 123 --live
+
+  # Search the local memory-mapped index (see posting_index.py --build)
+  %(prog)s --requester-id 123 --skills "Python,ML" --offline
+
+  # Full-text search of bio and looking_for (see text_index.py --build),
+  # alone or combined with facets
+  %(prog)s --text '"machine learning" research*'
+  %(prog)s --requester-id 123 --skills Python --text '"open source"'
+
+  # Agents similar to an existing agent (see similarity_index.py --build)
+  %(prog)s --like 123
+
+  # Stream matches as NDJSON, one per line as they arrive
+  %(prog)s --requester-id 123 --skills "Python" --limit 100 --ndjson
+
   # JSON output for scripting
   %(prog)s --requester-id 123 --skills "Python" --json
+
+  # Fetch the top 3 profiles in the background, for instant get_agent.py views
+  %(prog)s --requester-id 123 --skills "Python" --prefetch 3
+
+  # Batch search (one JSON object of search arguments per line),
+  # returning whatever finished within 30 seconds
+  %(prog)s --batch-file searches.jsonl --deadline 30 --json
+
+  # Offline batch search, scored on every core
+  %(prog)s --batch-file searches.jsonl --offline --json
         """
     )
 
-    parser.add_argument("-r", "--requester-id", type=int, required=True,
+    parser.add_argument("-r", "--requester-id", type=int,
                        help="ID of the requesting agent")
     parser.add_argument("-s", "--skills", help="Skills to match (comma-separated)")
     parser.add_argument("-t", "--tags", help="Tags to match (comma-separated)")
     parser.add_argument("-i", "--interests", help="Interests to match (comma-separated)")
     parser.add_argument("-l", "--location", help="Location to match")
     parser.add_argument("--language", help="Language to match")
-    parser.add_argument("-m", "--min-score", type=float, default=0.3,
-                       help="Minimum match score (0-1, default: 0.3)")
+    parser.add_argument("-m", "--min-score", type=float,
+                       help="Minimum match score (0-1, default: 0.3; none with --like)")
     parser.add_argument("--limit", type=int, default=10,
                        help="Maximum number of results (1-100, default: 10)")
     parser.add_argument("--json", action="store_true",
                        help="Output raw JSON instead of formatted display")
+    parser.add_argument("--ndjson", action="store_true",
+                       help="Output compact JSON, one match per line (streamed as matches arrive)")
+    parser.add_argument("--hedge", action="store_true", default=None,
+                       help="Send a second request if the first is slow (first response wins)")
+    parser.add_argument("--rerank", action="store_true",
+                       help="Re-rank over-fetched results by your declared preferences")
+    parser.add_argument("--rerank-weights",
+                       help="Re-rank weights, e.g. server=0.4,preferences=0.35,reciprocal=0.25,diversity=0.15")
+    parser.add_argument("--overfetch", type=int, default=DEFAULT_OVERFETCH,
+                       help=f"Candidates fetched per result when re-ranking or filtering (default: {DEFAULT_OVERFETCH})")
+    parser.add_argument("--offline", action="store_true",
+                       help="Search the local posting-list index instead of the API")
+    parser.add_argument("--live", action="store_true",
+                       help="Search now even when the precomputed match table has the answer")
+    parser.add_argument("--index",
+                       help=f"Posting-list index file for --offline (default: {default_index_path()})")
+    parser.add_argument("--text",
+                       help="Full-text query over bio and looking_for: words, \"phrases\", prefix*")
+    parser.add_argument("--text-weight", type=float, default=0.5,
+                       help="Share of the score from text relevance when combined with facets (default: 0.5)")
+    parser.add_argument("--near", metavar="PLACE",
+                       help="Only agents located near this place (city name or \"lat,lon\")")
+    parser.add_argument("--radius-km", type=float, default=50.0,
+                       help="Radius for --near in km (default: 50)")
+    parser.add_argument("--like", type=int, metavar="AGENT_ID",
+                       help="Find agents similar to this agent (skills, tags, interests and bio)")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH, metavar="N",
+                       help="Fetch the full profiles of the top N matches into the local cache, "
+                            f"so get_agent.py shows them at once (default: {PREFETCH})")
+    parser.add_argument("--deadline", type=float,
+                       help="Overall time budget in seconds (partial results are marked)")
+    parser.add_argument("--batch-file",
+                       help="JSONL file of searches, e.g. {\"requester_id\": 123, \"skills\": [\"Python\"]}; "
+                            "command-line criteria are the defaults")
+    parser.add_argument("--concurrency", type=int, default=8,
+                       help="Searches in flight at once in batch mode (default: 8)")
+    parser.add_argument("--workers", type=int,
+                       help="Processes for --offline --batch-file (default: one per core)")
 
     args = parser.parse_args()
 
@@ -229,29 +499,171 @@ Examples:
     interests = [i.strip() for i in args.interests.split(",")] if args.interests else None
 
     # Validate inputs
-    if args.min_score < 0 or args.min_score > 1:
+    if args.min_score is not None and (args.min_score < 0 or args.min_score > 1):
         parser.error("--min-score must be between 0 and 1")
+    min_score = 0.3 if args.min_score is None else args.min_score
 
     if args.limit < 1 or args.limit > 100:
         parser.error("--limit must be between 1 and 100")
 
+    if args.prefetch < 0:
+        parser.error("--prefetch must not be negative")
+
+    facets = skills or tags or interests or args.location or args.language
+    text_only = args.text and not facets and not args.requester_id
+
+    if not args.requester_id and not args.batch_file and not text_only and not args.like:
+        parser.error("--requester-id is required (or use --batch-file)")
+
+    if args.text and (args.rerank or args.batch_file):
+        parser.error("--text cannot be combined with --rerank or --batch-file")
+
+    if args.like and (facets or args.text or args.rerank or args.batch_file or args.offline):
+        parser.error("--like cannot be combined with search criteria, --text, --rerank, --batch-file or --offline")
+
+    if args.near and (args.rerank or args.batch_file):
+        parser.error("--near cannot be combined with --rerank or --batch-file")
+
+    if args.radius_km <= 0:
+        parser.error("--radius-km must be positive")
+
+    if args.text_weight < 0 or args.text_weight > 1:
+        parser.error("--text-weight must be between 0 and 1")
+
+    try:
+        weights = parse_weights(args.rerank_weights)
+    except ValueError as e:
+        parser.error(str(e))
+
+    offline = args.offline or args.index
+    if offline and args.rerank:
+        parser.error("--offline cannot be combined with --rerank")
+
+    if offline and args.batch_file and args.near:
+        parser.error("--near cannot be combined with --offline --batch-file")
+
+    deadline = Deadline(args.deadline)
+
+    # Batch search
+    if args.batch_file:
+        defaults = {
+            "requester_id": args.requester_id,
+            "tags": tags,
+            "skills": skills,
+            "interests": interests,
+            "location": args.location,
+            "language": args.language,
+            "min_score": min_score,
+            "limit": args.limit
+        }
+        try:
+            with open(args.batch_file) as f:
+                queries = [dict(defaults, **json.loads(line)) for line in f if line.strip()]
+
+            if offline:
+                # Local scoring: sharded across processes, one per core
+                batch = {"results": [], "partial": False}
+                for query, result in zip(queries, search_index_batch(queries, args.workers, args.index)):
+                    status = "error" if "error" in result else "ok"
+                    batch["results"].append(dict(result, query=query, status=status))
+            else:
+                batch = batch_search(queries, concurrency=args.concurrency, deadline=deadline, hedge=args.hedge)
+
+            if args.ndjson:
+                write_ndjson(batch["results"])
+            elif args.json:
+                print(json.dumps(batch, indent=2))
+            else:
+                for entry in batch["results"]:
+                    print(f"\n👤 Requester {entry['query'].get('requester_id')}: {entry['status']}")
+                    if entry["status"] == "ok":
+                        display_results(entry)
+                    elif entry["status"] == "error":
+                        print(f"   ❌ {entry['error']}")
+                    elif entry["status"] == "invalid":
+                        for error in entry["errors"]:
+                            print(f"   ❌ {format_loc(error['loc'])}: {error['msg']}")
+                if batch["partial"]:
+                    print("⚠️  Partial results: deadline exceeded before every search finished")
+
+        except Exception as e:
+            print(f"❌ Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
     # Search
     try:
-        results = search_agents(
+        # Over-fetch so enough candidates survive the text and location filters
+        # (the offline facet index applies --near itself, before scoring)
+        post_filter_near = args.near and not (offline and not text_only and not args.like)
+        fetch_limit = args.limit
+        if args.text or post_filter_near:
+            fetch_limit = min(MAX_SEARCH_LIMIT, args.limit * args.overfetch)
+
+        if text_only or args.like:
+            if args.like:
+                results = more_like_this(args.like, min_score=args.min_score or 0.0, limit=fetch_limit)
+            else:
+                results = text_search(args.text, limit=fetch_limit)
+            if post_filter_near:
+                results = filter_near(results, args.near, args.radius_km, args.limit)
+            else:
+                results["matches"] = results["matches"][:args.limit]
+            print_results(results, args)
+            return
+
+        # Default criteria: an O(1) lookup in the match table, if it is fresh
+        # (the table is built from the default index, so not for --index)
+        if not (facets or args.text or args.near or args.rerank or args.live or args.index):
+            results = lookup_matches(args.requester_id, min_score, args.limit)
+            if results is not None:
+                print_results(results, args)
+                return
+
+        if args.ndjson and not (offline or args.rerank or args.text or post_filter_near):
+            # Plain API search: write each match as soon as it is decoded
+            write_ndjson(search_agents(
+                requester_id=args.requester_id,
+                tags=tags,
+                skills=skills,
+                interests=interests,
+                location=args.location,
+                language=args.language,
+                min_score=min_score,
+                limit=args.limit,
+                hedge=args.hedge,
+                deadline=deadline,
+                stream=True
+            ))
+            return
+
+        if offline:
+            search = functools.partial(search_index, near=args.near, radius_km=args.radius_km,
+                                       path=args.index)
+        elif args.rerank:
+            search = functools.partial(rerank_search, weights=weights, overfetch=args.overfetch,
+                                       hedge=args.hedge, deadline=deadline)
+        else:
+            search = functools.partial(search_agents, hedge=args.hedge, deadline=deadline)
+
+        results = search(
             requester_id=args.requester_id,
             tags=tags,
             skills=skills,
             interests=interests,
             location=args.location,
             language=args.language,
-            min_score=args.min_score,
-            limit=args.limit
+            min_score=min_score,
+            limit=fetch_limit
         )
 
-        if args.json:
-            print(json.dumps(results, indent=2))
-        else:
-            display_results(results)
+        if post_filter_near:
+            results = filter_near(results, args.near, args.radius_km,
+                                  fetch_limit if args.text else args.limit)
+        if args.text:
+            results = combine_with_text(results, args.text, args.limit, text_weight=args.text_weight)
+
+        print_results(results, args)
 
     except Exception as e:
         print(f"❌ Error: {e}", file=sys.stderr)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+"More like this" similarity index of the NextMarket agent directory
+TF-IDF vectors of skills, tags, interests and bio, compared by cosine similarity
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import mmap
+import heapq
+import bisect
+import struct
+import argparse
+from array import array
+from typing import Optional, List, Dict, Tuple
+
+# Import API configuration
+from config import get_cache_dir
+from snapshot import load_snapshot
+from posting_index import normalize_term, is_listed
+from text_index import tokenize, STOPWORDS
+
+
+INDEX_FILE = "similarity_index.bin"
+
+# Vector facets and how much each contributes before normalization
+FACET_WEIGHTS = {
+    "skills": 1.0,
+    "tags": 1.0,
+    "interests": 1.0,
+    "bio": 0.5,  # Free text: many weak terms
+}
+
+# Profile fields kept per agent for displaying results
+RECORD_FIELDS = (
+    "agent_name", "bio", "location", "skills", "tags", "interests",
+    "expertise_level", "looking_for", "preferred_skills", "preferred_tags"
+)
+
+# File layout (little-endian):
+#   header             ... created_at, section offsets
+#   agent IDs          n_agents x u32, ascending (an agent's row is its index here)
+#   row pointers       (n_agents + 1) x u32 into the row columns/values
+#   row columns        u32, ascending within each row
+#   row values         f32, parallel to the row columns
+#   column pointers    (n_features + 1) x u32 into the column rows/values
+#   column rows        u32, ascending within each column
+#   column values      f32, parallel to the column rows
+#   IDF                n_features x f64
+#   feature facets     n_features x u8 (FACET_WEIGHTS position)
+#   feature offsets    (n_features + 1) x u32 into the feature strings
+#   hidden rows        n_hidden x u32: never results (see posting_index.is_listed)
+#   record offsets     (n_agents + 1) x u64 into the records blob
+#   feature strings    "facet:term" UTF-8, sorted (a feature's column is its index here)
+#   records            compact JSON per agent
+MAGIC = b"NMSI"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxIIIId14Q")
+
+
+def default_index_path() -> str:
+    return os.path.join(get_cache_dir(), INDEX_FILE)
+
+
+def agent_features(agent: Dict) -> Dict[str, float]:
+    """
+    Raw term frequencies of an agent, keyed "facet:term"
+
+    List facets count each term once; bio words use 1 + log(tf).
+    """
+    features = {}
+    for facet in ("skills", "tags", "interests"):
+        for value in agent.get(facet) or []:
+            term = normalize_term(value) if value else ""
+            if term:
+                features[f"{facet}:{term}"] = 1.0
+    counts: Dict[str, int] = {}
+    for token in tokenize(agent.get("bio")):
+        if token not in STOPWORDS and not token.isdigit():
+            counts[token] = counts.get(token, 0) + 1
+    for token, tf in counts.items():
+        features[f"bio:{token}"] = 1.0 + math.log(tf)
+    return features
+
+
+def _align(out: bytearray, size: int = 8):
+    out.extend(b"\0" * (-len(out) % size))
+
+
+def _weigh(features: Dict[str, float], column, idf, facet_of) -> Dict[int, float]:
+    """TF-IDF weight and L2-normalize raw features (unknown terms dropped)"""
+    facets = list(FACET_WEIGHTS)
+    vector = {}
+    for feature, tf in features.items():
+        col = column(feature)
+        if col is not None:
+            vector[col] = tf * idf[col] * FACET_WEIGHTS[facets[facet_of[col]]]
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {c: v / norm for c, v in vector.items()} if norm else {}
+
+
+def build_index(agents: List[Dict], path: Optional[str] = None, created_at: Optional[float] = None) -> str:
+    """
+    Build a similarity index file
+
+    Args:
+        agents: Agent records (e.g. from a snapshot)
+        path: Index file (default: cache directory)
+        created_at: Snapshot time recorded in the index (default: now)
+
+    Returns:
+        str: Index path
+    """
+    path = path or default_index_path()
+    agents = sorted((a for a in agents if a.get("id") is not None), key=lambda a: a["id"])
+    raw = [agent_features(a) for a in agents]
+
+    df: Dict[str, int] = {}
+    for features in raw:
+        for feature in features:
+            df[feature] = df.get(feature, 0) + 1
+    facets = list(FACET_WEIGHTS)
+    n = len(agents)
+    features = sorted(df)
+    columns_of = {feature: column for column, feature in enumerate(features)}
+    idf = array("d", (math.log((1 + n) / (1 + df[f])) + 1 for f in features))
+    facet_of = array("B", (facets.index(f.split(":", 1)[0]) for f in features))
+
+    ids = array("I", (a["id"] for a in agents))
+    row_ptr, row_cols, row_vals = array("I", [0]), array("I"), array("f")
+    hidden = array("I")
+    records = bytearray()
+    record_offsets = array("Q", [0])
+    columns: List[List[Tuple[int, float]]] = [[] for _ in features]
+    for row, (agent, raw_features) in enumerate(zip(agents, raw)):
+        vector = _weigh(raw_features, columns_of.get, idf, facet_of)
+        for column, value in sorted(vector.items()):
+            row_cols.append(column)
+            row_vals.append(value)
+            columns[column].append((row, value))
+        row_ptr.append(len(row_cols))
+        if not is_listed(agent):
+            hidden.append(row)
+        record = {k: agent.get(k) for k in RECORD_FIELDS if agent.get(k) is not None}
+        records.extend(json.dumps(record, separators=(",", ":")).encode("utf-8"))
+        record_offsets.append(len(records))
+
+    col_ptr, col_rows, col_vals = array("I", [0]), array("I"), array("f")
+    for entries in columns:
+        col_rows.extend(row for row, _ in entries)
+        col_vals.extend(value for _, value in entries)
+        col_ptr.append(len(col_rows))
+
+    strings = bytearray()
+    string_offsets = array("I", [0])
+    for feature in features:
+        strings.extend(feature.encode("utf-8"))
+        string_offsets.append(len(strings))
+
+    out = bytearray(HEADER.size)
+    offsets = []
+    for section in (ids, row_ptr, row_cols, row_vals, col_ptr, col_rows, col_vals, idf, facet_of,
+                    string_offsets, hidden, record_offsets, strings, records):
+        _align(out)
+        offsets.append(len(out))
+        out.extend(section if isinstance(section, bytearray) else section.tobytes())
+    HEADER.pack_into(out, 0, MAGIC, VERSION, n, len(features), len(row_cols), len(hidden),
+                     created_at or time.time(), *offsets)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(out)
+    os.replace(tmp_path, path)
+    return path
+
+
+class SimilarityIndex:
+    """
+    Normalized sparse TF-IDF matrix of the directory (read-only view of an index file)
+
+    Stored both by row (each agent's vector) and by column (each term's
+    agents). A query multiplies the matrix by the query vector one column
+    at a time, so it touches only the agents that share a term with the
+    query, never the whole directory. Opening maps the file without
+    reading it; the matrix is read in place.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_index_path()
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER.size or struct.unpack_from("<4sH", self._mmap, 0) != (MAGIC, VERSION):
+            self._mmap.close()
+            raise ValueError(f"Not a compatible similarity index: {self.path}")
+        (_, _, self.n_agents, self.n_features, self.n_values, n_hidden, self.created_at,
+         ids_off, row_ptr_off, row_cols_off, row_vals_off, col_ptr_off, col_rows_off, col_vals_off,
+         idf_off, facet_of_off, strings_ptr_off, hidden_off, records_ptr_off, strings_off,
+         records_off) = HEADER.unpack_from(self._mmap, 0)
+
+        view = memoryview(self._mmap)
+        n, f, nnz = self.n_agents, self.n_features, self.n_values
+        self.ids = view[ids_off:ids_off + 4 * n].cast("I")             # row -> agent ID
+        self.row_ptr = view[row_ptr_off:row_ptr_off + 4 * (n + 1)].cast("I")
+        self.row_cols = view[row_cols_off:row_cols_off + 4 * nnz].cast("I")
+        self.row_vals = view[row_vals_off:row_vals_off + 4 * nnz].cast("f")
+        self.col_ptr = view[col_ptr_off:col_ptr_off + 4 * (f + 1)].cast("I")
+        self.col_rows = view[col_rows_off:col_rows_off + 4 * nnz].cast("I")
+        self.col_vals = view[col_vals_off:col_vals_off + 4 * nnz].cast("f")
+        self.idf = view[idf_off:idf_off + 8 * f].cast("d")
+        self.facet_of = view[facet_of_off:facet_of_off + f]              # column -> FACET_WEIGHTS position
+        self._string_offsets = view[strings_ptr_off:strings_ptr_off + 4 * (f + 1)].cast("I")
+        self.hidden = set(view[hidden_off:hidden_off + 4 * n_hidden].cast("I"))  # Rows never returned
+        self._record_offsets = view[records_ptr_off:records_ptr_off + 8 * (n + 1)].cast("Q")
+        self._strings_off = strings_off
+        self._records_off = records_off
+
+    def close(self):
+        for name in ("ids", "row_ptr", "row_cols", "row_vals", "col_ptr", "col_rows", "col_vals", "idf",
+                     "facet_of", "_string_offsets", "_record_offsets"):
+            getattr(self, name).release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _feature(self, column: int) -> bytes:
+        return self._mmap[self._strings_off + self._string_offsets[column]:
+                          self._strings_off + self._string_offsets[column + 1]]
+
+    def column(self, feature: str) -> Optional[int]:
+        """Column of a "facet:term" feature (binary search over the sorted features)"""
+        key = feature.encode("utf-8")
+        lo, hi = 0, self.n_features
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._feature(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_features and self._feature(lo) == key else None
+
+    def row(self, agent_id: int) -> Optional[int]:
+        """Row of an agent ID (None if not indexed)"""
+        row = bisect.bisect_left(self.ids, agent_id)
+        return row if row < self.n_agents and self.ids[row] == agent_id else None
+
+    def record(self, row: int) -> Dict:
+        """Profile fields of one agent (only parsed for results that are shown)"""
+        return json.loads(self._mmap[self._records_off + self._record_offsets[row]:
+                                     self._records_off + self._record_offsets[row + 1]])
+
+    def vector(self, agent_id: int) -> Optional[Dict[int, float]]:
+        """Stored vector of an indexed agent (None if not indexed)"""
+        row = self.row(agent_id)
+        if row is None:
+            return None
+        start, end = self.row_ptr[row], self.row_ptr[row + 1]
+        return dict(zip(self.row_cols[start:end], self.row_vals[start:end]))
+
+    def vectorize(self, agent: Dict) -> Dict[int, float]:
+        """Vector of any profile, weighted with this index's IDF"""
+        return _weigh(agent_features(agent), self.column, self.idf, self.facet_of)
+
+    def nearest(self, vector: Dict[int, float], limit: int = 10,
+                exclude: Optional[int] = None) -> List[Tuple[float, int]]:
+        """
+        Top agents by cosine similarity (hidden ones left out)
+
+        Args:
+            vector: Normalized query vector
+            limit: Maximum number of results
+            exclude: Row to leave out (the query agent)
+
+        Returns:
+            list: [(cosine, row)], most similar first
+        """
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for column, weight in vector.items():
+            start, end = self.col_ptr[column], self.col_ptr[column + 1]
+            for row, value in zip(self.col_rows[start:end], self.col_vals[start:end]):
+                scores[row] = get(row, 0.0) + weight * value
+        scores.pop(exclude, None)
+        for row in self.hidden:
+            scores.pop(row, None)
+        return [(score, row) for row, score in
+                heapq.nlargest(limit, scores.items(), key=lambda item: item[1])]
+
+    def facet_scores(self, vector: Dict[int, float], row: int) -> Dict[str, float]:
+        """Each facet's share of the cosine between a query and one agent"""
+        facets = list(FACET_WEIGHTS)
+        shares = dict.fromkeys(facets, 0.0)
+        start, end = self.row_ptr[row], self.row_ptr[row + 1]
+        for column, value in zip(self.row_cols[start:end], self.row_vals[start:end]):
+            if column in vector:
+                shares[facets[self.facet_of[column]]] += vector[column] * value
+        return shares
+
+
+def more_like_this(
+    agent_id: int,
+    min_score: float = 0.0,
+    limit: int = 10,
+    path: Optional[str] = None
+) -> Dict:
+    """
+    Agents most similar to an existing agent, shaped like /matching/search
+
+    Agents missing from the index (registered after the last build) are
+    fetched from the API and weighted with the index's IDF.
+
+    Args:
+        agent_id: Agent to find look-alikes of
+        min_score: Minimum cosine similarity (0-1)
+        limit: Maximum number of results
+        path: Index file (default: cache directory)
+
+    Returns:
+        dict: {"matches", "total", "offline", "index_created_at"}
+    """
+    with SimilarityIndex(path) as index:
+        vector = index.vector(agent_id)
+        if vector is None:
+            from get_agent import get_agent
+            vector = index.vectorize(get_agent(agent_id))
+
+        top = index.nearest(vector, limit, exclude=index.row(agent_id))
+
+        matches = []
+        for score, row in top:
+            if score < min_score:
+                break
+            details = {f"{facet}_score": round(share, 4)
+                       for facet, share in index.facet_scores(vector, row).items()}
+            matches.append(dict(index.record(row), agent_id=index.ids[row], match_score=round(score, 4),
+                                score_details=details))
+
+        return {"matches": matches, "total": len(matches), "offline": True,
+                "index_created_at": index.created_at}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build and query the \"more like this\" similarity index",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Build from the local snapshot (see snapshot.py --sync)
+  %(prog)s --build
+
+  # Agents most like agent 123
+  %(prog)s --like 123
+  ./scripts/search_agents.py --like 123
+        """
+    )
+
+    parser.add_argument("--build", action="store_true",
+                       help="Build the index")
+    parser.add_argument("--snapshot", help="Snapshot file (default: cache directory)")
+    parser.add_argument("--index", help="Index file (default: cache directory)")
+    parser.add_argument("--like", type=int, metavar="AGENT_ID",
+                       help="Find agents similar to this agent")
+    parser.add_argument("--limit", type=int, default=10,
+                       help="Maximum number of results (default: 10)")
+
+    args = parser.parse_args()
+
+    if not (args.build or args.like):
+        parser.error("--build or --like is required")
+
+    try:
+        if args.build:
+            start = time.perf_counter()
+            snapshot = load_snapshot(args.snapshot)
+            path = build_index(snapshot["agents"], args.index, created_at=snapshot.get("synced_at"))
+            with SimilarityIndex(path) as index:
+                print(f"✅ Similarity index: {index.n_agents} agents, {index.n_features} terms, "
+                      f"{index.n_values} non-zeros in {time.perf_counter() - start:.2f}s: {path}")
+
+        if args.like:
+            start = time.perf_counter()
+            results = more_like_this(args.like, limit=args.limit, path=args.index)
+            print(f"🔍 {results['total']} agents like {args.like} "
+                  f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+            for rank, match in enumerate(results["matches"], 1):
+                print(f"  {rank}. [{match['agent_id']}] {match.get('agent_name', 'Unknown')} "
+                      f"({match['match_score']:.2f})")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Local snapshot of the NextMarket agent directory
+Source data for the offline indexes
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Optional, List, Dict
+
+# Import API configuration
+from config import get_cache_dir
+from deadline import Deadline
+import change_log
+
+
+SNAPSHOT_FILE = "agents_snapshot.json"
+
+
+def default_snapshot_path() -> str:
+    return os.path.join(get_cache_dir(), SNAPSHOT_FILE)
+
+
+def save_snapshot(agents: List[Dict], path: Optional[str] = None, partial: bool = False,
+                  synced_at: Optional[float] = None, log_seq: int = 0) -> str:
+    """
+    Atomically write a directory snapshot
+
+    Args:
+        agents: Agent records
+        path: Snapshot file (default: cache directory)
+        partial: Whether the dump was cut short
+        synced_at: When the directory was dumped (default: now)
+        log_seq: Last change from change_log.py the agents include
+
+    Returns:
+        str: Snapshot path
+    """
+    path = path or default_snapshot_path()
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump({"synced_at": synced_at or time.time(), "partial": partial, "log_seq": log_seq,
+                   "agents": agents}, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_snapshot(path: Optional[str] = None) -> Dict:
+    """
+    Load a directory snapshot
+
+    The default snapshot also gets the registrations and updates logged
+    since it was written (see change_log.py).
+
+    Args:
+        path: Snapshot file (default: cache directory); a plain JSON list
+            of agents or a get_agent.py --list --json dump also works
+
+    Returns:
+        dict: {"synced_at", "partial", "log_seq", "agents"}
+    """
+    path = path or default_snapshot_path()
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {"synced_at": os.path.getmtime(path), "partial": False, "agents": data}
+    elif "items" in data:
+        data = {"synced_at": os.path.getmtime(path), "partial": data.get("partial", False),
+                "agents": data["items"]}
+    data.setdefault("log_seq", 0)
+
+    if os.path.abspath(path) == os.path.abspath(default_snapshot_path()):
+        changes = change_log.read_changes(after=data["log_seq"])
+        if changes:
+            positions = {agent.get("id"): i for i, agent in enumerate(data["agents"])}
+            for change in changes:
+                agent = change["agent"]
+                if agent["id"] in positions:
+                    data["agents"][positions[agent["id"]]] = agent
+                else:
+                    positions[agent["id"]] = len(data["agents"])
+                    data["agents"].append(agent)
+            data["log_seq"] = changes[-1]["seq"]
+    return data
+
+
+def sync_snapshot(path: Optional[str] = None, deadline: Optional[Deadline] = None) -> Dict:
+    """
+    Dump the agent directory into a local snapshot
+
+    Args:
+        path: Snapshot file (default: cache directory)
+        deadline: Overall time budget
+
+    Returns:
+        dict: The snapshot
+    """
+    from get_agent import list_all_agents
+
+    # Changes logged before the dump starts are in it
+    log_seq = change_log.last_seq()
+    result = list_all_agents(deadline=deadline)
+    save_snapshot(result["items"], path, partial=result["partial"], log_seq=log_seq)
+    return load_snapshot(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sync a local snapshot of the agent directory",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Sync the snapshot used by the offline indexes
+  %(prog)s --sync
+
+  # Sync to a specific file, giving up after 120 seconds
+  %(prog)s --sync --output agents.json --deadline 120
+        """
+    )
+
+    parser.add_argument("--sync", action="store_true", required=True,
+                       help="Dump the agent directory")
+    parser.add_argument("-o", "--output", help="Snapshot file (default: cache directory)")
+    parser.add_argument("--deadline", type=float,
+                       help="Overall time budget in seconds")
+
+    args = parser.parse_args()
+
+    try:
+        snapshot = sync_snapshot(args.output, deadline=Deadline(args.deadline))
+        print(f"✅ Snapshot of {len(snapshot['agents'])} agents: {args.output or default_snapshot_path()}")
+        if snapshot["partial"]:
+            print("⚠️  Partial snapshot: deadline exceeded before all pages were fetched")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Profile-completion suggestions for NextMarket agents
+Skill/tag/interest co-occurrence (normalized PMI) precomputed from a directory snapshot
+"""
+
+import os
+import sys
+import math
+import time
+import pickle
+import argparse
+from typing import Optional, List, Dict, Tuple
+
+# Import API configuration
+from config import get_cache_dir
+from snapshot import load_snapshot
+from posting_index import normalize_term, LIST_FIELDS
+
+
+MODEL_FILE = "suggest_model.pkl"
+
+# Ignore terms used by fewer agents, and pairs seen together fewer times
+MIN_SUPPORT = 3
+MIN_COOCCURRENCE = 2
+
+# Most related terms kept per term
+MAX_NEIGHBORS = 30
+
+# Only the first terms of a facet count (guards against keyword-stuffed profiles)
+MAX_TERMS_PER_FACET = 20
+
+
+def default_model_path() -> str:
+    return os.path.join(get_cache_dir(), MODEL_FILE)
+
+
+def _items(profile: Dict) -> List[str]:
+    """Profile terms as "facet:term" items"""
+    items = []
+    for field in LIST_FIELDS:
+        for value in (profile.get(field) or [])[:MAX_TERMS_PER_FACET]:
+            term = normalize_term(value) if value else ""
+            if term:
+                items.append(f"{field}:{term}")
+    return items
+
+
+class SuggestionModel:
+    """
+    Sparse co-occurrence model of profile terms
+
+    For every term, the MAX_NEIGHBORS terms most associated with it by
+    normalized PMI are precomputed, so a suggestion only sums the lists of
+    the profile's own terms.
+    """
+
+    def __init__(self, state: Optional[Dict] = None):
+        self.neighbors: Dict[str, List[Tuple[str, float]]] = {}
+        self.labels: Dict[str, str] = {}  # Item -> most common spelling
+        self.agents = 0
+        self.created_at = 0.0
+        if state:
+            self.__dict__.update(state)
+
+    @classmethod
+    def build(cls, agents: List[Dict], created_at: Optional[float] = None) -> "SuggestionModel":
+        """
+        Count term and pair frequencies and keep each term's strongest associations
+
+        Args:
+            agents: Agent records (e.g. from a snapshot)
+            created_at: Snapshot time recorded in the model (default: now)
+        """
+        model = cls()
+        counts: Dict[str, int] = {}
+        spellings: Dict[str, Dict[str, int]] = {}
+        profiles = []
+        for agent in agents:
+            items = sorted(set(_items(agent)))
+            profiles.append(items)
+            for item in items:
+                counts[item] = counts.get(item, 0) + 1
+            for field in LIST_FIELDS:
+                for value in (agent.get(field) or [])[:MAX_TERMS_PER_FACET]:
+                    if value and normalize_term(value):
+                        seen = spellings.setdefault(f"{field}:{normalize_term(value)}", {})
+                        seen[value.strip()] = seen.get(value.strip(), 0) + 1
+
+        pairs: Dict[Tuple[str, str], int] = {}
+        for items in profiles:
+            items = [item for item in items if counts[item] >= MIN_SUPPORT]
+            for k, a in enumerate(items):
+                for b in items[k + 1:]:
+                    pairs[(a, b)] = pairs.get((a, b), 0) + 1
+
+        n = len(profiles)
+        related: Dict[str, List[Tuple[float, str]]] = {}
+        for (a, b), together in pairs.items():
+            if together < MIN_COOCCURRENCE or together == n:
+                continue
+            # NPMI: log(p(ab) / (p(a) p(b))) / -log p(ab), in [-1, 1]
+            npmi = math.log(together * n / (counts[a] * counts[b])) / -math.log(together / n)
+            if npmi > 0:
+                related.setdefault(a, []).append((npmi, b))
+                related.setdefault(b, []).append((npmi, a))
+
+        for item, scored in related.items():
+            scored.sort(reverse=True)
+            model.neighbors[item] = [(other, round(weight, 4)) for weight, other in scored[:MAX_NEIGHBORS]]
+        model.labels = {item: max(seen, key=seen.get) for item, seen in spellings.items()
+                        if item in model.neighbors}
+        model.agents = n
+        model.created_at = created_at or time.time()
+        return model
+
+    def suggest(self, profile: Dict, limit: int = 5) -> Dict[str, List[str]]:
+        """
+        Top additions for a partial profile
+
+        Args:
+            profile: Profile with any of skills, tags, interests
+            limit: Suggestions per facet
+
+        Returns:
+            dict: Facet -> suggested terms, best first (facets with none are omitted)
+        """
+        have = set(_items(profile))
+        scores: Dict[str, float] = {}
+        for item in have:
+            for other, weight in self.neighbors.get(item, ()):
+                if other not in have:
+                    scores[other] = scores.get(other, 0.0) + weight
+
+        by_field: Dict[str, List[Tuple[float, str]]] = {}
+        for item, score in scores.items():
+            by_field.setdefault(item.split(":", 1)[0], []).append((score, item))
+
+        suggestions = {}
+        for field in LIST_FIELDS:
+            ranked = sorted(by_field.get(field, ()), reverse=True)[:limit]
+            if ranked:
+                suggestions[field] = [self.labels.get(item, item.split(":", 1)[1]) for _, item in ranked]
+        return suggestions
+
+
+def load_model(path: Optional[str] = None) -> SuggestionModel:
+    with open(path or default_model_path(), "rb") as f:
+        return SuggestionModel(pickle.load(f))
+
+
+def save_model(model: SuggestionModel, path: Optional[str] = None) -> str:
+    path = path or default_model_path()
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        # Plain state, so the file loads no matter which script saved it
+        pickle.dump(model.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+def suggest_additions(profile: Dict, limit: int = 5, path: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Suggested skills, tags and interests for a profile
+
+    Suggestions are optional: without a built model this returns nothing.
+
+    Args:
+        profile: Profile with any of skills, tags, interests
+        limit: Suggestions per facet
+        path: Model file (default: cache directory)
+
+    Returns:
+        dict: Facet -> suggested terms
+    """
+    try:
+        model = load_model(path)
+    except (OSError, pickle.UnpicklingError):
+        return {}
+    return model.suggest(profile, limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the co-occurrence model and suggest profile additions",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Build from the local snapshot (see snapshot.py --sync)
+  %(prog)s --build
+
+  # Suggestions for a partial profile
+  %(prog)s --skills "Python,Machine Learning" --tags researcher
+
+  # Suggestions for an existing agent
+  ./scripts/update_agent.py --agent-id 123 --suggest
+        """
+    )
+
+    parser.add_argument("--build", action="store_true", help="Build the model")
+    parser.add_argument("--snapshot", help="Snapshot file (default: cache directory)")
+    parser.add_argument("--model", help="Model file (default: cache directory)")
+    parser.add_argument("-s", "--skills", help="Current skills (comma-separated)")
+    parser.add_argument("-t", "--tags", help="Current tags (comma-separated)")
+    parser.add_argument("-i", "--interests", help="Current interests (comma-separated)")
+    parser.add_argument("--limit", type=int, default=5,
+                       help="Suggestions per facet (default: 5)")
+
+    args = parser.parse_args()
+
+    profile = {
+        field: [v.strip() for v in value.split(",")]
+        for field, value in (("skills", args.skills), ("tags", args.tags), ("interests", args.interests))
+        if value
+    }
+    if not (args.build or profile):
+        parser.error("--build or at least one of --skills, --tags, --interests is required")
+
+    try:
+        if args.build:
+            start = time.perf_counter()
+            snapshot = load_snapshot(args.snapshot)
+            model = SuggestionModel.build(snapshot["agents"], created_at=snapshot.get("synced_at"))
+            path = save_model(model, args.model)
+            print(f"✅ Suggestion model: {len(model.neighbors)} terms from {model.agents} agents "
+                  f"in {time.perf_counter() - start:.2f}s: {path}")
+
+        if profile:
+            model = load_model(args.model)
+            start = time.perf_counter()
+            suggestions = model.suggest(profile, args.limit)
+            elapsed = (time.perf_counter() - start) * 1e6
+            print(f"💡 Suggestions ({elapsed:.0f} µs):")
+            for field, terms in suggestions.items():
+                print(f"  {field.capitalize()}: {', '.join(terms)}")
+            if not suggestions:
+                print("  (none: no related terms in the directory)")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,8 @@ import sys
 import requests
 
 # Import API configuration
-from config import API_URL, API_VERSION
+from config import API_URL, API_URLS, API_VERSION
+from load_balancer import check_health
 
 
 def test_connection():
@@ -18,6 +19,8 @@ def test_connection():
     print("=" * 60)
     print(f"API URL: {API_URL}")
     print(f"API Version: {API_VERSION}")
+    if len(API_URLS) > 1:
+        print(f"Replicas: {', '.join(API_URLS)}")
     print("=" * 60)
     print()
 
@@ -45,6 +48,12 @@ def test_connection():
     except Exception as e:
         print(f"   ❌ Health check failed: {e}")
 
+    # Replicas share the load: check each one is in rotation
+    if len(API_URLS) > 1:
+        for url in API_URLS:
+            status = "✅ healthy" if check_health(url) else "❌ out of rotation"
+            print(f"   {status}: {url}")
+
     print()
 
     # Test 3: OpenAPI spec
@@ -0,0 +1,824 @@
+#!/usr/bin/env python3
+"""
+BM25 full-text index over agent bio and looking_for
+Phrase and prefix queries, with incremental updates when profiles change
+"""
+
+import os
+import re
+import abc
+import sys
+import json
+import math
+import mmap
+import time
+import heapq
+import bisect
+import struct
+import argparse
+from array import array
+from typing import Optional, List, Dict, Tuple, Set, Sequence
+
+# Import API configuration
+from config import get_cache_dir
+from snapshot import load_snapshot
+from posting_index import is_listed
+import change_log
+
+
+INDEX_FILE = "text_index.bin"
+
+# Indexed free-text fields
+TEXT_FIELDS = ("bio", "looking_for")
+
+# Profile fields kept for displaying text-only results
+DISPLAY_FIELDS = ("agent_name", "bio", "location", "skills", "tags", "interests", "looking_for")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Most vocabulary terms a prefix query expands to
+MAX_PREFIX_TERMS = 50
+
+# Re-weight all postings when the average profile length drifts this much
+AVGDL_DRIFT = 0.1
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its of on or that the to was were "
+    "will with my me we our you your".split()
+)
+
+# File layout (little-endian):
+#   header             ... last change from change_log.py included, section offsets
+#   agent IDs          n_agents x u32, ascending
+#   text offsets       (n_agents + 1) x u64 into the texts blob
+#   display offsets    (n_agents + 1) x u64 into the displays blob
+#   hidden agent IDs   n_hidden x u32, ascending: never search results (see posting_index.is_listed)
+#   term dictionary    n_terms x TERM_ENTRY, sorted by term
+#   posting IDs        u32 agent IDs, impact-ordered within each list
+#   posting weights    f64 negated term weights, parallel to the posting IDs
+#   term strings       UTF-8
+#   texts              indexed text per agent
+#   displays           compact JSON per agent
+MAGIC = b"NMTX"
+VERSION = 2
+HEADER = struct.Struct("<4sHxxIIIddQQ10Q")
+TERM_ENTRY = struct.Struct("<HxxIII")  # term length, term offset, posting offset, posting length
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def default_index_path() -> str:
+    return os.path.join(get_cache_dir(), INDEX_FILE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens (stopwords kept, so phrases can be checked exactly)"""
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def agent_text(agent: Dict) -> str:
+    return "\n".join(agent.get(f) or "" for f in TEXT_FIELDS)
+
+
+class TextRanker(abc.ABC):
+    """
+    BM25 ranking over impact-ordered posting lists
+
+    Subclasses provide the storage: postings, indexed texts and display
+    records per agent (TextIndex in memory, MappedTextIndex from a file).
+    """
+
+    avgdl = 0.0  # Average length the stored weights were computed with
+
+    @abc.abstractmethod
+    def _postings(self, term: str) -> Optional[Tuple[Sequence[int], Sequence[float]]]:
+        """(agent IDs, negated term weights in ascending order), or None for an unknown term"""
+
+    @abc.abstractmethod
+    def _text(self, agent_id: int) -> Optional[str]:
+        """Indexed text of an agent, or None if it is not indexed"""
+
+    @abc.abstractmethod
+    def _count(self) -> int:
+        """Number of indexed agents"""
+
+    @abc.abstractmethod
+    def _hidden(self, agent_id: int) -> bool:
+        """Whether an agent is never a search result (see posting_index.is_listed)"""
+
+    @abc.abstractmethod
+    def expand_prefix(self, prefix: str) -> List[str]:
+        """Indexed terms starting with a prefix"""
+
+    @abc.abstractmethod
+    def profile(self, agent_id: int) -> Dict:
+        """Display fields of one agent (only parsed for results that are shown)"""
+
+    def _weight(self, tf: int, length: int) -> float:
+        return tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / self.avgdl))
+
+    def _idf(self, term: str) -> float:
+        entry = self._postings(term)
+        df = len(entry[0]) if entry else 0
+        n = self._count()
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def parse_query(self, query: str) -> Tuple[Dict[str, float], List[List[str]]]:
+        """
+        Parse a query: words are OR-ed and ranked by BM25; "quoted phrases"
+        must appear verbatim; word* matches any term with that prefix.
+
+        Returns:
+            tuple: ({term: query weight}, [phrase tokens])
+        """
+        terms: Dict[str, float] = {}
+        phrases: List[List[str]] = []
+        for phrase, word in _QUERY.findall(query.lower()):
+            if phrase:
+                tokens = tokenize(phrase)
+                if tokens:
+                    phrases.append(tokens)
+                for token in tokens:
+                    if token not in STOPWORDS:
+                        terms[token] = 1.0
+            elif word.endswith("*") and len(word) > 1:
+                expansions = self.expand_prefix(word[:-1])
+                for term in expansions:
+                    terms.setdefault(term, 1.0 / len(expansions) ** 0.5)
+            else:
+                for token in tokenize(word):
+                    if token not in STOPWORDS:
+                        terms[token] = 1.0
+        return terms, phrases
+
+    def _score(self, agent_id: int, factors: Dict[str, float], phrases: List[List[str]]) -> Optional[float]:
+        """Exact BM25 score of one profile (None if it lacks a required phrase or is hidden)"""
+        text = self._text(agent_id)
+        if text is None or self._hidden(agent_id) or (phrases and not _has_phrases(text, phrases)):
+            return None
+        counts, length = term_counts(text)
+        return sum(factor * self._weight(counts[t], length) for t, factor in factors.items() if t in counts)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[float, int]]:
+        """
+        BM25 top-k search (see parse_query for the syntax)
+
+        Args:
+            query: Query string
+            limit: Maximum number of results
+
+        Returns:
+            list: [(bm25 score, agent ID)], best first
+        """
+        terms, phrases = self.parse_query(query)
+        factors = {t: self._idf(t) * w for t, w in terms.items() if self._postings(t)}
+        if not factors or limit < 1:
+            return []
+        if any(not self._postings(t) for p in phrases for t in p if t not in STOPWORDS):
+            return []
+        lists = [(factor, *self._postings(term)) for term, factor in factors.items()]
+
+        top: List[Tuple[float, int]] = []  # Min-heap of the best `limit`
+        seen = set()
+        depth = 0
+        while True:
+            # Best score any profile not yet seen could still reach
+            threshold = 0.0
+            for factor, ids, weights in lists:
+                if depth >= len(ids):
+                    continue
+                threshold -= factor * weights[depth]
+                agent_id = ids[depth]
+                if agent_id in seen:
+                    continue
+                seen.add(agent_id)
+                score = self._score(agent_id, factors, phrases)
+                if score is None:
+                    continue
+                if len(top) < limit:
+                    heapq.heappush(top, (score, agent_id))
+                elif score > top[0][0]:
+                    heapq.heapreplace(top, (score, agent_id))
+            if threshold == 0.0 or (len(top) >= limit and top[0][0] >= threshold):
+                break
+            depth += 1
+
+        return sorted(top, reverse=True)
+
+    def score(self, query: str, agent_ids: List[int]) -> Dict[int, float]:
+        """BM25 scores of specific profiles (those that match the query)"""
+        terms, phrases = self.parse_query(query)
+        factors = {t: self._idf(t) * w for t, w in terms.items() if self._postings(t)}
+        scores = {}
+        for agent_id in agent_ids:
+            score = self._score(agent_id, factors, phrases)
+            if score:
+                scores[agent_id] = score
+        return scores
+
+
+class TextIndex(TextRanker):
+    """
+    Impact-ordered inverted index
+
+    Each term's postings are agent IDs sorted by their BM25 term weight,
+    highest first, so a top-k query stops as soon as no unseen profile can
+    beat the k-th best (threshold algorithm) instead of scoring every
+    profile that matches. Each agent's indexed text is kept: updates
+    remove exactly its old terms, and phrases are verified only on
+    profiles that reach the top k.
+
+    Held in memory to build and update the index file; queries read the
+    file through MappedTextIndex instead of loading it.
+    """
+
+    def __init__(self):
+        # term -> (agent IDs, negated term weights in ascending order)
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.vocabulary: List[str] = []  # Sorted, for prefix queries
+        self.texts: Dict[int, str] = {}
+        self.display: Dict[int, str] = {}  # Compact JSON, parsed only for results
+        self.hidden: Set[int] = set()  # Agents never returned (see posting_index.is_listed)
+        self.total_length = 0
+        self.avgdl = 0.0  # Average length the stored weights were computed with
+        self.updated_at = 0.0
+        self.log_seq = 0  # Last change from change_log.py applied
+
+    def _postings(self, term: str) -> Optional[Tuple[array, array]]:
+        return self.postings.get(term)
+
+    def _text(self, agent_id: int) -> Optional[str]:
+        return self.texts.get(agent_id)
+
+    def _count(self) -> int:
+        return len(self.texts)
+
+    def _hidden(self, agent_id: int) -> bool:
+        return agent_id in self.hidden
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        i = bisect.bisect_left(self.vocabulary, prefix)
+        terms = []
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(prefix) and len(terms) < MAX_PREFIX_TERMS:
+            terms.append(self.vocabulary[i])
+            i += 1
+        return terms
+
+    def profile(self, agent_id: int) -> Dict:
+        return json.loads(self.display.get(agent_id, "{}"))
+
+    # -- maintenance ---------------------------------------------------
+
+    def add(self, agent: Dict):
+        """Index (or re-index) one agent: O(its terms) posting inserts"""
+        agent_id = agent["id"]
+        text = agent_text(agent)
+        display = json.dumps(
+            {k: agent.get(k) for k in DISPLAY_FIELDS if agent.get(k) is not None}, separators=(",", ":"))
+        unchanged = self.texts.get(agent_id) == text
+        if not unchanged:
+            self.remove(agent_id)
+        self.display[agent_id] = display
+        if is_listed(agent):
+            self.hidden.discard(agent_id)
+        else:
+            self.hidden.add(agent_id)
+        if unchanged:
+            return
+
+        counts, length = term_counts(text)
+        self.avgdl = self.avgdl or max(1.0, length)
+        for term, tf in counts.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array("I"), array("d"))
+                bisect.insort(self.vocabulary, term)
+            ids, weights = entry
+            weight = -self._weight(tf, length)
+            i = bisect.bisect_left(weights, weight)
+            ids.insert(i, agent_id)
+            weights.insert(i, weight)
+
+        self.texts[agent_id] = text
+        self.total_length += length
+        self.updated_at = time.time()
+
+    def remove(self, agent_id: int):
+        """Remove one agent's postings (only its own terms are touched)"""
+        text = self.texts.pop(agent_id, None)
+        self.display.pop(agent_id, None)
+        self.hidden.discard(agent_id)
+        if text is None:
+            return
+        counts, length = term_counts(text)
+        for term in counts:
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            ids, weights = entry
+            i = ids.index(agent_id)
+            del ids[i]
+            del weights[i]
+            if not ids:
+                del self.postings[term]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+        self.total_length -= length
+        self.updated_at = time.time()
+
+    def rebuild(self, agents: Optional[List[Dict]] = None):
+        """
+        Rebuild every posting list in bulk (sorted once per term)
+
+        Args:
+            agents: New contents (default: re-weight the current contents
+                with the current average length)
+        """
+        if agents is not None:
+            self.texts = {a["id"]: agent_text(a) for a in agents if a.get("id") is not None}
+            self.display = {
+                a["id"]: json.dumps({k: a.get(k) for k in DISPLAY_FIELDS if a.get(k) is not None},
+                                    separators=(",", ":"))
+                for a in agents if a.get("id") is not None
+            }
+            self.hidden = {a["id"] for a in agents if a.get("id") is not None and not is_listed(a)}
+
+        documents = {agent_id: term_counts(text) for agent_id, text in self.texts.items()}
+        self.total_length = sum(length for _, length in documents.values())
+        self.avgdl = max(1.0, self.total_length / len(documents)) if documents else 0.0
+
+        collected: Dict[str, List[Tuple[float, int]]] = {}
+        for agent_id, (counts, length) in documents.items():
+            for term, tf in counts.items():
+                collected.setdefault(term, []).append((-self._weight(tf, length), agent_id))
+
+        self.postings = {}
+        for term, entries in collected.items():
+            entries.sort()
+            self.postings[term] = (array("I", (a for _, a in entries)), array("d", (w for w, _ in entries)))
+        self.vocabulary = sorted(self.postings)
+        self.updated_at = time.time()
+
+    def sync(self, agents: List[Dict]) -> Tuple[int, int]:
+        """
+        Bring the index in line with a directory snapshot
+
+        Only changed profiles are re-indexed. A bulk rebuild is done instead
+        when the index is empty, or when the average profile length has
+        drifted enough that stored weights should be recomputed.
+
+        Returns:
+            tuple: (agents re-indexed, agents removed)
+        """
+        agents = [a for a in agents if a.get("id") is not None]
+        seen = {a["id"] for a in agents}
+        changed = [a for a in agents if self.texts.get(a["id"]) != agent_text(a)]
+        stale = [agent_id for agent_id in self.texts if agent_id not in seen]
+
+        if not self.texts or len(changed) + len(stale) > len(agents) // 2:
+            self.rebuild(agents)
+            return len(changed), len(stale)
+
+        for agent_id in stale:
+            self.remove(agent_id)
+        for agent in agents:
+            self.add(agent)
+        if self.texts and abs(self.total_length / len(self.texts) - self.avgdl) > AVGDL_DRIFT * self.avgdl:
+            self.rebuild()
+        return len(changed), len(stale)
+
+
+def term_counts(text: str) -> Tuple[Dict[str, int], int]:
+    """Term frequencies (stopwords dropped) and length of a profile's text"""
+    counts: Dict[str, int] = {}
+    length = 0
+    for token in tokenize(text):
+        if token not in STOPWORDS:
+            counts[token] = counts.get(token, 0) + 1
+            length += 1
+    return counts, length
+
+
+def _has_phrases(text: str, phrases: List[List[str]]) -> bool:
+    padded = " " + " ".join(tokenize(text)) + " "
+    return all(" " + " ".join(tokens) + " " in padded for tokens in phrases)
+
+
+def _align(out: bytearray, size: int = 8):
+    out.extend(b"\0" * (-len(out) % size))
+
+
+def save_index(index: TextIndex, path: Optional[str] = None) -> str:
+    """
+    Write an index file (see MappedTextIndex for reading it)
+
+    Args:
+        index: Index to save
+        path: Index file (default: cache directory)
+
+    Returns:
+        str: Index path
+    """
+    path = path or default_index_path()
+    ids = array("I", sorted(index.texts))
+    texts = bytearray()
+    text_offsets = array("Q", [0])
+    displays = bytearray()
+    display_offsets = array("Q", [0])
+    hidden = array("I", sorted(index.hidden))
+    for agent_id in ids:
+        texts.extend(index.texts[agent_id].encode("utf-8"))
+        text_offsets.append(len(texts))
+        displays.extend(index.display.get(agent_id, "{}").encode("utf-8"))
+        display_offsets.append(len(displays))
+
+    # The vocabulary is in code point order, which is also UTF-8 byte order
+    dictionary = bytearray()
+    posting_ids = array("I")
+    posting_weights = array("d")
+    strings = bytearray()
+    for term in index.vocabulary:
+        term_bytes = term.encode("utf-8")
+        plist, weights = index.postings[term]
+        dictionary.extend(TERM_ENTRY.pack(len(term_bytes), len(strings), len(posting_ids), len(plist)))
+        strings.extend(term_bytes)
+        posting_ids.extend(plist)
+        posting_weights.extend(weights)
+
+    out = bytearray(HEADER.size)
+    offsets = []
+    for section in (ids.tobytes(), text_offsets.tobytes(), display_offsets.tobytes(), hidden.tobytes(),
+                    bytes(dictionary),
+                    posting_ids.tobytes(), posting_weights.tobytes(), bytes(strings), bytes(texts),
+                    bytes(displays)):
+        _align(out)
+        offsets.append(len(out))
+        out.extend(section)
+    HEADER.pack_into(out, 0, MAGIC, VERSION, len(ids), len(index.vocabulary), len(hidden), index.avgdl,
+                     index.updated_at, index.total_length, index.log_seq, *offsets)
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(out)
+    os.replace(tmp_path, path)
+    return path
+
+
+class MappedTextIndex(TextRanker):
+    """
+    Read-only view of an index file, for queries
+
+    Opening maps the file without reading it: a query binary-searches the
+    term dictionary for its terms, walks their posting lists in place and
+    decodes only the texts it scores and the display records it returns.
+
+    The file is never modified. Registrations and updates logged since it
+    was saved (see change_log.py) are applied on open: the changed agents'
+    texts and display records are kept in memory, and the posting lists of
+    the terms they had or now have are merged when first queried. Weights
+    of changed agents use the file's average length, as TextIndex.add does.
+    """
+
+    def __init__(self, path: Optional[str] = None, replay: bool = True):
+        self.path = path or default_index_path()
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < HEADER.size or struct.unpack_from("<4sH", self._mmap, 0) != (MAGIC, VERSION):
+            self._mmap.close()
+            raise ValueError(f"Not a compatible text index: {self.path}")
+        (_, _, self.n_agents, self.n_terms, n_hidden, self.avgdl, self.updated_at, self.total_length, self.log_seq,
+         ids_off, texts_off, displays_off, hidden_off, dict_off, posting_ids_off, weights_off, strings_off,
+         text_blob_off, display_blob_off) = HEADER.unpack_from(self._mmap, 0)
+        self.n_indexed = self.n_agents  # Agents in the file
+
+        view = memoryview(self._mmap)
+        self._ids = view[ids_off:ids_off + 4 * self.n_agents].cast("I")
+        self._text_offsets = view[texts_off:texts_off + 8 * (self.n_agents + 1)].cast("Q")
+        self._display_offsets = view[displays_off:displays_off + 8 * (self.n_agents + 1)].cast("Q")
+        self._hidden_ids = view[hidden_off:hidden_off + 4 * n_hidden].cast("I")
+        n_postings = (strings_off - weights_off) // 8
+        self._posting_ids = view[posting_ids_off:posting_ids_off + 4 * n_postings].cast("I")
+        self._posting_weights = view[weights_off:strings_off].cast("d")
+        self._dict_off = dict_off
+        self._strings_off = strings_off
+        self._text_blob_off = text_blob_off
+        self._display_blob_off = display_blob_off
+
+        # Changes from the change log
+        self._changed_texts: Dict[int, str] = {}
+        self._changed_displays: Dict[int, str] = {}
+        self._changed_hidden: Dict[int, bool] = {}
+        self._touched: Dict[str, set] = {}  # term -> changed agents that had or now have it
+        self._new_terms: List[str] = []  # Sorted terms not in the file
+        self._merged: Dict[str, Tuple[array, array]] = {}  # Merged posting lists of touched terms
+        if replay and os.path.abspath(self.path) == os.path.abspath(default_index_path()):
+            for change in change_log.read_changes(after=self.log_seq):
+                self.apply(change["agent"])
+                self.log_seq = change["seq"]
+
+    def close(self):
+        for name in ("_ids", "_text_offsets", "_display_offsets", "_hidden_ids", "_posting_ids",
+                     "_posting_weights"):
+            getattr(self, name).release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _entry(self, i: int) -> Tuple[bytes, int, int]:
+        length, str_off, post_off, post_len = TERM_ENTRY.unpack_from(
+            self._mmap, self._dict_off + i * TERM_ENTRY.size)
+        start = self._strings_off + str_off
+        return self._mmap[start:start + length], post_off, post_len
+
+    def _find(self, term_bytes: bytes) -> int:
+        """Dictionary position of the first term not below term_bytes (binary search)"""
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < term_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _stored(self, term: str) -> Optional[Tuple[memoryview, memoryview]]:
+        """Posting list of a term in the file"""
+        term_bytes = term.encode("utf-8")
+        i = self._find(term_bytes)
+        if i == self.n_terms:
+            return None
+        stored, post_off, post_len = self._entry(i)
+        if stored != term_bytes:
+            return None
+        return (self._posting_ids[post_off:post_off + post_len],
+                self._posting_weights[post_off:post_off + post_len])
+
+    def _postings(self, term: str) -> Optional[Tuple[Sequence[int], Sequence[float]]]:
+        touched = self._touched.get(term)
+        if touched is None:
+            return self._stored(term)
+        merged = self._merged.get(term)
+        if merged is None:
+            ids, weights = self._stored(term) or ((), ())
+            kept = [(w, agent_id) for agent_id, w in zip(ids, weights) if agent_id not in touched]
+            added = []
+            # Latest change first among equal weights, as TextIndex.add inserts them
+            for agent_id in reversed(self._changed_texts):
+                if agent_id not in touched:
+                    continue
+                counts, length = term_counts(self._changed_texts[agent_id])
+                if term in counts:
+                    added.append((-self._weight(counts[term], length), agent_id))
+            added.sort(key=lambda e: e[0])
+            entries = list(heapq.merge(added, kept, key=lambda e: e[0]))
+            merged = self._merged[term] = (array("I", (a for _, a in entries)),
+                                           array("d", (w for w, _ in entries)))
+        return merged if merged[0] else None
+
+    def _position(self, agent_id: int) -> Optional[int]:
+        pos = bisect.bisect_left(self._ids, agent_id)
+        if pos < self.n_indexed and self._ids[pos] == agent_id:
+            return pos
+        return None
+
+    def _blob(self, offsets: memoryview, blob_off: int, pos: int) -> bytes:
+        return self._mmap[blob_off + offsets[pos]:blob_off + offsets[pos + 1]]
+
+    def _text(self, agent_id: int) -> Optional[str]:
+        if agent_id in self._changed_texts:
+            return self._changed_texts[agent_id]
+        pos = self._position(agent_id)
+        if pos is None:
+            return None
+        return self._blob(self._text_offsets, self._text_blob_off, pos).decode("utf-8")
+
+    def _count(self) -> int:
+        return self.n_agents
+
+    def _hidden(self, agent_id: int) -> bool:
+        if agent_id in self._changed_hidden:
+            return self._changed_hidden[agent_id]
+        i = bisect.bisect_left(self._hidden_ids, agent_id)
+        return i < len(self._hidden_ids) and self._hidden_ids[i] == agent_id
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        prefix_bytes = prefix.encode("utf-8")
+        i = self._find(prefix_bytes)
+        stored = []
+        while i < self.n_terms and len(stored) < MAX_PREFIX_TERMS + len(self._changed_texts):
+            term_bytes = self._entry(i)[0]
+            if not term_bytes.startswith(prefix_bytes):
+                break
+            stored.append(term_bytes.decode("utf-8"))
+            i += 1
+        j = bisect.bisect_left(self._new_terms, prefix)
+        added = []
+        while j < len(self._new_terms) and self._new_terms[j].startswith(prefix):
+            added.append(self._new_terms[j])
+            j += 1
+
+        terms = []
+        for term in heapq.merge(stored, added):
+            if term in self._touched and not self._postings(term):
+                continue  # Only changed agents had it
+            terms.append(term)
+            if len(terms) == MAX_PREFIX_TERMS:
+                break
+        return terms
+
+    def profile(self, agent_id: int) -> Dict:
+        if agent_id in self._changed_displays:
+            return json.loads(self._changed_displays[agent_id])
+        pos = self._position(agent_id)
+        if pos is None:
+            return {}
+        return json.loads(self._blob(self._display_offsets, self._display_blob_off, pos))
+
+    def apply(self, agent: Dict):
+        """
+        Apply a created or updated profile in memory
+
+        Args:
+            agent: Agent data as returned by POST /agents or PUT /agents/{id}
+        """
+        agent_id = agent.get("id")
+        if agent_id is None:
+            return
+        text = agent_text(agent)
+        self._changed_displays[agent_id] = json.dumps(
+            {k: agent.get(k) for k in DISPLAY_FIELDS if agent.get(k) is not None}, separators=(",", ":"))
+        self._changed_hidden[agent_id] = not is_listed(agent)
+        old = self._text(agent_id)
+        if old == text:
+            return
+        if old is None:
+            self.n_agents += 1
+
+        before = term_counts(old)[0] if old is not None else {}
+        after, length = term_counts(text)
+        self.avgdl = self.avgdl or max(1.0, length)
+        for term in before.keys() | after.keys():
+            self._touched.setdefault(term, set()).add(agent_id)
+            self._merged.pop(term, None)
+            if term in after and self._stored(term) is None:
+                i = bisect.bisect_left(self._new_terms, term)
+                if i == len(self._new_terms) or self._new_terms[i] != term:
+                    self._new_terms.insert(i, term)
+        self._changed_texts.pop(agent_id, None)  # Kept in order of their last change
+        self._changed_texts[agent_id] = text
+
+
+def load_index(path: Optional[str] = None) -> TextIndex:
+    """Read a whole index file into memory to update it (the default one also gets the logged changes)"""
+    path = path or default_index_path()
+    index = TextIndex()
+    with MappedTextIndex(path, replay=False) as stored:
+        for i in range(stored.n_terms):
+            term_bytes, post_off, post_len = stored._entry(i)
+            ids, weights = array("I"), array("d")
+            ids.frombytes(stored._posting_ids[post_off:post_off + post_len].tobytes())
+            weights.frombytes(stored._posting_weights[post_off:post_off + post_len].tobytes())
+            index.postings[term_bytes.decode("utf-8")] = (ids, weights)
+        index.vocabulary = list(index.postings)
+        index.hidden = set(stored._hidden_ids)
+        for pos, agent_id in enumerate(stored._ids):
+            index.texts[agent_id] = stored._blob(stored._text_offsets, stored._text_blob_off, pos).decode("utf-8")
+            index.display[agent_id] = stored._blob(stored._display_offsets, stored._display_blob_off,
+                                                   pos).decode("utf-8")
+        index.total_length = stored.total_length
+        index.avgdl = stored.avgdl
+        index.updated_at = stored.updated_at
+        index.log_seq = stored.log_seq
+    if os.path.abspath(path) == os.path.abspath(default_index_path()):
+        for change in change_log.read_changes(after=index.log_seq):
+            index.add(change["agent"])
+            index.log_seq = change["seq"]
+    return index
+
+
+def text_search(query: str, limit: int = 10, path: Optional[str] = None) -> Dict:
+    """
+    Text-only search, returning results shaped like /matching/search
+
+    Args:
+        query: Query string (see TextIndex.search)
+        limit: Maximum number of results
+        path: Index file (default: cache directory)
+
+    Returns:
+        dict: {"matches", "total"}; match_score is BM25 relative to the best hit
+    """
+    with MappedTextIndex(path) as index:
+        hits = index.search(query, limit)
+        best = hits[0][0] if hits else 1.0
+        matches = [
+            dict(index.profile(agent_id), agent_id=agent_id,
+                 match_score=round(score / best, 4), score_details={"text_score": round(score, 4)})
+            for score, agent_id in hits
+        ]
+    return {"matches": matches, "total": len(matches)}
+
+
+def combine_with_text(results: Dict, query: str, limit: int, text_weight: float = 0.5,
+                      path: Optional[str] = None) -> Dict:
+    """
+    Keep facet search results that match a text query, re-scored by both
+
+    Args:
+        results: Facet search results (over-fetched)
+        query: Text query (see TextIndex.search)
+        limit: Maximum number of results
+        text_weight: Share of the final score from BM25 (relative to the best hit)
+        path: Index file (default: cache directory)
+
+    Returns:
+        dict: Results with only text matches, re-ranked
+    """
+    with MappedTextIndex(path) as index:
+        hits = index.score(query, [m.get("agent_id") for m in results.get("matches", [])])
+    best = max(hits.values(), default=1.0)
+
+    matches = []
+    for match in results.get("matches", []):
+        score = hits.get(match.get("agent_id"))
+        if score is None:
+            continue
+        details = dict(match.get("score_details") or {}, text_score=round(score, 4))
+        combined = (1 - text_weight) * match.get("match_score", 0) + text_weight * score / best
+        matches.append(dict(match, match_score=round(combined, 4), score_details=details))
+    matches.sort(key=lambda m: m["match_score"], reverse=True)
+
+    return dict(results, matches=matches[:limit], total=len(matches))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build and query the BM25 full-text index over bio and looking_for",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Build (or incrementally update) from the local snapshot
+  %(prog)s --build
+
+  # Query it directly
+  %(prog)s --query '"machine learning" research*'
+
+  # Combine with facet search
+  ./scripts/search_agents.py --requester-id 123 --skills Python --text '"open source"'
+        """
+    )
+
+    parser.add_argument("--build", action="store_true",
+                       help="Build the index, or update only changed profiles if it exists")
+    parser.add_argument("--rebuild", action="store_true",
+                       help="Build the index from scratch")
+    parser.add_argument("--snapshot", help="Snapshot file (default: cache directory)")
+    parser.add_argument("--index", help="Index file (default: cache directory)")
+    parser.add_argument("-q", "--query", help="Run a query")
+    parser.add_argument("--limit", type=int, default=10,
+                       help="Maximum number of results (default: 10)")
+
+    args = parser.parse_args()
+
+    try:
+        if args.build or args.rebuild:
+            start = time.perf_counter()
+            try:
+                index = TextIndex() if args.rebuild else load_index(args.index)
+            except (OSError, ValueError):
+                index = TextIndex()
+            snapshot = load_snapshot(args.snapshot)
+            changed, removed = index.sync(snapshot["agents"])
+            index.log_seq = max(index.log_seq, snapshot.get("log_seq", 0))
+            path = save_index(index, args.index)
+            print(f"✅ Text index: {len(index.texts)} agents, {len(index.postings)} terms "
+                  f"({changed} re-indexed, {removed} removed) in {time.perf_counter() - start:.2f}s: {path}")
+
+        if args.query:
+            start = time.perf_counter()
+            with MappedTextIndex(args.index) as index:
+                loaded = time.perf_counter()
+                hits = index.search(args.query, args.limit)
+                print(f"🔍 {len(hits)} results in {(time.perf_counter() - loaded) * 1000:.1f} ms "
+                      f"(index open {(loaded - start) * 1000:.1f} ms)")
+                for rank, (score, agent_id) in enumerate(hits, 1):
+                    info = index.profile(agent_id)
+                    print(f"  {rank}. [{agent_id}] {info.get('agent_name', 'Unknown')} ({score:.2f})")
+                    print(f"     {(info.get('bio') or '')[:80]}")
+
+        if not (args.build or args.rebuild or args.query):
+            parser.error("--build, --rebuild or --query is required")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Benchmark the HTTP/1.1 and HTTP/2 transports against a local stand-in API
+Latency percentiles and connections opened for many concurrent get_agent calls
+"""
+
+import os
+import ssl
+import sys
+import json
+import time
+import heapq
+import socket
+import resource
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict
+
+
+# Concurrent streams the stand-in allows per HTTP/2 connection (a common server default)
+MAX_CONCURRENT_STREAMS = 100
+
+
+def _agent(agent_id: int) -> bytes:
+    return json.dumps({
+        "id": agent_id, "agent_name": f"Agent {agent_id}", "bio": "Stand-in profile",
+        "skills": ["Python"], "tags": ["benchmark"], "interests": ["HTTP/2"],
+        "is_active": True, "is_public": True, "matching_enabled": True,
+    }).encode("utf-8")
+
+
+def _response_body(path: str) -> (int, bytes):
+    parts = path.split("?")[0].strip("/").split("/")
+    if len(parts) == 4 and parts[2] == "agents" and parts[3].isdigit():
+        return 200, _agent(int(parts[3]))
+    return 404, b'{"detail": "Not Found"}'
+
+
+class _HTTP1Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body are separate writes
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        status, body = _response_body(self.path)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer:
+    """
+    Local TLS server answering GET /api/v1/agents/{id} after a fixed delay
+
+    It offers h2 and http/1.1 by ALPN (or http/1.1 only) and counts the
+    connections clients open, per negotiated protocol. HTTP/2 streams of a
+    connection are answered concurrently, by one thread that also does all
+    of that connection's I/O.
+
+    A network round-trip time is simulated: a new connection waits two
+    (TCP and TLS 1.3 handshakes) and every response one more.
+    """
+
+    def __init__(self, delay: float = 0.02, http2: bool = True, rtt: float = 0.0):
+        import h2.connection  # noqa: F401 (fail early: the stand-in needs the h2 library)
+
+        self.rtt = rtt
+        self.delay = delay + rtt
+        self._dir = tempfile.TemporaryDirectory()
+        self.cert_path = os.path.join(self._dir.name, "cert.pem")
+        key_path = os.path.join(self._dir.name, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-keyout", key_path, "-out", self.cert_path, "-subj", "/CN=localhost",
+             "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+            check=True, capture_output=True
+        )
+        self._context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self._context.load_cert_chain(self.cert_path, key_path)
+        self._context.set_alpn_protocols(["h2", "http/1.1"] if http2 else ["http/1.1"])
+
+        self._sock = socket.create_server(("127.0.0.1", 0), backlog=1024)
+        self.url = f"https://localhost:{self._sock.getsockname()[1]}"
+        self._lock = threading.Lock()
+        self.reset()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def reset(self):
+        with self._lock:
+            self.connections: Dict[str, int] = {}
+            self.open_connections = 0
+            self.peak_connections = 0
+
+    def close(self):
+        self._sock.close()
+        self._dir.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        time.sleep(2 * self.rtt)
+        try:
+            tls = self._context.wrap_socket(conn, server_side=True)
+        except (OSError, ssl.SSLError):
+            conn.close()
+            return
+        protocol = tls.selected_alpn_protocol() or "http/1.1"
+        with self._lock:
+            self.connections[protocol] = self.connections.get(protocol, 0) + 1
+            self.open_connections += 1
+            self.peak_connections = max(self.peak_connections, self.open_connections)
+        try:
+            if protocol == "h2":
+                self._serve_h2(tls)
+            else:
+                _HTTP1Handler(tls, tls.getpeername(), self)
+        except (OSError, ssl.SSLError):
+            pass
+        finally:
+            with self._lock:
+                self.open_connections -= 1
+            tls.close()
+
+    def _serve_h2(self, tls: ssl.SSLSocket):
+        import h2.config
+        import h2.events
+        import h2.connection
+        import h2.settings
+
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        conn.update_settings({h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: MAX_CONCURRENT_STREAMS})
+        tls.sendall(conn.data_to_send())
+
+        due = []  # Heap of (time to answer, stream ID, path)
+        while True:
+            tls.settimeout(max(0.0005, due[0][0] - time.monotonic()) if due else None)
+            try:
+                data = tls.recv(65536)
+            except socket.timeout:
+                data = None
+            else:
+                if not data:
+                    return
+            if data:
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        path = dict(event.headers).get(b":path", b"/").decode()
+                        heapq.heappush(due, (time.monotonic() + self.delay, event.stream_id, path))
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+            while due and due[0][0] <= time.monotonic():
+                _, stream_id, path = heapq.heappop(due)
+                status, body = _response_body(path)
+                conn.send_headers(stream_id, [(":status", str(status)), ("content-type", "application/json"),
+                                              ("content-length", str(len(body)))])
+                conn.send_data(stream_id, body, end_stream=True)
+            out = conn.data_to_send()
+            if out:
+                tls.settimeout(None)
+                tls.sendall(out)
+
+
+def run_client(requests_count: int, concurrency: int) -> Dict:
+    """
+    Fetch agents concurrently through http_client (configured from the environment)
+
+    Returns:
+        dict: {"requests", "errors", "error_types", "seconds", "latencies_ms", "protocols"}
+    """
+    import http_client
+
+    def fetch(agent_id: int):
+        start = time.perf_counter()
+        try:
+            response = http_client.api_request("GET", f"/agents/{agent_id}", endpoint="GET /agents/{agent_id}")
+            response.raise_for_status()
+            return time.perf_counter() - start, getattr(response, "http_version", "HTTP/1.1")
+        except Exception as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(fetch, range(1, requests_count + 1)))
+    seconds = time.perf_counter() - start
+
+    protocols: Dict[str, int] = {}
+    errors: Dict[str, int] = {}
+    for latency, outcome in results:
+        counts = protocols if latency is not None else errors
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return {
+        "requests": requests_count,
+        "errors": sum(errors.values()),
+        "error_types": errors,
+        "seconds": seconds,
+        "latencies_ms": sorted(latency * 1000 for latency, _ in results if latency is not None),
+        "protocols": protocols,
+    }
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else None
+
+
+def benchmark(server: StandInServer, http2: bool, requests_count: int, concurrency: int) -> Dict:
+    """
+    One client run, in a fresh process configured as a user would (environment variables)
+
+    Returns:
+        dict: run_client() results plus the server's connection counts and
+            the client's CPU time
+    """
+    server.reset()
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = dict(os.environ,
+                   NEXTMARKET_API_URL=server.url, NEXTMARKET_API_URLS=server.url,
+                   NEXTMARKET_HTTP2="true" if http2 else "false",
+                   NEXTMARKET_HEDGE_READS="false", NEXTMARKET_CACHE_DIR=cache_dir,
+                   REQUESTS_CA_BUNDLE=server.cert_path, SSL_CERT_FILE=server.cert_path)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--client",
+             "--requests", str(requests_count), "--concurrency", str(concurrency)],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+    result = json.loads(output)
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result["client_cpu_seconds"] = (after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime)
+    with server._lock:
+        result["connections"] = dict(server.connections)
+        result["peak_connections"] = server.peak_connections
+    return result
+
+
+def print_results(rows: List[Dict], requests_count: int, concurrency: int, delay: float, rtt: float):
+    print(f"⏱️  {requests_count} GET /agents/{{id}} requests, {concurrency} concurrent, "
+          f"{delay * 1000:.0f} ms stand-in delay, {rtt * 1000:.0f} ms simulated RTT")
+    print(f"   {'Transport':<20} {'Protocol':<10} {'Conns':>6} {'Peak':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'CPU ms':>7} {'Errors':>7}")
+    for row in rows:
+        latencies = row["latencies_ms"]
+        protocol = ", ".join(sorted(row["protocols"])) or "-"
+        cells = [_percentile(latencies, p) for p in (50, 95, 99)]
+        print(f"   {row['label']:<20} {protocol:<10} {sum(row['connections'].values()):>6} "
+              f"{row['peak_connections']:>6} "
+              + " ".join(f"{c:>8.1f}" if c is not None else f"{'-':>8}" for c in cells)
+              + f" {row['requests'] / row['seconds']:>8.0f}"
+              + f" {row['client_cpu_seconds'] * 1000 / row['requests']:>7.2f} {row['errors']:>7}")
+    print("   Conns: connections opened; Peak: open at once; CPU ms: client CPU time per request")
+    for row in rows:
+        for error, count in row["error_types"].items():
+            print(f"   ⚠️  {row['label']}: {count} x {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the HTTP/1.1 and HTTP/2 transports against a local h2-capable stand-in API",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # 2000 get_agent calls, 200 in flight, with each transport
+  %(prog)s --requests 2000 --concurrency 200
+
+  # A distant API (100 ms round trips), JSON output
+  %(prog)s --rtt 0.1 --json
+
+Needs httpx[http2] (also used for the stand-in) and the openssl command.
+The third run points HTTP/2 at a server that only offers HTTP/1.1, to show
+the fallback.
+        """
+    )
+
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per run (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=100, help="Requests in flight (default: 100)")
+    parser.add_argument("--delay", type=float, default=0.02,
+                       help="Seconds the stand-in takes per response (default: 0.02)")
+    parser.add_argument("--rtt", type=float, default=0.03,
+                       help="Simulated network round-trip time in seconds (default: 0.03)")
+    parser.add_argument("--json", action="store_true", help="Output raw JSON")
+    parser.add_argument("--client", action="store_true", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.client:
+        print(json.dumps(run_client(args.requests, args.concurrency)))
+        return
+
+    try:
+        rows = []
+        with StandInServer(args.delay, rtt=args.rtt) as server:
+            rows.append(dict(benchmark(server, False, args.requests, args.concurrency), label="HTTP/1.1"))
+            rows.append(dict(benchmark(server, True, args.requests, args.concurrency), label="HTTP/2"))
+        with StandInServer(args.delay, http2=False, rtt=args.rtt) as server:
+            rows.append(dict(benchmark(server, True, args.requests, args.concurrency),
+                             label="HTTP/2 (h1 server)"))
+
+        if args.json:
+            print(json.dumps([
+                {k: v for k, v in row.items() if k != "latencies_ms"}
+                | {f"p{p}_ms": _percentile(row["latencies_ms"], p) for p in (50, 95, 99)}
+                for row in rows
+            ], indent=2))
+        else:
+            print_results(rows, args.requests, args.concurrency, args.delay, args.rtt)
+
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Error: {e.stderr.strip() or e}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,20 +10,30 @@ import argparse
 import requests
 from typing import Optional, List
 
-# Import API configuration
-from config import BASE_URL
-
-
-def update_agent(agent_id: int, **updates) -> dict:
+# Import API client
+import http_client
+from config import UPDATE_QUEUE
+from deadline import Deadline
+from suggest import suggest_additions
+from payload_schema import validate_payload
+import profile_cache
+import change_log
+
+
+def update_agent(agent_id: int, deadline: Optional[Deadline] = None, queue: Optional[bool] = None,
+                 **updates) -> dict:
     """
     Update agent profile
 
     Args:
         agent_id: Agent ID to update
+        deadline: Overall time budget
+        queue: Journal the update and apply it in the background, merged with
+            other edits to the same agent (default: NEXTMARKET_UPDATE_QUEUE)
         **updates: Fields to update (any optional field from agent schema)
 
     Returns:
-        dict: Updated agent data
+        dict: Updated agent data, or when queued, {"id", "queued", "queued_updates"}
     """
 
     # Remove None values
@@ -32,15 +42,34 @@ def update_agent(agent_id: int, **updates) -> dict:
     if not payload:
         raise ValueError("No updates provided")
 
+    queue = UPDATE_QUEUE if queue is None else queue
+
+    # Checked before queueing too: a bad edit is reported now, not by the flusher
+    # (against the cached spec only, so queueing never waits on the API)
+    validate_payload("PUT /agents/{agent_id}", payload, deadline, offline=queue)
+
+    if queue:
+        from update_queue import UpdateQueue, start_flusher
+        UpdateQueue().enqueue(agent_id, payload)
+        profile_cache.invalidate(agent_id)
+        start_flusher()
+        return {"id": agent_id, "queued": True, "queued_updates": payload}
+
     # Make API request
     try:
-        response = requests.put(
-            f"{BASE_URL}/agents/{agent_id}",
+        response = http_client.api_request(
+            "PUT",
+            f"/agents/{agent_id}",
+            endpoint="PUT /agents/{agent_id}",
+            deadline=deadline,
             json=payload,
             headers={"Content-Type": "application/json"}
         )
         response.raise_for_status()
-        return response.json()
+        agent = response.json()
+        profile_cache.put(agent)
+        change_log.record_change(agent)
+        return agent
 
     except requests.exceptions.RequestException as e:
         print(f"❌ API Error: {e}", file=sys.stderr)
@@ -76,6 +105,12 @@ Examples:
   # Make profile public
   %(prog)s --agent-id 123 --is-public true
 
+  # Suggest skills, interests and tags to add (see suggest.py --build)
+  %(prog)s --agent-id 123 --suggest
+
+  # Return at once; the update is applied in the background (see update_queue.py)
+  %(prog)s --agent-id 123 --is-active true --queue
+
   # Update multiple fields
   %(prog)s --agent-id 123 \\
     --bio "Senior Software Engineer" \\
@@ -106,6 +141,10 @@ Examples:
                        help="Set public visibility (true/false)")
     parser.add_argument("--matching-enabled", type=str_to_bool,
                        help="Enable/disable matching (true/false)")
+    parser.add_argument("--queue", action="store_true", default=None,
+                       help="Queue the update and apply it in the background (merged with other queued edits)")
+    parser.add_argument("--suggest", action="store_true",
+                       help="Suggest skills, interests and tags that often go with this profile's")
 
     args = parser.parse_args()
 
@@ -143,17 +182,41 @@ Examples:
     if args.matching_enabled is not None:
         updates['matching_enabled'] = args.matching_enabled
 
-    if not updates:
+    if not updates and not args.suggest:
         parser.error("At least one field to update is required")
 
     # Update
     try:
-        result = update_agent(args.agent_id, **updates)
-
-        print("=" * 60)
-        print("✅ Agent Updated Successfully!")
-        print("=" * 60)
-        print(json.dumps(result, indent=2))
+        if updates:
+            result = update_agent(args.agent_id, queue=args.queue, **updates)
+
+            if result.get("queued"):
+                print("📬 Update queued; it will be applied in the background "
+                      "(./scripts/update_queue.py --status)")
+                # Suggest from the queued fields alone: the API may be unavailable
+                result = result["queued_updates"]
+            else:
+                print("=" * 60)
+                print("✅ Agent Updated Successfully!")
+                print("=" * 60)
+                print(json.dumps(result, indent=2))
+        else:
+            from get_agent import get_agent
+            result = get_agent(args.agent_id)
+
+        if args.suggest:
+            suggestions = suggest_additions(result)
+            print()
+            if not suggestions:
+                print("💡 No suggestions (build the model with ./scripts/suggest.py --build)")
+            else:
+                print("💡 Agents with similar profiles also list:")
+                for field, terms in suggestions.items():
+                    print(f"  {field.capitalize()}: {', '.join(terms)}")
+                field, terms = next(iter(suggestions.items()))
+                current = ",".join(result.get(field) or [])
+                print(f"\n  To add them: ./scripts/update_agent.py --agent-id {args.agent_id} "
+                      f"--{field} \"{current + ',' if current else ''}{terms[0]}\"")
 
     except Exception as e:
         print(f"❌ Error: {e}", file=sys.stderr)
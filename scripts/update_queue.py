@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Write-behind queue for NextMarket profile updates
+Journals updates on disk, merges bursts per agent and applies them in the background
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import fcntl
+import argparse
+import subprocess
+import contextlib
+import requests
+from typing import Optional, List, Dict
+
+# Import API configuration
+from config import get_cache_dir, COALESCE_SECONDS
+from deadline import Deadline
+from payload_schema import PayloadValidationError
+
+
+JOURNAL_FILE = "update_queue.jsonl"
+LOCK_FILE = "update_queue.lock"
+FLUSHER_LOCK_FILE = "update_queue.flusher.lock"
+FAILED_FILE = "update_queue.failed.jsonl"
+LOG_FILE = "update_queue.log"
+
+# An agent that keeps editing is still flushed once its oldest edit is this many windows old
+MAX_COALESCE_WINDOWS = 6
+
+# Retry backoff after a failed update (seconds, doubling per attempt)
+RETRY_BASE_SECONDS = 2
+RETRY_MAX_SECONDS = 300
+
+# A background flusher exits after the queue has been empty this long
+IDLE_EXIT_SECONDS = 30
+
+# Rewrite the journal once this many applied entries have accumulated
+COMPACT_AFTER = 1000
+
+
+def _is_permanent(error: Exception) -> bool:
+    """Client errors (other than timeouts and rate limits) will not succeed on retry"""
+    response = getattr(error, "response", None)
+    return response is not None and 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+
+
+class UpdateQueue:
+    """
+    Durable journal of pending profile updates
+
+    Each update is appended (and fsynced) as one JSON line; applying it
+    appends an "ack" line. Unacknowledged entries survive crashes and API
+    outages and are merged per agent, later fields winning, into a single
+    PUT. All journal access is under an exclusive file lock, so any number
+    of processes can enqueue while one flusher applies.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        directory = directory or get_cache_dir()
+        self.path = os.path.join(directory, JOURNAL_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self.failed_path = os.path.join(directory, FAILED_FILE)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _append(self, records: List[Dict]):
+        with open(self.path, "a") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read(self):
+        """(unacknowledged entries in order, number of acknowledged entries)"""
+        entries = {}
+        acked = 0
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn write from a crash mid-append
+                    if "ack" in record:
+                        for entry_id in record["ack"]:
+                            if entries.pop(entry_id, None) is not None:
+                                acked += 1
+                    else:
+                        entries[record["id"]] = record
+        except FileNotFoundError:
+            pass
+        return list(entries.values()), acked
+
+    def enqueue(self, agent_id: int, updates: Dict) -> str:
+        """
+        Journal an update and return at once
+
+        Returns:
+            str: Entry ID
+        """
+        entry = {"id": uuid.uuid4().hex, "agent_id": agent_id, "updates": updates, "queued_at": time.time()}
+        with self._locked():
+            self._append([entry])
+        return entry["id"]
+
+    def pending(self) -> Dict[int, Dict]:
+        """
+        Pending updates merged per agent
+
+        Returns:
+            dict: agent_id -> {"updates", "ids", "first_queued_at", "last_queued_at"}
+        """
+        with self._locked():
+            entries, _ = self._read()
+        merged: Dict[int, Dict] = {}
+        for entry in entries:
+            agent = merged.setdefault(entry["agent_id"], {
+                "updates": {}, "ids": [], "first_queued_at": entry["queued_at"]
+            })
+            agent["updates"].update(entry["updates"])
+            agent["ids"].append(entry["id"])
+            agent["last_queued_at"] = entry["queued_at"]
+        return merged
+
+    def ack(self, ids: List[str], error: Optional[str] = None, agent: Optional[Dict] = None):
+        """
+        Mark entries as done; with an error, the merged update is kept in the failed log
+
+        Args:
+            ids: Entry IDs
+            error: Permanent failure reason
+            agent: The merged update that failed
+        """
+        with self._locked():
+            if error:
+                with open(self.failed_path, "a") as f:
+                    f.write(json.dumps(dict(agent or {}, error=error, failed_at=time.time())) + "\n")
+            self._append([{"ack": ids}])
+            entries, acked = self._read()
+            if acked >= COMPACT_AFTER or not entries:
+                tmp_path = f"{self.path}.tmp.{os.getpid()}"
+                with open(tmp_path, "w") as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+
+
+def flush(
+    queue: Optional[UpdateQueue] = None,
+    coalesce_seconds: float = COALESCE_SECONDS,
+    force: bool = False,
+    retry_at: Optional[Dict[int, float]] = None,
+    attempts: Optional[Dict[int, int]] = None,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, List[int]]:
+    """
+    Send one merged PUT per agent whose edits have settled
+
+    An agent is ready once it has had no new edit for coalesce_seconds (or
+    its oldest edit is MAX_COALESCE_WINDOWS windows old).
+
+    Args:
+        queue: Queue (default: cache directory)
+        coalesce_seconds: Quiet period before an agent's updates are sent
+        force: Send everything now
+        retry_at: Agent -> time before which not to retry (updated in place)
+        attempts: Agent -> consecutive failures (updated in place)
+        deadline: Overall time budget
+
+    Returns:
+        dict: {"applied", "retrying", "failed", "waiting"} agent IDs
+    """
+    from update_agent import update_agent
+
+    queue = queue or UpdateQueue()
+    retry_at = {} if retry_at is None else retry_at
+    attempts = {} if attempts is None else attempts
+    result = {"applied": [], "retrying": [], "failed": [], "waiting": []}
+    now = time.time()
+
+    for agent_id, agent in queue.pending().items():
+        settled = (now - agent["last_queued_at"] >= coalesce_seconds
+                   or now - agent["first_queued_at"] >= coalesce_seconds * MAX_COALESCE_WINDOWS)
+        if not force and (not settled or retry_at.get(agent_id, 0) > now):
+            result["waiting"].append(agent_id)
+            continue
+        try:
+            update_agent(agent_id, deadline=deadline, queue=False, **agent["updates"])
+        except PayloadValidationError as e:
+            # Merged edits (or a newer spec) the API would reject: retrying cannot help
+            queue.ack(agent["ids"], error=str(e), agent={"agent_id": agent_id, **agent})
+            result["failed"].append(agent_id)
+            continue
+        except requests.exceptions.RequestException as e:
+            if _is_permanent(e):
+                queue.ack(agent["ids"], error=str(e), agent={"agent_id": agent_id, **agent})
+                result["failed"].append(agent_id)
+            else:
+                attempts[agent_id] = attempts.get(agent_id, 0) + 1
+                retry_at[agent_id] = time.time() + min(
+                    RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts[agent_id] - 1))
+                result["retrying"].append(agent_id)
+            continue
+        queue.ack(agent["ids"])
+        attempts.pop(agent_id, None)
+        retry_at.pop(agent_id, None)
+        result["applied"].append(agent_id)
+
+    return result
+
+
+def drain(queue: Optional[UpdateQueue] = None, coalesce_seconds: float = COALESCE_SECONDS,
+          idle_exit: float = IDLE_EXIT_SECONDS):
+    """
+    Flush until the queue has stayed empty for idle_exit seconds
+
+    Only one drainer runs per cache directory; others return at once.
+    """
+    queue = queue or UpdateQueue()
+    with open(os.path.join(get_cache_dir(), FLUSHER_LOCK_FILE), "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+
+        retry_at: Dict[int, float] = {}
+        attempts: Dict[int, int] = {}
+        idle_since = time.time()
+        while True:
+            result = flush(queue, coalesce_seconds, retry_at=retry_at, attempts=attempts)
+            for status in ("applied", "retrying", "failed"):
+                if result[status]:
+                    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {status}: {result[status]}", flush=True)
+            if any(result.values()):
+                idle_since = time.time()
+            elif time.time() - idle_since >= idle_exit:
+                return
+            time.sleep(min(1.0, max(0.1, coalesce_seconds / 5)))
+
+
+def start_flusher():
+    """Start a detached background drainer (a no-op if one is already running)"""
+    log = open(os.path.join(get_cache_dir(), LOG_FILE), "a")
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--drain"],
+        stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+        start_new_session=True
+    )
+    log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect and flush the write-behind update queue",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Queue updates instead of waiting for the API
+  ./scripts/update_agent.py --agent-id 123 --skills "Python,Go" --queue
+
+  # What is still pending
+  %(prog)s --status
+
+  # Apply everything now, in the foreground
+  %(prog)s --flush
+        """
+    )
+
+    parser.add_argument("--status", action="store_true", help="Show pending updates")
+    parser.add_argument("--flush", action="store_true", help="Apply all pending updates now")
+    parser.add_argument("--drain", action="store_true",
+                       help="Apply updates as they settle until the queue stays empty (background flusher)")
+
+    args = parser.parse_args()
+
+    if not (args.status or args.flush or args.drain):
+        parser.error("--status, --flush or --drain is required")
+
+    try:
+        queue = UpdateQueue()
+
+        if args.drain:
+            drain(queue)
+            return
+
+        if args.flush:
+            # Same lock as the background drainer, so an update is never sent twice
+            with open(os.path.join(get_cache_dir(), FLUSHER_LOCK_FILE), "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    print("⏳ Waiting for the background flusher to finish...")
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                result = flush(queue, force=True)
+            print(f"✅ Applied: {len(result['applied'])} agents")
+            if result["retrying"]:
+                print(f"⚠️  Still pending (API unavailable): {result['retrying']}")
+            if result["failed"]:
+                print(f"❌ Rejected by the API: {result['failed']} (see {queue.failed_path})")
+
+        if args.status:
+            pending = queue.pending()
+            print(f"📬 {len(pending)} agents with pending updates")
+            for agent_id, agent in pending.items():
+                age = time.time() - agent["first_queued_at"]
+                print(f"  [{agent_id}] {len(agent['ids'])} edits, oldest {age:.0f}s ago: "
+                      f"{json.dumps(agent['updates'])}")
+
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()